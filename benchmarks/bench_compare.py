@@ -0,0 +1,94 @@
+"""
+Benchmark of the lattice position comparison.
+
+Usage:
+    python benchmarks/bench_compare.py [elements]
+
+A synthetic lattice and a changed copy are written to seq files. In the
+copy 10% of the elements are shifted by 1e-12 m, 0.1% moved by 1 cm,
+0.1% removed and 0.1% added. The files are compared
+
+- with compare_seq_center_positions (sequential parse, exact position
+  merge), and
+- with compare_lattices (concurrent parse, matching within 1 um),
+
+and compare_lattices is timed on the parsed tables alone.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.CacheUtils import set_parse_cache
+from latticeadaptors.Utils.LatticeUtils import compare_lattices, compare_seq_center_positions
+
+from lattice_gen import make_sequence_string
+
+
+def changed_copy(string: str, seed: int = 0) -> str:
+    """Return the lattice with shifted, moved, removed and added elements."""
+    name, length, df = parse_from_madx_sequence_string(string, cache=False)
+    rng = np.random.default_rng(seed)
+    n = len(df)
+    names = df["name"].to_numpy(dtype=object)
+    pos = df["pos"].to_numpy(dtype=float).copy()
+
+    pos[rng.random(n) < 0.1] += 1e-12
+    pos[rng.random(n) < 0.001] += 0.01
+    keep = rng.random(n) >= 0.001
+    added = rng.integers(0, n, max(n // 1000, 1))
+    names = np.concatenate([names[keep], names[added]])
+    pos = np.concatenate([pos[keep], rng.uniform(0, length, len(added))])
+    order = np.argsort(pos, kind="stable")
+
+    definitions = string[: string.lower().index("{}: sequence".format(name.lower()))]
+    positions = ["{}, at = {!r};\n".format(*row) for row in zip(names[order], pos[order])]
+    return "".join(
+        [definitions, "{}: sequence, l = {!r};\n".format(name, length)]
+        + positions
+        + ["endsequence;\n"]
+    )
+
+
+def main(n: int):
+    set_parse_cache(None)
+    string = make_sequence_string(n)
+    with tempfile.TemporaryDirectory() as directory:
+        file1 = os.path.join(directory, "a.seq")
+        file2 = os.path.join(directory, "b.seq")
+        with open(file1, "w") as f:
+            f.write(string)
+        with open(file2, "w") as f:
+            f.write(changed_copy(string))
+
+        t0 = time.perf_counter()
+        eq, diff = compare_seq_center_positions(file1, file2)
+        print(
+            "{:>32}: {:8.2f} s, {} equal, {} different".format(
+                "compare_seq_center_positions", time.perf_counter() - t0, len(eq), len(diff)
+            )
+        )
+
+        t0 = time.perf_counter()
+        result = compare_lattices(file1, file2, cache=False)
+        print(
+            "{:>32}: {:8.2f} s, {}".format(
+                "compare_lattices",
+                time.perf_counter() - t0,
+                ", ".join("{} {}".format(len(table), key) for key, table in result.items()),
+            )
+        )
+
+        df1 = parse_from_madx_sequence_string(string, cache=False)[2]
+        with open(file2) as f:
+            df2 = parse_from_madx_sequence_string(f.read(), cache=False)[2]
+        t0 = time.perf_counter()
+        compare_lattices(df1, df2)
+        print("{:>32}: {:8.2f} s".format("compare_lattices, tables", time.perf_counter() - t0))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
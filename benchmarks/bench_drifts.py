@@ -0,0 +1,92 @@
+"""
+Benchmark of LatticeAdaptor.add_drifts on synthetic lattices.
+
+Usage:
+    python benchmarks/bench_drifts.py [n1,n2,...]
+
+The vectorized implementation is timed against the row by row loop it
+replaced and the drifts between the elements are checked to be
+identical (the closing drift of the loop had a wrong length and name).
+"""
+
+import gc
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from lattice_gen import make_sequence_string
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.LatticeUtils import add_drifts_to_table
+
+
+# row by row implementation add_drifts_to_table replaced
+def legacy_add_drifts(table, length):
+    df = table.copy()
+    df.reset_index(inplace=True, drop=True)
+    name = "D"
+    family = "DRIFT"
+
+    df.loc[df.L.isna(), "L"] = 0
+    newrows = []
+    ndrift = 0
+    for i, row in df.iterrows():
+        newrows.append(pd.DataFrame(row).T)
+        if i < len(df) - 1:
+            nextrow = df.loc[i + 1]
+            if nextrow["pos"] > row.pos:
+                ndrift += 1
+                newrow = {}
+                newrow["name"] = name + str(ndrift)
+                newrow["family"] = family
+                newrow["L"] = np.round(
+                    (nextrow["pos"] - nextrow["L"] / 2.0) - (row["pos"] + row["L"] / 2.0), 6
+                )
+                newrow["pos"] = (row["pos"] + row["L"] / 2.0) + (newrow["L"] / 2.0)
+                newrows.append(pd.Series(newrow).to_frame().T)
+    if nextrow["pos"] < length:
+        newrow = {}
+        newrow["name"] = name + str(ndrift)
+        newrow["family"] = family
+        newrow["L"] = np.round(length - nextrow["pos"], 6)
+        newrow["pos"] = (row["pos"] + row["L"] / 2.0) + (newrow["L"] / 2.0)
+        newrows.append(pd.Series(newrow).to_frame().T)
+
+    return (pd.concat(newrows)).reset_index(drop=True)
+
+
+def measure(function, *args):
+    gc.collect()
+    t0 = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - t0
+
+
+def main(sizes):
+    print(
+        "{:>9} {:>14} {:>14} {:>9}".format("elements", "reference [s]", "candidate [s]", "speedup")
+    )
+    for n in sizes:
+        _, length, df = parse_from_madx_sequence_string(make_sequence_string(n), cache=False)
+        # end the lattice with a gap so both add a closing drift
+        length += 1.0
+
+        result, t_candidate = measure(add_drifts_to_table, df, length)
+        expected, t_reference = measure(legacy_add_drifts, df, length)
+
+        columns = ["name", "family", "L", "pos"]
+        pd.testing.assert_frame_equal(
+            result[columns].iloc[:-1].astype(object),
+            expected[columns].iloc[:-1].astype(object),
+            check_exact=False,
+        )
+        print(
+            "{:9d} {:14.3f} {:14.3f} {:9.1f}".format(
+                n, t_reference, t_candidate, t_reference / t_candidate
+            )
+        )
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000").split(",")]
+    main(sizes)
@@ -0,0 +1,65 @@
+"""
+Startup benchmark: import time of the package and time to the first parse.
+
+"before" builds the LALR parser from the grammar like the package used to do
+at import time, "after" imports lazily and loads the serialized parser tables
+from the cache on first use.
+
+Usage:
+    python benchmarks/bench_import.py [repeats]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import latticeadaptors
+from latticeadaptors.parsers import madx_seq_parser
+t1 = time.perf_counter()
+if sys.argv[1] == "before":
+    from lark import Lark
+    Lark(madx_seq_parser.GRAMMAR, parser="lalr", maybe_placeholders=True)
+t2 = time.perf_counter()
+madx_seq_parser.parse_from_madx_sequence_string("M: MARKER;", cache=False)
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "eager_build": t2 - t1, "first_parse": t3 - t2}))
+"""
+
+
+def run(mode, cache_dir):
+    env = dict(os.environ, LATTICEADAPTORS_CACHE_DIR=cache_dir)
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, mode], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(repeats=5):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # the first run populates the parser table cache
+        cold = run("after", cache_dir)
+        results = {"before": [], "after": []}
+        for _ in range(repeats):
+            for mode in results:
+                results[mode].append(run(mode, cache_dir))
+
+    def best(mode, key):
+        return min(r[key] for r in results[mode])
+
+    print("{:28} {:>10}".format("stage", "time [ms]"))
+    for mode in ("before", "after"):
+        total = min(sum(r.values()) for r in results[mode])
+        print("{:28} {:10.1f}".format(mode + ": import", 1e3 * best(mode, "import")))
+        print("{:28} {:10.1f}".format(mode + ": parser build", 1e3 * best(mode, "eager_build")))
+        print("{:28} {:10.1f}".format(mode + ": first parse", 1e3 * best(mode, "first_parse")))
+        print("{:28} {:10.1f}".format(mode + ": total", 1e3 * total))
+    print("{:28} {:10.1f}".format("after: first parse (cold)", 1e3 * cold["first_parse"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,94 @@
+"""
+Benchmark of batch optics runs with the warm MAD-X worker pool.
+
+Usage:
+    python benchmarks/bench_madx_pool.py [variants] [cells] [workers]
+
+A scan of quadrupole strength variants of a FODO ring is run
+
+- the way it is done without the pool: a fresh MAD-X per variant that
+  reads the full sequence, USE and TWISS (timed on a subset of the
+  variants, the throughput is extrapolated), and
+- with MadxPool, sending only the strength deltas to warm workers.
+"""
+
+import sys
+import time
+
+import numpy as np
+from cpymad.madx import Madx
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.Utils.MadxUtils import TWISS_COLUMNS
+
+
+def make_fodo_ring(cells: int) -> str:
+    """Return a stable FODO ring with 10 m cells as madx sequence string."""
+    definitions = []
+    positions = []
+    for i in range(cells):
+        definitions.append("QF{0}: QUADRUPOLE, L:=0.5, K1:=0.5;\n".format(i))
+        definitions.append("QD{0}: QUADRUPOLE, L:=0.5, K1:=-0.5;\n".format(i))
+        positions.append("QF{}, at = {};\n".format(i, 10.0 * i + 0.25))
+        positions.append("QD{}, at = {};\n".format(i, 10.0 * i + 5.25))
+    return "".join(
+        definitions
+        + ["RING: SEQUENCE, L={};\n".format(10.0 * cells)]
+        + positions
+        + ["ENDSEQUENCE;\n"]
+    )
+
+
+def variants(lattice, n: int) -> list:
+    rng = np.random.default_rng(0)
+    base = lattice.get_quad_strengths()
+    return [
+        {"strengths": {"K1": {name: k * (1 + 0.01 * e) for name, k in base.items()}}}
+        for e in rng.uniform(-1, 1, n)
+    ]
+
+
+def fresh_process(lattice, variant):
+    """One variant without the pool: full sequence in a new MAD-X process."""
+    lattice.load_strengths_to_table(variant["strengths"]["K1"], "K1")
+    madx = Madx(stdout=False)
+    try:
+        madx.input(lattice.parse_table_to_madx_sequence_string())
+        madx.input("BEAM;")
+        madx.use(sequence=lattice.name)
+        table = madx.twiss(sequence=lattice.name)
+        return {column: table[column] for column in TWISS_COLUMNS}
+    finally:
+        madx.quit()
+
+
+def main(n: int, cells: int, workers: int):
+    lattice = LatticeAdaptor(history_depth=1)
+    lattice.load_from_madx_sequence_string(make_fodo_ring(cells))
+    scan = variants(lattice, n)
+    print("{} variants, {} elements, {} workers".format(n, len(lattice.table), workers))
+
+    subset = scan[: max(1, min(n, 20))]
+    t0 = time.perf_counter()
+    for variant in subset:
+        fresh_process(lattice, variant)
+    reference = len(subset) / (time.perf_counter() - t0)
+    print("{:>24}: {:9.1f} variants/s".format("fresh process", reference))
+
+    for w in sorted({1, workers}):
+        t0 = time.perf_counter()
+        with lattice.madx_pool(workers=w) as pool:
+            startup = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            tables = pool.map(scan)
+            elapsed = time.perf_counter() - t0
+        assert len(tables) == n
+        print(
+            "{:>24}: {:9.1f} variants/s (startup {:.2f} s, {:.1f}x)".format(
+                "pool, {} worker(s)".format(w), n / elapsed, startup, n / elapsed / reference
+            )
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] + [None] * 3
+    main(int(args[0] or 1000), int(args[1] or 100), int(args[2] or 2))
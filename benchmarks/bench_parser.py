@@ -0,0 +1,62 @@
+"""
+Benchmark of the madx sequence parser engines on synthetic SAVE output.
+
+Usage:
+    python benchmarks/bench_parser.py [n1,n2,...] [engine1,engine2,...]
+
+engines: tree (parse tree + transformer), inline (transformer run by the
+LALR parser), fast (regex fast path with grammar fallback)
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from lattice_gen import make_sequence_string
+from latticeadaptors.parsers.madx_seq_parser import _parse_from_madx_sequence_string
+
+
+def measure(string, engine):
+    gc.collect()
+    t0 = time.perf_counter()
+    result = _parse_from_madx_sequence_string(string, engine)
+    elapsed = time.perf_counter() - t0
+    del result
+
+    # separate run for the memory, tracing slows down the parsing
+    gc.collect()
+    tracemalloc.start()
+    result = _parse_from_madx_sequence_string(string, engine)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(sizes, engines):
+    print(
+        "{:>9} {:>8} {:>10} {:>12} {:>9}".format(
+            "elements", "engine", "time [s]", "peak [MB]", "speedup"
+        )
+    )
+    for n in sizes:
+        string = make_sequence_string(n)
+        reference = None
+        for engine in engines:
+            result, elapsed, peak = measure(string, engine)
+            if reference is None:
+                reference = (result, elapsed)
+            else:
+                assert result[:2] == reference[0][:2]
+                assert result[2].equals(reference[0][2])
+            print(
+                "{:9d} {:>8} {:10.3f} {:12.1f} {:9.1f}".format(
+                    n, engine, elapsed, peak / 1024**2, reference[1] / elapsed
+                )
+            )
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000").split(",")]
+    engines = (sys.argv[2] if len(sys.argv) > 2 else "tree,fast").split(",")
+    main(sizes, engines)
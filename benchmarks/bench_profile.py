@@ -0,0 +1,83 @@
+"""
+Benchmark of the stage profiling overhead.
+
+Usage:
+    python benchmarks/bench_profile.py [elements] [repeats]
+
+A synthetic lattice is parsed (without the parse cache) and written to
+the three export formats with profiling disabled, enabled and enabled
+with memory tracing. The cost of a disabled stage is timed on its own,
+followed by the report of the profiled run and its JSON export.
+"""
+
+import sys
+import time
+import timeit
+
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.parsers.TableParsers import (
+    parse_table_to_elegant_string,
+    parse_table_to_madx_sequence_string,
+    parse_table_to_tracy_string,
+)
+from latticeadaptors.Utils.ProfileUtils import profiling, stage
+
+from lattice_gen import make_sequence_string
+
+
+def convert(string):
+    name, length, df = parse_from_madx_sequence_string(string, cache=False)
+    parse_table_to_madx_sequence_string(name, length, df)
+    parse_table_to_elegant_string(name, df)
+    parse_table_to_tracy_string(name, df)
+
+
+def best(func, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(n, repeats):
+    string = make_sequence_string(n)
+    convert(string)
+
+    def disabled_stage():
+        with stage("bench"):
+            pass
+
+    number = 1_000_000
+    per_stage = timeit.timeit(disabled_stage, number=number) / number
+    print("disabled stage: {:.0f} ns per call".format(1e9 * per_stage))
+
+    disabled = best(lambda: convert(string), repeats)
+    print("{:>16}: {:8.3f} s".format("disabled", disabled))
+
+    for label, memory in (("enabled", False), ("enabled, memory", True)):
+
+        def profiled():
+            with profiling(memory=memory) as profile:
+                convert(string)
+            return profile
+
+        elapsed = best(profiled, repeats)
+        print("{:>16}: {:8.3f} s ({:+.1f}%)".format(label, elapsed, 100 * (elapsed / disabled - 1)))
+
+    with profiling(memory=True) as profile:
+        convert(string)
+    calls = sum(stats["calls"] for stats in profile.to_dict()["stages"].values())
+    print(
+        "{} stages per conversion, disabled cost {:.1f} us".format(calls, 1e6 * calls * per_stage)
+    )
+    print()
+    print(profile.report())
+    print()
+    print(profile.to_json(indent=2))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] + [None] * 2
+    main(int(args[0] or 100_000), int(args[1] or 3))
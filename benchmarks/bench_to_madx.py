@@ -0,0 +1,60 @@
+"""
+Benchmark of loading a lattice table into MAD-X.
+
+Usage:
+    python benchmarks/bench_to_madx.py [elements ...]
+
+The table is loaded into a fresh MAD-X
+
+- through the sequence file text (parse_table_to_madx_sequence_string
+  sent as a single input), and
+- with LatticeAdaptor.to_madx (batched definitions per family and exact
+  numbers).
+
+The load time and the largest difference between the element positions
+in MAD-X and in the table are reported.
+"""
+
+import sys
+import time
+
+import numpy as np
+from cpymad.madx import Madx
+from latticeadaptors.core import LatticeAdaptor
+
+from lattice_gen import make_sequence_string
+
+
+def text_route(lattice, madx):
+    madx.input(lattice.parse_table_to_madx_sequence_string())
+
+
+def direct_route(lattice, madx):
+    lattice.to_madx(madx)
+
+
+def position_error(lattice, madx) -> float:
+    table = lattice.table
+    entry = madx.sequence[lattice.name.lower()].element_positions()[1:-1]
+    return float(np.max(np.abs(entry - (table["at"] - table["L"].fillna(0) / 2).to_numpy())))
+
+
+def main(sizes):
+    for n in sizes:
+        lattice = LatticeAdaptor()
+        lattice.load_from_madx_sequence_string(make_sequence_string(n))
+        print("{} elements".format(len(lattice.table)))
+        for label, route in (("text", text_route), ("to_madx", direct_route)):
+            madx = Madx(stdout=False)
+            try:
+                t0 = time.perf_counter()
+                route(lattice, madx)
+                elapsed = time.perf_counter() - t0
+                error = position_error(lattice, madx)
+            finally:
+                madx.quit()
+            print("{:>12}: {:8.3f} s, max position error {:.2e} m".format(label, elapsed, error))
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000])
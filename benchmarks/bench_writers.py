@@ -0,0 +1,113 @@
+"""
+Benchmark of the table writers on synthetic lattices.
+
+Usage:
+    python benchmarks/bench_writers.py [n1,n2,...]
+
+Every writer is timed with its reference implementation and
+the outputs are checked to be identical.
+"""
+
+import gc
+import sys
+import time
+
+from lattice_gen import make_sequence_string
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.parsers.TableParsers import (
+    _parse_table_to_madx_definitions,
+    _parse_table_to_madx_sequence_part,
+    parse_table_to_elegant_string,
+    parse_table_to_madx_install_str,
+    parse_table_to_madx_remove_str,
+    parse_table_to_tracy_string,
+)
+
+
+# row by row implementations the vectorized writers replaced
+def legacy_madx_sequence_part(name, length, df):
+    text = "{}: SEQUENCE, L={};\n".format(name, length)
+    for _, row in df.iterrows():
+        line = "{:11}, at = {:12.6f};\n".format(row["name"], row["at"])
+        text += line
+    text += "ENDSEQUENCE;"
+    return text
+
+
+def legacy_madx_install_str(name, length, df):
+    text = "USE, SEQUENCE={};\n".format(name)
+    text += "SEQEDIT, SEQUENCE = {};  \nFLATTEN;\n".format(name)
+    for _, row in df.iterrows():
+        line = "INSTALL, ELEMENT = {:16}, AT = {:12.6f};\n".format(row["name"], row["at"])
+        text += line
+    text += "FLATTEN;\nENDEDIT;"
+    return text
+
+
+def legacy_madx_remove_str(name, length, df):
+    text = "USE, SEQUENCE={};\n".format(name)
+    text += "SEQEDIT, SEQUENCE = {};  \nFLATTEN;\n".format(name)
+    for _, row in df.iterrows():
+        line = "REMOVE, ELEMENT = {:16};\n".format(row["name"])
+        text += line
+    text += "FLATTEN;\nENDEDIT;"
+    return text
+
+
+# name -> (reference, candidate), both called with (name, length, table),
+# writers without a working reference implementation only get timed
+WRITERS = {
+    "madx definitions": (
+        lambda name, length, df: _parse_table_to_madx_definitions(df, engine="rows"),
+        lambda name, length, df: _parse_table_to_madx_definitions(df, engine="vectorized"),
+    ),
+    "madx sequence part": (legacy_madx_sequence_part, _parse_table_to_madx_sequence_part),
+    "madx install": (
+        legacy_madx_install_str,
+        lambda name, length, df: parse_table_to_madx_install_str(name, df),
+    ),
+    "madx remove": (
+        legacy_madx_remove_str,
+        lambda name, length, df: parse_table_to_madx_remove_str(name, df),
+    ),
+    "elegant": (
+        lambda name, length, df: parse_table_to_elegant_string(name, df, engine="rows"),
+        lambda name, length, df: parse_table_to_elegant_string(name, df, engine="vectorized"),
+    ),
+    "tracy": (None, lambda name, length, df: parse_table_to_tracy_string(name, df)),
+}
+
+
+def measure(writer, *args):
+    gc.collect()
+    t0 = time.perf_counter()
+    result = writer(*args)
+    return result, time.perf_counter() - t0
+
+
+def main(sizes):
+    print(
+        "{:>9} {:>18} {:>14} {:>14} {:>9}".format(
+            "elements", "writer", "reference [s]", "candidate [s]", "speedup"
+        )
+    )
+    for n in sizes:
+        args = parse_from_madx_sequence_string(make_sequence_string(n), cache=False)
+        for label, (reference, candidate) in WRITERS.items():
+            result, t_candidate = measure(candidate, *args)
+            if reference is None:
+                print("{:9d} {:>18} {:>14} {:14.3f} {:>9}".format(n, label, "-", t_candidate, "-"))
+                continue
+
+            expected, t_reference = measure(reference, *args)
+            assert result == expected
+            print(
+                "{:9d} {:>18} {:14.3f} {:14.3f} {:9.1f}".format(
+                    n, label, t_reference, t_candidate, t_reference / t_candidate
+                )
+            )
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000").split(",")]
+    main(sizes)
@@ -0,0 +1,40 @@
+"""Synthetic lattices in the layout of madx SAVE, SEQUENCE=...; for the benchmarks."""
+
+import numpy as np
+
+_CELL = [
+    ("QF{}", "quadrupole", "l:= 0.5,k1:= {:.10g}", 0.5),
+    ("SF{}", "sextupole", "l:= 0.2,k2:= {:.10g}", 0.2),
+    ("BPM{}", "monitor", None, 0.0),
+    ("B{}", "sbend", "l:= 1.2,angle:= {:.10g},e1:= 0.01,e2:= 0.01", 1.2),
+    ("QD{}", "quadrupole", "l:= 0.5,k1:= -{:.10g}", 0.5),
+    ("SD{}", "sextupole", "l:= 0.2,k2:= -{:.10g}", 0.2),
+    ("HC{}", "hkicker", "l:= 0.1,kick:= {:.10g}", 0.1),
+    ("M{}", "marker", None, 0.0),
+]
+
+
+def make_sequence_string(n: int, name: str = "ring", seed: int = 0) -> str:
+    """Return a madx sequence with n elements in the canonical SAVE layout."""
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0.01, 2.0, n)
+    definitions, positions = [], []
+    s = 0.0
+    for i in range(n):
+        label, family, attributes, length = _CELL[i % len(_CELL)]
+        label = label.format(i)
+        if attributes is None:
+            definitions.append("{}: {};\n".format(label.lower(), family))
+        else:
+            definitions.append(
+                "{}: {},{};\n".format(label.lower(), family, attributes.format(values[i]))
+            )
+        s += 0.3 + length
+        positions.append("{}, at = {:.10g};\n".format(label.lower(), s - length / 2))
+
+    return "".join(
+        definitions
+        + ["{}: sequence, l = {:.10g};\n".format(name, s + 0.3)]
+        + positions
+        + ["endsequence;\n"]
+    )
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from .StorageUtils import load_table_npz, save_table_npz
+
+# environment variables to configure the default cache, caching is
+# enabled by setting CACHE_ENV to 1
+CACHE_ENV = "LATTICEADAPTORS_CACHE"
+CACHE_DIR_ENV = "LATTICEADAPTORS_CACHE_DIR"
+CACHE_SIZE_ENV = "LATTICEADAPTORS_CACHE_SIZE"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "latticeadaptors"
+DEFAULT_CACHE_SIZE = 512 * 1024**2
+
+
+class ParseCache:
+    """
+    Content addressed on-disk cache for parsed sequence tables.
+
+    Entries are keyed by a hash of the parsed content and the parser
+    version and stored in a binary columnar form (one npz file per
+    entry). The total size of the cache is limited to max_size bytes,
+    the least recently used entries are evicted first.
+
+    Arguments:
+    ----------
+    directory   : str
+        directory to store the cache entries in
+    max_size    : int
+        maximum size of the cache in bytes
+
+    """
+
+    suffix = ".npz"
+
+    def __init__(self, directory=None, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = Path(directory) if directory is not None else DEFAULT_CACHE_DIR
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # only the settings are pickled, e.g. to hand the cache to worker processes
+        return type(self), (self.directory, self.max_size)
+
+    @staticmethod
+    def key(content, version: str) -> str:
+        """Method to compute the cache key of the content for a parser version."""
+        if isinstance(content, str):
+            content = content.encode()
+        h = hashlib.sha256(version.encode())
+        h.update(content)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + self.suffix)
+
+    def _entries(self) -> list:
+        """Method to list the cache entries as (path, size, last access) tuples."""
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for path in self.directory.glob("*" + self.suffix):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key: str):
+        """Method to return the cached (name, length, table) or None on a miss."""
+        path = self._path(key)
+        try:
+            result = load_table_npz(path)
+            # mark as recently used for the LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            result = None
+        except Exception:
+            # corrupt entry, drop it
+            path.unlink(missing_ok=True)
+            result = None
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return result
+
+    def put(self, key: str, result: (str, float, pd.DataFrame)) -> None:
+        """
+        Method to store a parse result and evict entries above the size limit.
+        Tables with object columns are not stored, as they could only be
+        stored pickled. Failing to write (e.g. read-only directory) is
+        silently ignored.
+        """
+        path = self._path(key)
+
+        # write to temporary file first so readers never see partial entries
+        tmp = path.with_name("{}.{}.{}.tmp".format(key, os.getpid(), threading.get_ident()))
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with tmp.open("wb") as f:
+                save_table_npz(*result, f, allow_pickle=False)
+            os.replace(tmp, path)
+            self.evict()
+        except (OSError, ValueError):
+            tmp.unlink(missing_ok=True)
+
+    def evict(self) -> None:
+        """Method to remove least recently used entries until within max_size."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Method to remove all entries and reset the counters."""
+        for path, _, _ in self._entries():
+            path.unlink(missing_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Method to return hit/miss counters and the current size of the cache."""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "max_size": self.max_size,
+        }
+
+
+def _default_cache():
+    if os.environ.get(CACHE_ENV, "0").lower() not in ("1", "true", "yes", "on"):
+        return None
+    return ParseCache(
+        os.environ.get(CACHE_DIR_ENV, None),
+        int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)),
+    )
+
+
+_PARSE_CACHE = _default_cache()
+
+
+def get_parser_cache_dir() -> Path:
+    """
+    Method to return the directory the serialized parser tables are cached
+    in. Unlike the parse cache this cache is always used, it only holds a
+    few files written once per grammar version.
+    """
+    return Path(os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+
+
+def get_parse_cache():
+    """Method to return the parse cache used by the parsers, None if disabled."""
+    return _PARSE_CACHE
+
+
+def set_parse_cache(cache) -> None:
+    """Method to set the parse cache used by the parsers, None to disable caching."""
+    global _PARSE_CACHE
+    _PARSE_CACHE = cache
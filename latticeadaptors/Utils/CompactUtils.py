@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# columns every element has, always kept dense
+CORE_COLUMNS = ("name", "family", "pos", "L", "at")
+
+# attribute columns set for at most this fraction of the elements are stored sparse
+DEFAULT_MAX_DENSITY = 0.5
+
+
+def is_sparse(series: pd.Series) -> bool:
+    """Method to check if a column is stored sparse."""
+    return isinstance(series.dtype, pd.SparseDtype)
+
+
+def compact_table(df: pd.DataFrame, max_density: float = DEFAULT_MAX_DENSITY) -> pd.DataFrame:
+    """
+    Method to convert a sequence table to its compact form: name and
+    family categorical, the core columns (pos, L, at) dense and the
+    float attribute columns that only a few families use sparse (only
+    the values that are set and their row positions are stored). The
+    table keeps its DataFrame API. Returns the table itself if there is
+    nothing to convert.
+
+    Arguments:
+    ----------
+    df          : pd.DataFrame
+        sequence table
+    max_density : float
+        attribute columns set for at most this fraction of the rows are
+        made sparse
+
+    """
+    if df is None or df.empty:
+        return df
+
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if column in ("name", "family"):
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                columns[column] = series.astype("category")
+        elif column in CORE_COLUMNS or is_sparse(series):
+            continue
+        elif series.dtype.kind == "f" and series.notna().mean() <= max_density:
+            columns[column] = pd.arrays.SparseArray(series.to_numpy(), fill_value=np.nan)
+
+    if not columns:
+        return df
+    return df.assign(**columns)
+
+
+def dense_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Method to convert the sparse columns of a compact table back to
+    dense columns. Returns the table itself if there is nothing to convert.
+    """
+    if df is None:
+        return df
+
+    columns = {
+        column: df[column].sparse.to_dense() for column in df.columns if is_sparse(df[column])
+    }
+    if not columns:
+        return df
+    return df.assign(**columns)
+
+
+def set_rows(df: pd.DataFrame, column: str, rows: np.ndarray, values) -> None:
+    """
+    Method to set the values of a column at row positions in place,
+    sparse columns are rebuilt as they can not be changed in place.
+    """
+    if is_sparse(df[column]):
+        dense = df[column].sparse.to_dense().to_numpy(copy=True)
+        dense[rows] = values
+        df[column] = pd.arrays.SparseArray(dense, fill_value=df[column].dtype.fill_value)
+    else:
+        df.iloc[rows, df.columns.get_loc(column)] = values
+
+
+def table_memory_report(df: pd.DataFrame) -> dict:
+    """
+    Method to compare the memory used by a table with the memory of its
+    dense form (as returned by the parsers) and of its compact form.
+
+    Returns:
+    --------
+    dict with the total bytes of the "table", "dense" and "compact" forms
+    and per column a dict with the bytes of the dense and compact form
+
+    """
+    dense, compact = dense_table(df), compact_table(df)
+
+    def usage(table):
+        return table.memory_usage(index=False, deep=True)
+
+    report = {
+        "table": int(df.memory_usage(index=True, deep=True).sum()),
+        "dense": int(dense.memory_usage(index=True, deep=True).sum()),
+        "compact": int(compact.memory_usage(index=True, deep=True).sum()),
+        "columns": {},
+    }
+    dense_usage, compact_usage = usage(dense), usage(compact)
+    for column in df.columns:
+        report["columns"][column] = {
+            "dense": int(dense_usage[column]),
+            "compact": int(compact_usage[column]),
+        }
+    return report
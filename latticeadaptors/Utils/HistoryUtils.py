@@ -0,0 +1,213 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_DEPTH = 100
+DEFAULT_MAX_MEMORY = 256 * 1024**2
+
+
+def _table_nbytes(df: pd.DataFrame) -> int:
+    """Method to return the memory used by a table in bytes, 0 for None."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _changed_rows(old, new) -> np.ndarray:
+    """
+    Method to return the positions where two column arrays differ,
+    missing values compare equal. Returns None if the columns can not
+    be compared element wise (e.g. the dtype changed) or not be
+    patched in place (sparse).
+    """
+    if old.dtype != new.dtype or len(old) != len(new):
+        return None
+    old, new = pd.Series(old, copy=False), pd.Series(new, copy=False)
+    if isinstance(old.dtype, pd.SparseDtype):
+        # sparse columns can not be patched in place, they are kept whole if changed
+        return np.zeros(0, dtype=int) if old.equals(new) else None
+    try:
+        equal = (old == new).fillna(False).to_numpy(dtype=bool)
+    except TypeError:
+        return None
+    equal |= (old.isna() & new.isna()).to_numpy()
+    return np.flatnonzero(~equal)
+
+
+class _Entry:
+    """
+    One step of the journal. Either the table was replaced, then the old
+    and the new table are kept by reference (no copies), or it was
+    changed in place, then only the changed cells are kept.
+    """
+
+    __slots__ = ("name", "len", "tables", "cells", "nbytes")
+
+    def __init__(self, name, length, tables=None, cells=None):
+        # (old, new) pairs
+        self.name = name
+        self.len = length
+        self.tables = tables
+        self.cells = cells
+        if tables is not None:
+            # the new table is either the live one or the old table of the next entry
+            self.nbytes = _table_nbytes(tables[0])
+        else:
+            self.nbytes = sum(
+                old.nbytes + new.nbytes + (rows.nbytes if rows is not None else 0)
+                for rows, old, new in cells.values()
+            )
+
+    def apply(self, owner, i: int) -> None:
+        """Method to set the owner to the old (i=0) or new (i=1) state."""
+        owner.name = self.name[i]
+        owner.len = self.len[i]
+        if self.tables is not None:
+            owner.table = self.tables[i]
+            return
+
+        df = owner.table
+        for column, (rows, *values) in self.cells.items():
+            if rows is None:
+                df[column] = values[i]
+            else:
+                df.iloc[rows, df.columns.get_loc(column)] = values[i]
+
+
+class HistoryJournal:
+    """
+    Bounded undo/redo journal for the state (name, len, table) of a
+    LatticeAdaptor.
+
+    Instead of a copy of the table per step only the changes are
+    recorded: a replaced table is kept by reference and for a table
+    changed in place only the changed cells are stored. The oldest steps
+    are dropped when the journal grows beyond max_depth steps or
+    max_memory bytes. Changes must go through record, changes made to
+    the table outside of it can not be undone and may corrupt the
+    journal.
+
+    Arguments:
+    ----------
+    max_depth   : int
+        maximum number of steps kept, None for no limit
+    max_memory  : int
+        maximum memory in bytes used by the kept steps, None for no limit
+
+    """
+
+    def __init__(self, max_depth: int = DEFAULT_MAX_DEPTH, max_memory: int = DEFAULT_MAX_MEMORY):
+        self.max_depth = max_depth
+        self.max_memory = max_memory
+        self._undo = []
+        self._redo = []
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    @contextmanager
+    def record(self, owner, columns=None):
+        """
+        Context manager to record the changes made to the owner within
+        as one step, e.g.
+
+            with history.record(lattice, columns=["K1"]):
+                lattice.table.loc[..., "K1"] = ...
+
+        Arguments:
+        ----------
+        owner   : object
+            object with name, len and table attributes
+        columns : iterable of str
+            columns that can be changed in place, None for all columns;
+            pass an empty tuple if the table is only ever replaced to
+            avoid a temporary copy
+
+        """
+        name, length, df = owner.name, owner.len, owner.table
+
+        snapshot = None
+        if df is not None:
+            columns = df.columns if columns is None else [c for c in columns if c in df.columns]
+            snapshot = {column: df[column].array.copy() for column in columns}
+            structure = (df.columns.copy(), df.index)
+
+        yield
+
+        new = owner.table
+        if new is not df:
+            entry = _Entry((name, owner.name), (length, owner.len), tables=(df, new))
+        elif df is None:
+            entry = _Entry((name, owner.name), (length, owner.len), cells={})
+        elif not (df.columns.equals(structure[0]) and df.index.equals(structure[1])):
+            # structure changed in place, rebuild the old table from the snapshot
+            old = pd.DataFrame(
+                {
+                    column: snapshot[column] if column in snapshot else df[column].array
+                    for column in structure[0]
+                },
+                index=structure[1],
+            )
+            entry = _Entry((name, owner.name), (length, owner.len), tables=(old, new))
+        else:
+            cells = {}
+            for column, values in snapshot.items():
+                current = df[column].array
+                rows = _changed_rows(values, current)
+                if rows is None:
+                    cells[column] = (None, values, current.copy())
+                elif len(rows) > 0:
+                    cells[column] = (rows, values[rows], current[rows])
+            entry = _Entry((name, owner.name), (length, owner.len), cells=cells)
+
+        self._undo.append(entry)
+        self._redo.clear()
+        self._trim()
+
+    def _trim(self) -> None:
+        """Method to drop the oldest steps until within max_depth and max_memory."""
+        if self.max_depth is not None:
+            del self._undo[: max(0, len(self._undo) - self.max_depth)]
+        if self.max_memory is not None:
+            total = self.nbytes
+            while self._undo and total > self.max_memory:
+                total -= self._undo.pop(0).nbytes
+
+    def undo(self, owner) -> bool:
+        """Method to undo the last recorded step, returns False if there is none."""
+        if not self._undo:
+            return False
+        entry = self._undo.pop()
+        entry.apply(owner, 0)
+        self._redo.append(entry)
+        return True
+
+    def redo(self, owner) -> bool:
+        """Method to redo the last undone step, returns False if there is none."""
+        if not self._redo:
+            return False
+        entry = self._redo.pop()
+        entry.apply(owner, 1)
+        self._undo.append(entry)
+        return True
+
+    def clear(self) -> None:
+        """Method to remove all steps."""
+        self._undo.clear()
+        self._redo.clear()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory in bytes used by the undo and redo steps."""
+        return sum(entry.nbytes for entry in self._undo + self._redo)
+
+    def memory_usage(self) -> dict:
+        """Method to report the number of steps and the memory they use."""
+        return {
+            "undo": len(self._undo),
+            "redo": len(self._redo),
+            "nbytes": self.nbytes,
+            "max_depth": self.max_depth,
+            "max_memory": self.max_memory,
+        }
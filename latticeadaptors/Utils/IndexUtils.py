@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+
+class TableIndex:
+    """
+    Index of the row positions per value of a table column, e.g. the
+    rows of every element name. Built once in O(n log n) from the
+    (categorical) column, lookups of k keys then cost O(k + rows found)
+    instead of a scan of the column per key.
+
+    Arguments:
+    ----------
+    column  : pd.Series
+        column to index, missing values are not indexed
+
+    """
+
+    def __init__(self, column: pd.Series):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+            self.keys = column.cat.categories
+        else:
+            codes, self.keys = pd.factorize(column)
+
+        # rows grouped per key in table order, missing values (-1) sorted first
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.keys))
+        self.rows = order[len(codes) - counts.sum() :]
+        self.counts = counts
+        self.starts = np.r_[0, np.cumsum(counts)[:-1]].astype(int)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, keys) -> (np.ndarray, np.ndarray):
+        """
+        Method to return the rows of a list of keys, unknown keys are ignored.
+
+        Returns:
+        --------
+        rows    : np.ndarray
+            row positions, grouped per key in the order of keys
+        which   : np.ndarray
+            position in keys of the key of every row
+
+        """
+        codes = self.keys.get_indexer(pd.Index(keys, dtype=object))
+        found = np.flatnonzero(codes >= 0)
+        codes = codes[found]
+
+        counts = self.counts[codes]
+        which = np.repeat(found, counts)
+        # position of every row within the group of its key
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = self.rows[np.repeat(self.starts[codes], counts) + offsets]
+        return rows, which
+
+    def get(self, key) -> np.ndarray:
+        """Method to return the rows of a single key in table order."""
+        return self.lookup([key])[0]
+
+
+class PositionIndex:
+    """
+    Interval index of the longitudinal extent [pos - L/2, pos + L/2] of
+    the elements of a sequence table. The intervals are sorted by start
+    and split in layers in which the ends are sorted as well, an element
+    lying within an earlier one (e.g. a marker inside a long element)
+    goes to a next layer. The elements overlapping a range are found by
+    two binary searches per layer, O(d log n + k) with d the number of
+    layers, i.e. how deep elements lie within each other (1 if they do not).
+
+    Positions are taken modulo the length of the sequence, ranges
+    crossing the end of the sequence continue at its start (ring), as do
+    the extents of elements crossing the start or the end. Extents are
+    assumed to lie within one length before or after the sequence.
+
+    Arguments:
+    ----------
+    pos     : np.ndarray
+        centre positions of the elements
+    L       : np.ndarray
+        lengths of the elements, missing lengths are taken as 0
+    length  : float
+        length of the sequence, None to disable the wrap around
+
+    """
+
+    def __init__(self, pos: np.ndarray, L: np.ndarray, length: float = None):
+        pos = np.asarray(pos, dtype=float)
+        L = np.nan_to_num(np.asarray(L, dtype=float))
+        start, end = pos - L / 2.0, pos + L / 2.0
+
+        self.order = np.lexsort((end, start))
+        # with the table sorted by start, the rows found are a slice of the table
+        self.sorted = bool(np.all(self.order == np.arange(len(pos))))
+        self.starts = start[self.order]
+        self.ends = end[self.order]
+        self.pos = pos
+        self.length = length if length else None
+
+        # layers of positions in self.order with their starts and ends sorted,
+        # the elements ending at or after all earlier ones form the first layer
+        self.layers = []
+        remaining = np.arange(len(pos))
+        while len(remaining) > 0:
+            ends = self.ends[remaining]
+            first = ends >= np.maximum.accumulate(ends)
+            layer = remaining[first]
+            self.layers.append((layer, self.starts[layer], self.ends[layer]))
+            remaining = remaining[~first]
+
+        # offsets of the range to also find the elements crossing the start
+        # (their extent continues before the end) or the end of the sequence
+        self.shifts = [0.0]
+        if self.length is not None and len(pos) > 0:
+            if self.starts[0] < 0.0:
+                self.shifts.append(-self.length)
+            if self.ends.max() > self.length:
+                self.shifts.append(self.length)
+        # rows per group sorted by position, see add_group
+        self.groups = {}
+
+    def __len__(self) -> int:
+        return len(self.pos)
+
+    def _wrap(self, s: float) -> float:
+        return s % self.length if self.length is not None else s
+
+    def _positions(self, s1: float, s2: float) -> np.ndarray:
+        """
+        Method to return the positions in self.order of the elements
+        overlapping [s1, s2], ordered by the start of their extent.
+        """
+        found, starts = [], []
+        for shift in self.shifts:
+            for layer, layer_starts, layer_ends in self.layers:
+                lo = int(np.searchsorted(layer_ends, s1 + shift, side="left"))
+                hi = int(np.searchsorted(layer_starts, s2 + shift, side="right"))
+                if hi > lo:
+                    found.append(layer[lo:hi])
+                    starts.append(layer_starts[lo:hi] - shift)
+
+        if len(found) <= 1:
+            return found[0] if found else np.zeros(0, dtype=int)
+
+        positions, starts = np.concatenate(found), np.concatenate(starts)
+        order = np.lexsort((positions, starts))
+        # an element found with and without shift is kept at its first start
+        _, first = np.unique(positions[order], return_index=True)
+        return positions[order[np.sort(first)]]
+
+    def _selection(self, positions: np.ndarray):
+        """Method to return the rows at positions as a slice where possible, else an array."""
+        if len(positions) == 0:
+            return slice(0, 0)
+        if self.sorted and np.all(np.diff(positions) == 1):
+            return slice(int(positions[0]), int(positions[-1]) + 1)
+        return self.order[positions]
+
+    def overlapping(self, s1: float, s2: float) -> list:
+        """
+        Method to return the rows of the elements overlapping [s1, s2] (in
+        the order along the ring starting at s1) as a list of one or two
+        selections (slices where possible, else arrays of row positions).
+        """
+        if self.length is None:
+            return [self._selection(self._positions(s1, s2))]
+        if s2 - s1 >= self.length:
+            return [slice(0, len(self))]
+
+        span = max(s2 - s1, 0.0)
+        s1 = self._wrap(s1)
+        s2 = s1 + span
+        if s2 <= self.length:
+            return [self._selection(self._positions(s1, s2))]
+
+        first = self._positions(s1, self.length)
+        second = self._positions(0.0, s2 - self.length)
+        # elements crossing the end of the sequence are only returned once
+        second = second[~np.isin(second, first)]
+        return [self._selection(first), self._selection(second)]
+
+    def at(self, s: float):
+        """Method to return the rows of the elements covering position s."""
+        return self.overlapping(s, s)[0]
+
+    def add_group(self, key, rows: np.ndarray) -> None:
+        """Method to add a group of rows (e.g. a family) for nearest, sorted by position."""
+        rows = np.asarray(rows, dtype=int)
+        order = np.argsort(self.pos[rows], kind="stable")
+        self.groups[key] = (self.pos[rows][order], rows[order])
+
+    def nearest(self, s: float, key) -> int:
+        """
+        Method to return the row of the element of a group closest (by
+        centre) to position s, None if the group is empty.
+        """
+        positions, rows = self.groups[key]
+        if len(rows) == 0:
+            return None
+
+        s = self._wrap(s)
+        i = int(np.searchsorted(positions, s))
+        candidates = np.unique(np.clip([i - 1, i, 0, len(rows) - 1], 0, len(rows) - 1))
+        distance = np.abs(positions[candidates] - s)
+        if self.length is not None:
+            distance = np.minimum(distance, self.length - distance)
+        return int(rows[candidates[np.argmin(distance)]])
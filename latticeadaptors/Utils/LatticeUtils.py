@@ -1,8 +1,99 @@
 import os
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-from ..parsers.madx_seq_parser import parse_from_madx_sequence_file
+from ..parsers.madx_seq_parser import parse_from_madx_sequence_file, parse_many
+from .ProfileUtils import stage
+
+# positions closer than this (in m) are taken as equal by compare_lattices
+DEFAULT_TOLERANCE = 1e-6
+
+
+def add_drifts_to_table(
+    df: pd.DataFrame,
+    length: float,
+    min_gap: float = None,
+    prefix: str = "D",
+    family: str = "DRIFT",
+) -> pd.DataFrame:
+    """
+    Method to add the drifts between the elements of a sequence table.
+    All gaps are computed from pos and L at once and the new table is
+    allocated in one go.
+
+    Arguments:
+    ----------
+    df          : pd.DataFrame
+        sequence table sorted by pos, missing L are taken as 0
+    length      : float
+        length of the sequence, a closing drift is added up to it
+    min_gap     : float
+        only add drifts for gaps longer than min_gap, None to add a
+        drift wherever the next element is further downstream (also
+        for zero length gaps) and a closing drift for any gap left
+    prefix      : str
+        drifts are named prefix + number, numbered from 1
+    family      : str
+        family of the drifts
+
+    Returns:
+    --------
+    pd.DataFrame
+        table with the drifts, attributes not set for the drifts are NaN
+
+    """
+    df = df.reset_index(drop=True)
+    if df.empty:
+        return df
+
+    L = df["L"].fillna(0).to_numpy(dtype=float)
+    pos = df["pos"].to_numpy(dtype=float)
+    end = pos + L / 2.0
+
+    # gap after every element, the last one up to the end of the sequence
+    gaps = np.round(np.r_[pos[1:] - L[1:] / 2.0, length] - end, 6)
+    if min_gap is None:
+        drift = np.r_[pos[1:] > pos[:-1], gaps[-1] > 0]
+    else:
+        drift = gaps > min_gap
+
+    # elements shift down by the number of drifts before them, a drift follows its element
+    rows = np.arange(len(df)) + np.r_[0, np.cumsum(drift[:-1])]
+    drifts = rows[drift] + 1
+    total = len(df) + len(drifts)
+
+    take = np.full(total, -1)
+    take[rows] = np.arange(len(df))
+    out = df.reindex(take).reset_index(drop=True)
+
+    names = ["{}{}".format(prefix, i) for i in range(1, len(drifts) + 1)]
+    order = np.empty(total, dtype=int)
+    order[rows] = np.arange(len(df))
+    order[drifts] = np.arange(len(df), total)
+    for column, categories, codes in (
+        ("name", names, np.arange(len(drifts))),
+        ("family", [family], np.zeros(len(drifts), dtype=int)),
+    ):
+        values = pd.Categorical.from_codes(codes, categories=categories)
+        if df[column].dtype == "category":
+            # append the new categories instead of sorting all of them again
+            merged = union_categoricals([df[column].array, values])
+        else:
+            merged = np.r_[df[column].to_numpy(dtype=object), np.asarray(values, dtype=object)]
+        out[column] = merged.take(order)
+
+    for column, values, drift_values in (
+        ("L", L, gaps[drift]),
+        ("pos", pos, end[drift] + gaps[drift] / 2.0),
+    ):
+        merged = np.empty(total)
+        merged[rows] = values
+        merged[drifts] = drift_values
+        out[column] = merged
+
+    return out
 
 
 def compare_seq_center_positions(seqfile1, seqfile2):
@@ -24,6 +115,8 @@ def compare_seq_center_positions(seqfile1, seqfile2):
     diff:   pandas dataframe
         frame containing locations and names of elements at different centre positions
 
+    See compare_lattices for a comparison matching the elements within a tolerance.
+
     """
     assert os.path.isfile(seqfile1)
     assert os.path.isfile(seqfile2)
@@ -40,6 +133,204 @@ def compare_seq_center_positions(seqfile1, seqfile2):
     return eq, diff
 
 
+def _lattice_table(lattice) -> pd.DataFrame:
+    """Method to return the table of a comparison input that is already parsed."""
+    if isinstance(lattice, pd.DataFrame):
+        return lattice
+    if isinstance(lattice, tuple):
+        return lattice[2]
+    return lattice.table
+
+
+def _categorical(column: pd.Series) -> pd.Categorical:
+    """Method to return a table column as categorical, as the parsers store name and family."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.array
+    return pd.Categorical(column)
+
+
+def _shared_codes(names1: pd.Categorical, names2: pd.Categorical) -> (np.ndarray, np.ndarray):
+    """Method to return codes of two categoricals that are equal for equal names."""
+    codes1 = names1.codes.astype(np.int64)
+    remap = names1.categories.get_indexer(names2.categories)
+    # names only in the second lattice get codes after those of the first
+    missing = remap < 0
+    remap[missing] = len(names1.categories) + np.arange(missing.sum())
+    codes2 = remap[names2.codes].astype(np.int64)
+    return codes1, codes2
+
+
+def _group_ranks(codes: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Method to return the occurrence of every row within its code, in the given order."""
+    ranks = np.empty(len(codes), dtype=np.int64)
+    sorted_codes = codes[order]
+    starts = np.searchsorted(sorted_codes, sorted_codes, side="left")
+    ranks[order] = np.arange(len(codes)) - starts
+    return ranks
+
+
+def _rank_pairs(codes1, pos1, codes2, pos2) -> (np.ndarray, np.ndarray):
+    """
+    Method to pair the k-th occurrence (by position) of every name in the
+    first lattice with its k-th occurrence in the second lattice.
+    """
+    ranks1 = _group_ranks(codes1, np.lexsort((pos1, codes1)))
+    ranks2 = _group_ranks(codes2, np.lexsort((pos2, codes2)))
+
+    # (code, occurrence) as a single exact integer key
+    size = max(ranks1.max(initial=0), ranks2.max(initial=0)) + 1
+    j = pd.Index(codes2 * size + ranks2).get_indexer(codes1 * size + ranks1)
+    i = np.flatnonzero(j >= 0)
+    return i, j[i]
+
+
+def _nearest_pairs(codes1, pos1, codes2, pos2, tolerance: float) -> (np.ndarray, np.ndarray):
+    """
+    Method to pair every element of the first lattice with the nearest
+    element of the same name of the second lattice within tolerance, by
+    a merged sort of both. Every element is used in one pair at most, the
+    closest pair wins.
+    """
+    n1 = len(codes1)
+    codes = np.concatenate([codes1, codes2])
+    pos = np.concatenate([pos1, pos2])
+    order = np.lexsort((pos, codes))
+    codes, pos = codes[order], pos[order]
+    second = order >= n1
+
+    # nearest element of the second lattice before and after every row in the merged order
+    index = np.arange(len(order))
+    before = np.maximum.accumulate(np.where(second, index, -1))
+    after = np.minimum.accumulate(np.where(second, index, len(order))[::-1])[::-1]
+
+    rows = np.flatnonzero(~second)
+    candidates, distances = [], []
+    for neighbour in (before[rows], after[rows]):
+        valid = (neighbour >= 0) & (neighbour < len(order))
+        neighbour = np.where(valid, neighbour, rows)
+        valid &= codes[neighbour] == codes[rows]
+        distance = np.where(valid, np.abs(pos[neighbour] - pos[rows]), np.inf)
+        candidates.append(neighbour)
+        distances.append(distance)
+
+    closer = distances[1] < distances[0]
+    neighbour = np.where(closer, candidates[1], candidates[0])
+    distance = np.where(closer, distances[1], distances[0])
+    found = distance <= tolerance
+    i, j, distance = order[rows[found]], order[neighbour[found]] - n1, distance[found]
+
+    # one pair per element of the second lattice, keep the closest
+    closest = np.argsort(distance, kind="stable")
+    _, first = np.unique(j[closest], return_index=True)
+    keep = closest[first]
+    return i[keep], j[keep]
+
+
+def compare_lattices(
+    lattice1, lattice2, tolerance: float = DEFAULT_TOLERANCE, cache: bool = True
+) -> dict:
+    """
+    Method to compare the element centre positions of two lattices,
+    matching elements of the same name within a position tolerance.
+
+    Elements are paired in three passes, each on the elements not paired
+    yet: the k-th occurrence of every name in both lattices within
+    tolerance, the nearest element of the same name within tolerance
+    (sorted nearest neighbour join), and the remaining occurrences of
+    every name in order of position, which have moved. All passes are
+    vectorized sorts or hash joins, O(n log n).
+
+    Arguments:
+    ----------
+    lattice1    : str, pd.DataFrame, LatticeAdaptor or (name, length, table)
+        first lattice, madx seq files are parsed concurrently (see parse_many)
+    lattice2    : str, pd.DataFrame, LatticeAdaptor or (name, length, table)
+        second lattice
+    tolerance   : float
+        largest centre position difference (in m) of matching elements
+    cache       : bool
+        use the parse cache (see Utils.CacheUtils)
+
+    Returns:
+    --------
+    dict of tables sorted by position:
+
+    "matched"   : name, family, pos1, pos2 and ds = pos2 - pos1 of the
+                  elements at the same position within tolerance
+    "moved"     : the same for the elements in both lattices at
+                  different positions
+    "removed"   : name, family, pos of the elements only in lattice1
+    "added"     : name, family, pos of the elements only in lattice2
+
+    """
+    lattices = [lattice1, lattice2]
+    files = [i for i, lattice in enumerate(lattices) if isinstance(lattice, (str, os.PathLike))]
+    if files:
+        with stage("compare.parse"):
+            results = parse_many([lattices[i] for i in files], workers=len(files), cache=cache)
+            for i, (_, result, error) in zip(files, results):
+                if error is not None:
+                    raise error
+                lattices[i] = result
+    df1, df2 = map(_lattice_table, lattices)
+
+    with stage("compare.match", rows=len(df1) + len(df2)):
+        names1, names2 = _categorical(df1["name"]), _categorical(df2["name"])
+        codes1, codes2 = _shared_codes(names1, names2)
+        pos1 = df1["pos"].to_numpy(dtype=float)
+        pos2 = df2["pos"].to_numpy(dtype=float)
+        free1 = np.ones(len(df1), dtype=bool)
+        free2 = np.ones(len(df2), dtype=bool)
+
+        def pair(match, *args):
+            """Pairs of the elements not paired yet, as rows of both tables."""
+            rows1, rows2 = np.flatnonzero(free1), np.flatnonzero(free2)
+            i, j = match(codes1[rows1], pos1[rows1], codes2[rows2], pos2[rows2], *args)
+            return rows1[i], rows2[j]
+
+        def take(i, j):
+            free1[i] = free2[j] = False
+            return i, j
+
+        # unchanged elements, every name in the same order in both lattices
+        i, j = pair(_rank_pairs)
+        within = np.abs(pos2[j] - pos1[i]) <= tolerance
+        matched = [take(i[within], j[within])]
+        # unchanged elements out of order due to added or removed elements of the same name
+        matched.append(take(*pair(_nearest_pairs, tolerance)))
+        # the remaining elements in both lattices have moved
+        moved = take(*pair(_rank_pairs))
+
+    families1 = _categorical(df1["family"])
+
+    def pairs_table(i, j):
+        order = np.argsort(pos1[i], kind="stable")
+        i, j = i[order], j[order]
+        return pd.DataFrame(
+            {
+                "name": names1.take(i),
+                "family": families1.take(i),
+                "pos1": pos1[i],
+                "pos2": pos2[j],
+                "ds": pos2[j] - pos1[i],
+            }
+        )
+
+    def rows_table(names, families, free, pos):
+        rows = np.flatnonzero(free)
+        rows = rows[np.argsort(pos[rows], kind="stable")]
+        return pd.DataFrame(
+            {"name": names.take(rows), "family": families.take(rows), "pos": pos[rows]}
+        )
+
+    return {
+        "matched": pairs_table(*map(np.concatenate, zip(*matched))),
+        "moved": pairs_table(*moved),
+        "removed": rows_table(names1, families1, free1, pos1),
+        "added": rows_table(names2, _categorical(df2["family"]), free2, pos2),
+    }
+
+
 def dipole_split_angles_to_dict(
     dipole_name, dipole_len, dipole_bend_angle_rad, angle_list, verbose=True
 ):
@@ -241,6 +532,11 @@ def compare_settings_dicts(dc1, dc2, threshold=1):
     Method to compare lattice settings dicts
     extracted from json lattice files.
     """
+    from collections import defaultdict
+    from itertools import chain
+
+    from termcolor import colored
+
     combinedc = defaultdict(list)
     for k, v in chain(dc1.items(), dc2.items()):
         combinedc[k].append(v)
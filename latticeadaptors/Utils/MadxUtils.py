@@ -1,3 +1,19 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+from ..parsers.TableParsers import CHUNKSIZE, iter_table_to_madx_input
+
+if TYPE_CHECKING:
+    from cpymad.madx import Madx
+
+# twiss columns returned by default, None for all of them
+TWISS_COLUMNS = ("name", "s", "betx", "alfx", "mux", "bety", "alfy", "muy", "dx", "dpx")
+
+
 def install_start_end_marker(name: str, length: float) -> str:
     """
     Method to add end marker.
@@ -31,3 +47,298 @@ def install_start_end_marker(name: str, length: float) -> str:
     text += "FLATTEN;\nENDEDIT;"
 
     return text
+
+
+def new_madx(**kwargs) -> "Madx":
+    """
+    Method to start a MAD-X process, cpymad is only imported here so
+    importing the package does not load it.
+
+    Arguments:
+    ----------
+    kwargs  : dict
+        arguments for cpymad.madx.Madx
+
+    """
+    from cpymad.madx import Madx
+
+    return Madx(**kwargs)
+
+
+def table_to_madx(
+    madx: "Madx", name: str, length: float, df: pd.DataFrame, chunksize: int = CHUNKSIZE
+) -> None:
+    """
+    Method to define the elements and the sequence of a table in a running
+    MAD-X, in batches per family of at most chunksize statements and with
+    exact numbers (see TableParsers.iter_table_to_madx_input).
+
+    Arguments:
+    ----------
+    madx        : cpymad.madx.Madx
+        MAD-X instance to load the sequence into
+    name        : str
+        name of the sequence
+    length      : float
+        length of the sequence
+    df          : pd.DataFrame
+        table containing the element data
+    chunksize   : int
+        maximum number of statements per input call
+
+    """
+    for batch in iter_table_to_madx_input(name, length, df, chunksize):
+        madx.input(batch)
+
+
+def _variant(variant) -> dict:
+    """Method to normalize a variant, a string is taken as MAD-X input."""
+    if isinstance(variant, str):
+        return {"input": variant}
+    return dict(variant)
+
+
+class MadxWorker:
+    """
+    Long lived MAD-X instance (cpymad) with a base sequence loaded once.
+    Variants are applied as deltas on top of the base sequence: strengths
+    a variant does not set are back at their base value and the base is
+    loaded again after a variant with input, so every variant starts
+    from the base sequence.
+
+    A variant is a dict with the optional keys:
+
+        strengths   : dict attribute -> dict element name -> value,
+                      e.g. {"K1": lattice.get_quad_strengths()}
+        input       : MAD-X input run before the twiss, e.g. SEQEDIT
+                      strings from parse_table_to_madx_install_str;
+                      the base sequence is loaded again afterwards
+        twiss       : dict of extra arguments for twiss
+
+    Arguments:
+    ----------
+    base        : str
+        MAD-X input defining the sequence, e.g. parse_table_to_madx_sequence_string
+    sequence    : str
+        name of the sequence
+    setup       : str
+        MAD-X input run once after the base, e.g. the BEAM command
+    columns     : iterable of str
+        twiss columns to return, None for all
+    madx_kwargs : dict
+        arguments for cpymad.madx.Madx
+
+    """
+
+    def __init__(
+        self,
+        base: str,
+        sequence: str,
+        setup: str = "BEAM;",
+        columns=TWISS_COLUMNS,
+        madx_kwargs: dict = None,
+    ):
+        self.base = base
+        self.sequence = sequence
+        self.setup = setup
+        self.columns = columns
+        self.madx_kwargs = {"stdout": False, **(madx_kwargs or {})}
+        self.madx = None
+        self.runs = 0
+        self.restarts = 0
+        # held while the worker is in use, MAD-X is driven by one thread at a time
+        self.lock = threading.Lock()
+        # base values of the attributes set by variants, (name, attribute) -> value
+        self._base_values = {}
+        # attributes currently differing from their base value
+        self._changed = set()
+        self.start()
+
+    def start(self) -> None:
+        """Method to start MAD-X and load the base sequence."""
+        self.madx = new_madx(**self.madx_kwargs)
+        self.madx.input(self.base)
+        self.madx.input(self.setup)
+        self.madx.use(sequence=self.sequence)
+        self._base_values = {}
+        self._changed = set()
+
+    def stop(self) -> None:
+        """Method to stop MAD-X, errors of an already crashed process are ignored."""
+        if self.madx is not None:
+            try:
+                self.madx.quit()
+            except Exception:
+                pass
+            self.madx = None
+
+    def restart(self) -> None:
+        """Method to replace the MAD-X process by a fresh one."""
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def alive(self) -> bool:
+        """Method to check that the MAD-X process is running and responds."""
+        try:
+            return self.madx is not None and self.madx.eval("1") == 1
+        except Exception:
+            return False
+
+    def reset(self) -> None:
+        """Method to load the base sequence again, e.g. after a structural change."""
+        self.madx.input(self.base)
+        self.madx.use(sequence=self.sequence)
+        self._base_values = {}
+        self._changed = set()
+
+    def _set_strengths(self, strengths: dict) -> None:
+        """
+        Method to set the strengths of a variant in one input. Attributes
+        changed by the previous variant but not by this one are set back
+        to their base value in the same input instead of after every run.
+        """
+        values = {}
+        for attribute, named in strengths.items():
+            for name, value in named.items():
+                key = (name, attribute)
+                if key not in self._base_values:
+                    self._base_values[key] = self.madx.eval("{}->{}".format(name, attribute))
+                values[key] = float(value)
+        for key in self._changed - values.keys():
+            values[key] = self._base_values[key]
+
+        if values:
+            self.madx.input(
+                "\n".join(
+                    "{}->{} = {!r};".format(name, attribute, value)
+                    for (name, attribute), value in values.items()
+                )
+            )
+        self._changed = {key for key, value in values.items() if value != self._base_values[key]}
+
+    def twiss_table(self, **kwargs) -> pd.DataFrame:
+        """Method to run twiss and return the table with the summary in attrs."""
+        table = self.madx.twiss(sequence=self.sequence, **kwargs)
+        if self.columns is None:
+            df = table.dframe()
+        else:
+            df = pd.DataFrame({column: table[column] for column in self.columns})
+        df.attrs["summary"] = dict(table.summary)
+        return df
+
+    def run(self, variant) -> pd.DataFrame:
+        """Method to compute the twiss table of a variant of the base sequence."""
+        variant = _variant(variant)
+        self._set_strengths(variant.get("strengths", {}))
+        try:
+            if variant.get("input"):
+                self.madx.input(variant["input"])
+                self.madx.use(sequence=self.sequence)
+            result = self.twiss_table(**variant.get("twiss", {}))
+        finally:
+            if variant.get("input"):
+                self.reset()
+        self.runs += 1
+        return result
+
+    def health(self) -> dict:
+        """Method to report the state of the worker."""
+        return {"alive": self.alive(), "runs": self.runs, "restarts": self.restarts}
+
+
+class MadxPool:
+    """
+    Pool of warm MadxWorker instances sharing one base sequence, see
+    MadxWorker for the variants. Every worker runs its own MAD-X
+    process, variants are distributed over the idle workers. A worker
+    is checked before every run and restarted if its process died,
+    a variant that crashed MAD-X is run once more on the fresh process.
+
+    Arguments:
+    ----------
+    base        : str
+        MAD-X input defining the sequence
+    sequence    : str
+        name of the sequence
+    workers     : int
+        number of MAD-X processes
+    kwargs      :
+        further arguments for MadxWorker (setup, columns, madx_kwargs)
+
+    """
+
+    def __init__(self, base: str, sequence: str, workers: int = 1, **kwargs):
+        self.workers = [MadxWorker(base, sequence, **kwargs) for _ in range(workers)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def from_lattice(cls, lattice, workers: int = 1, **kwargs):
+        """Method to create a pool with the sequence of a LatticeAdaptor as base."""
+        return cls(lattice.parse_table_to_madx_sequence_string(), lattice.name, workers, **kwargs)
+
+    def _run(self, variant) -> pd.DataFrame:
+        worker = self._idle.get()
+        try:
+            with worker.lock:
+                if not worker.alive():
+                    worker.restart()
+                try:
+                    return worker.run(variant)
+                except Exception:
+                    if worker.alive():
+                        raise
+                    worker.restart()
+                    return worker.run(variant)
+        finally:
+            self._idle.put(worker)
+
+    def submit(self, variant):
+        """Method to schedule a variant, returns a Future of its twiss table."""
+        return self._executor.submit(self._run, variant)
+
+    def map(self, variants) -> list:
+        """Method to run variants and return their twiss tables in order."""
+        return [future.result() for future in [self.submit(variant) for variant in variants]]
+
+    def health(self) -> list:
+        """
+        Method to report the state of every worker, see MadxWorker.health.
+        Workers running a variant are reported as busy without a check.
+        """
+        report = []
+        for worker in self.workers:
+            if worker.lock.acquire(blocking=False):
+                try:
+                    report.append({"busy": False, **worker.health()})
+                finally:
+                    worker.lock.release()
+            else:
+                report.append({"busy": True, "runs": worker.runs, "restarts": worker.restarts})
+        return report
+
+    def check(self) -> list:
+        """Method to restart the idle workers whose MAD-X process died, returns the health."""
+        for worker in self.workers:
+            if worker.lock.acquire(blocking=False):
+                try:
+                    if not worker.alive():
+                        worker.restart()
+                finally:
+                    worker.lock.release()
+        return self.health()
+
+    def close(self) -> None:
+        """Method to wait for the scheduled variants and stop all workers."""
+        self._executor.shutdown(wait=True)
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
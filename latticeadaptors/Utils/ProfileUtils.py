@@ -0,0 +1,334 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# environment variables to profile the whole process, set PROFILE_ENV
+# to 1 (wall time and rows) or "memory" (also peak memory)
+PROFILE_ENV = "LATTICEADAPTORS_PROFILE"
+PROFILE_FILE_ENV = "LATTICEADAPTORS_PROFILE_FILE"
+
+# tracemalloc.reset_peak is new in Python 3.9
+_reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+
+class StageProfile:
+    """
+    Collector of statistics per conversion stage (e.g. "parse.fast",
+    "parse.build_table", "format.madx", "write"): number of calls, total
+    wall time, rows processed and peak memory.
+
+    Stages can be nested, the time of a stage includes the time of the
+    stages it contains. Peak memory is measured with tracemalloc, as the
+    largest amount of memory allocated during the stage on top of what
+    was allocated at its start. Memory is traced for the whole process,
+    stages running concurrently in threads include each other's
+    allocations. Python 3.8 cannot reset the peak of tracemalloc, a stage
+    that does not exceed the largest peak seen before only gets the
+    memory allocated at its end (or when a nested stage starts or ends).
+    Stages run in worker processes (parse_many, export_table with
+    processes) are not collected.
+
+    Arguments:
+    ----------
+    memory  : bool
+        measure peak memory, tracemalloc slows down allocations
+
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.stages = {}
+        self._lock = threading.Lock()
+        # stages currently running in any thread, for the memory peaks
+        self._open = set()
+        self._memory_lock = threading.Lock()
+        # peak of tracemalloc at the last update, without reset_peak
+        self._last_peak = 0
+
+    def _enter_memory(self, stage) -> None:
+        """Method to start the memory peak of a stage."""
+        with self._memory_lock:
+            self._update_peaks()
+            stage._start = stage._peak = tracemalloc.get_traced_memory()[0]
+            self._open.add(stage)
+
+    def _exit_memory(self, stage) -> int:
+        """Method to end the memory peak of a stage, returns the peak in bytes."""
+        with self._memory_lock:
+            self._update_peaks()
+            self._open.discard(stage)
+        return stage._peak - stage._start
+
+    def _update_peaks(self) -> None:
+        # tracemalloc keeps one peak for the process, it is handed to every
+        # running stage before it is reset for the stage entering or leaving
+        current, peak = tracemalloc.get_traced_memory()
+        if _reset_peak is not None:
+            _reset_peak()
+        elif peak > self._last_peak:
+            # a new peak was reached since the last update
+            self._last_peak = peak
+        else:
+            peak = current
+        for stage in self._open:
+            stage._peak = max(stage._peak, peak)
+
+    def add(self, name: str, elapsed: float, rows: int = None, peak: int = None) -> None:
+        """Method to add one call of a stage."""
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = {
+                    "calls": 0,
+                    "time": 0.0,
+                    "rows": 0,
+                    "peak_memory": None,
+                }
+            stats["calls"] += 1
+            stats["time"] += elapsed
+            if rows is not None:
+                stats["rows"] += int(rows)
+            if peak is not None:
+                stats["peak_memory"] = max(stats["peak_memory"] or 0, int(peak))
+
+    def reset(self) -> None:
+        """Method to drop the collected statistics."""
+        with self._lock:
+            self.stages = {}
+
+    def to_dict(self) -> dict:
+        """
+        Method to return the statistics as a dict with the stages in the
+        order they were first entered.
+
+        Returns:
+        --------
+        {"memory": bool, "stages": {name: {"calls", "time", "rows", "peak_memory"}}}
+        with time in seconds and peak_memory in bytes (None without memory)
+
+        """
+        with self._lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+        return {"memory": self.memory, "stages": stages}
+
+    def to_json(self, filename: str = None, **kwargs) -> str:
+        """Method to return the statistics as JSON and write them to filename if given."""
+        string = json.dumps(self.to_dict(), **kwargs)
+        if filename is not None:
+            with open(filename, "w") as f:
+                f.write(string)
+        return string
+
+    def report(self) -> str:
+        """Method to format the statistics as a table, slowest stage first."""
+        stages = self.to_dict()["stages"]
+        width = max(map(len, stages), default=0) + 2
+        lines = [
+            "{:{}} {:>8} {:>12} {:>12} {:>12}".format(
+                "stage", width, "calls", "time [ms]", "rows", "peak [MB]"
+            )
+        ]
+        for name, stats in sorted(stages.items(), key=lambda item: -item[1]["time"]):
+            peak = stats["peak_memory"]
+            lines.append(
+                "{:{}} {:8d} {:12.2f} {:12d} {:>12}".format(
+                    name,
+                    width,
+                    stats["calls"],
+                    1e3 * stats["time"],
+                    stats["rows"],
+                    "-" if peak is None else "{:.2f}".format(peak / 1024**2),
+                )
+            )
+        return "\n".join(lines)
+
+
+class _Stage:
+    """Context manager timing one call of a stage, rows can be set while it runs."""
+
+    __slots__ = ("profile", "name", "rows", "_t0", "_start", "_peak")
+
+    def __init__(self, profile: StageProfile, name: str, rows: int = None):
+        self.profile = profile
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        if self.profile.memory:
+            self.profile._enter_memory(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._t0
+        peak = self.profile._exit_memory(self) if self.profile.memory else None
+        self.profile.add(self.name, elapsed, self.rows, peak)
+        return False
+
+
+class _NullStage:
+    """Stage used while profiling is disabled, does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def rows(self):
+        return None
+
+    @rows.setter
+    def rows(self, rows):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+# profile the stages are collected in, None while disabled
+_ACTIVE = None
+# True if tracemalloc was started by enable and has to be stopped by disable
+_TRACING = False
+
+
+def stage(name: str, rows: int = None):
+    """
+    Method to return a context manager timing a stage, e.g.
+
+        with stage("parse.build_table") as timing:
+            ...
+            timing.rows = len(df)
+
+    While profiling is disabled a shared no-op context manager is
+    returned, so the cost is a single function call.
+
+    Arguments:
+    ----------
+    name    : str
+        name of the stage, "<area>.<step>" by convention
+    rows    : int
+        number of rows processed, can also be set on the returned object
+
+    """
+    profile = _ACTIVE
+    if profile is None:
+        return _NULL_STAGE
+    return _Stage(profile, name, rows)
+
+
+def timed(name: str, rows=None):
+    """
+    Decorator to time every call of a function as a stage.
+
+    Arguments:
+    ----------
+    name    : str
+        name of the stage
+    rows    : callable
+        called with the arguments of the function after it returned,
+        returns the number of rows processed
+
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return func(*args, **kwargs)
+            with stage(name) as timing:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    timing.rows = rows(*args, **kwargs)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_profile() -> StageProfile:
+    """Method to return the active profile, None while profiling is disabled."""
+    return _ACTIVE
+
+
+def enable(memory: bool = False) -> StageProfile:
+    """Method to start collecting the stages in a new profile, which is returned."""
+    global _ACTIVE, _TRACING
+    disable()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _TRACING = True
+    _ACTIVE = StageProfile(memory)
+    return _ACTIVE
+
+
+def disable() -> StageProfile:
+    """Method to stop collecting the stages, returns the profile collected."""
+    global _ACTIVE, _TRACING
+    profile, _ACTIVE = _ACTIVE, None
+    if _TRACING:
+        tracemalloc.stop()
+        _TRACING = False
+    return profile
+
+
+@contextmanager
+def profiling(memory: bool = False):
+    """
+    Context manager collecting the stages run inside it, e.g.
+
+        with profiling() as profile:
+            lattice.load_from_madx_sequence_file("ring.seq")
+            lattice.export_all("out")
+        profile.to_json("stages.json")
+
+    The profile active before is restored on exit.
+
+    Arguments:
+    ----------
+    memory  : bool
+        measure peak memory (see StageProfile)
+
+    """
+    global _ACTIVE
+    previous = _ACTIVE
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    profile = _ACTIVE = StageProfile(memory)
+    try:
+        yield profile
+    finally:
+        _ACTIVE = previous
+        if started:
+            tracemalloc.stop()
+
+
+def _enable_from_env() -> None:
+    """Method to enable profiling of the process from PROFILE_ENV, reported at exit."""
+    value = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return
+
+    profile = enable(memory=value == "memory")
+    filename = os.environ.get(PROFILE_FILE_ENV)
+
+    def report():
+        if filename:
+            profile.to_json(filename, indent=2)
+        else:
+            print(profile.report(), file=sys.stderr)
+
+    atexit.register(report)
+
+
+_enable_from_env()
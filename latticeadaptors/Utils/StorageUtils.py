@@ -0,0 +1,296 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# bump when the layout of the stored arrays changes
+STORAGE_FORMAT = 1
+
+
+def _null_mask(values: np.ndarray) -> np.ndarray:
+    """Method to return the mask of missing values of an object array."""
+    return pd.isna(values)
+
+
+def _object_kind(values: np.ndarray, mask: np.ndarray) -> str:
+    """Method to determine how an object column can be stored without pickling."""
+    present = values[~mask]
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    if all(isinstance(v, (bool, np.bool_)) for v in present):
+        return "bool"
+    return "object"
+
+
+def table_to_arrays(name: str, length: float, df: pd.DataFrame) -> (dict, dict):
+    """
+    Method to convert a sequence table to a columnar form consisting
+    of plain NumPy arrays and a json serializable schema.
+
+    Arguments:
+    ----------
+    name    : str
+        name of the sequence
+    length  : float
+        length of the sequence
+    df      : pd.DataFrame
+        sequence table
+
+    Returns:
+    --------
+    meta    : dict
+        schema of the table (name, length, columns, kinds and dtypes)
+    arrays  : dict
+        NumPy arrays keyed by storage key
+
+    """
+    meta = {
+        "format": STORAGE_FORMAT,
+        "name": name,
+        "length": length,
+        "rows": len(df),
+        "columns": [],
+        "index": None,
+    }
+    arrays = {}
+
+    if not isinstance(df.index, pd.RangeIndex):
+        arrays["index"] = df.index.to_numpy()
+        meta["index"] = "array"
+    elif not (df.index.start == 0 and df.index.step == 1):
+        meta["index"] = [df.index.start, df.index.stop, df.index.step]
+
+    for i, column in enumerate(df.columns):
+        key = "c{}".format(i)
+        series = df[column]
+        dtype = series.dtype
+
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = series.cat.categories.to_numpy()
+            kind = "category"
+            arrays[key] = series.cat.codes.to_numpy()
+            arrays[key + "_categories"] = (
+                categories.astype(str) if len(categories) > 0 else np.array([], dtype=str)
+            )
+        elif isinstance(dtype, pd.BooleanDtype):
+            kind = "boolean"
+            arrays[key] = series.fillna(False).to_numpy(dtype=bool)
+            arrays[key + "_mask"] = series.isna().to_numpy()
+        elif isinstance(dtype, pd.SparseDtype):
+            kind = "sparse"
+            arrays[key] = series.array.sp_values
+            arrays[key + "_index"] = series.array.sp_index.indices
+        elif isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+            kind = "numpy"
+            arrays[key] = series.to_numpy()
+        else:
+            values = series.to_numpy(dtype=object)
+            mask = _null_mask(values)
+            kind = _object_kind(values, mask)
+            if kind == "str":
+                filled = values.copy()
+                filled[mask] = ""
+                arrays[key] = filled.astype(str) if len(filled) > 0 else np.array([], dtype=str)
+                arrays[key + "_mask"] = mask
+            elif kind == "bool":
+                filled = values.copy()
+                filled[mask] = False
+                arrays[key] = filled.astype(bool)
+                arrays[key + "_mask"] = mask
+            else:
+                arrays[key] = values
+
+        meta["columns"].append({"name": column, "kind": kind, "dtype": str(dtype)})
+        if kind == "sparse":
+            meta["columns"][-1]["fill_value"] = dtype.fill_value
+
+    return meta, arrays
+
+
+def _categorical(codes: np.ndarray, categories: np.ndarray) -> pd.Categorical:
+    """
+    Method to rebuild a stored categorical column. The categories were
+    validated when the column was created, so the checks of from_codes
+    (unique, not null) are skipped where pandas allows it.
+    """
+    categories = pd.Index(categories.astype(object), dtype=object)
+    try:
+        dtype = pd.CategoricalDtype._from_fastpath(categories, False)
+        return pd.Categorical._simple_new(np.asarray(codes), dtype)
+    except (AttributeError, TypeError):
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def arrays_to_table(meta: dict, arrays) -> (str, float, pd.DataFrame):
+    """
+    Method to rebuild the sequence table from the output of table_to_arrays.
+    The arrays can be any mapping, e.g. a loaded npz file or memory
+    mapped npy files.
+    """
+    columns = {}
+    for i, column in enumerate(meta["columns"]):
+        key = "c{}".format(i)
+        kind = column["kind"]
+        values = arrays[key]
+
+        if kind == "category":
+            columns[column["name"]] = _categorical(values, arrays[key + "_categories"])
+        elif kind == "boolean":
+            columns[column["name"]] = pd.arrays.BooleanArray(
+                np.asarray(values), np.asarray(arrays[key + "_mask"])
+            )
+        elif kind == "sparse":
+            dense = np.full(meta["rows"], column["fill_value"], dtype=values.dtype)
+            dense[np.asarray(arrays[key + "_index"])] = values
+            columns[column["name"]] = pd.arrays.SparseArray(dense, fill_value=column["fill_value"])
+        elif kind in ("str", "bool"):
+            restored = np.asarray(values).astype(object)
+            restored[np.asarray(arrays[key + "_mask"])] = np.nan
+            columns[column["name"]] = restored
+        else:
+            columns[column["name"]] = values
+
+    index = None
+    if meta["index"] == "array":
+        index = arrays["index"]
+    elif meta["index"] is not None:
+        index = pd.RangeIndex(*meta["index"])
+
+    if columns:
+        df = pd.DataFrame(columns, index=index, copy=False)
+    else:
+        df = pd.DataFrame(index=index)
+
+    return meta["name"], meta["length"], df
+
+
+def needs_pickle(meta: dict) -> bool:
+    """Method to check if any of the stored columns is a generic object array."""
+    return any(column["kind"] == "object" for column in meta["columns"])
+
+
+def _check_pickle(meta: dict, allow_pickle: bool) -> None:
+    """Method to raise if the table has pickled columns and pickling is not allowed."""
+    if not allow_pickle and needs_pickle(meta):
+        raise ValueError(
+            "Table has object columns that are stored pickled, "
+            "use allow_pickle=True for trusted files only"
+        )
+
+
+def save_table_npz(
+    name: str, length: float, df: pd.DataFrame, file, allow_pickle: bool = True
+) -> None:
+    """
+    Method to save a sequence table as a single uncompressed npz file.
+    With allow_pickle=False tables with object columns raise a ValueError.
+    """
+    meta, arrays = table_to_arrays(name, length, df)
+    _check_pickle(meta, allow_pickle)
+    np.savez(file, __meta__=np.array(json.dumps(meta)), **arrays)
+
+
+def load_table_npz(file, allow_pickle: bool = False) -> (str, float, pd.DataFrame):
+    """
+    Method to load a sequence table saved with save_table_npz. Tables with
+    object columns are only unpickled with allow_pickle=True, else a
+    ValueError is raised.
+    """
+    with np.load(file, allow_pickle=False) as data:
+        meta = json.loads(str(data["__meta__"]))
+
+    _check_pickle(meta, allow_pickle)
+    with np.load(file, allow_pickle=needs_pickle(meta)) as data:
+        arrays = {key: data[key] for key in data.files if key != "__meta__"}
+
+    return arrays_to_table(meta, arrays)
+
+
+def save_table_npy(name: str, length: float, df: pd.DataFrame, directory) -> None:
+    """
+    Method to save a sequence table as a directory with one npy file
+    per column array and the schema in meta.json.
+
+    Arguments:
+    ----------
+    name        : str
+        name of the sequence
+    length      : float
+        length of the sequence
+    df          : pd.DataFrame
+        sequence table
+    directory   : str
+        directory to write to, created if needed, an earlier save is replaced
+
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    meta, arrays = table_to_arrays(name, length, df)
+    # the arrays may be memory mapped from an earlier save to the same directory,
+    # so they are written to temporary files first and moved in place afterwards
+    written = []
+    try:
+        for key, values in arrays.items():
+            tmp = directory / (key + ".npy.tmp")
+            with tmp.open("wb") as f:
+                np.save(f, values, allow_pickle=values.dtype == object)
+            written.append(tmp)
+    except BaseException:
+        for tmp in written + [directory / (key + ".npy.tmp")]:
+            tmp.unlink(missing_ok=True)
+        raise
+    for tmp in written:
+        os.replace(tmp, tmp.with_suffix(""))
+
+    # remove arrays of an earlier save that are not part of this one
+    for path in directory.glob("*.npy"):
+        if path.stem not in arrays:
+            path.unlink()
+
+    # the schema is written last, a table is only complete with it
+    meta["arrays"] = sorted(arrays)
+    tmp = directory / "meta.json.tmp"
+    with tmp.open("w") as f:
+        json.dump(meta, f)
+    tmp.replace(directory / "meta.json")
+
+
+def load_table_npy(
+    directory, mmap: bool = True, allow_pickle: bool = False
+) -> (str, float, pd.DataFrame):
+    """
+    Method to load a sequence table saved with save_table_npy.
+
+    Arguments:
+    ----------
+    directory   : str
+        directory the table was saved to
+    mmap        : bool
+        memory map the arrays instead of reading them, numeric columns
+        of the table then use the mapped memory directly (copy on write,
+        changes to the table are not written back to disk)
+    allow_pickle: bool
+        load object columns, which are stored pickled, else a ValueError
+        is raised for tables having them, only use for trusted files
+
+    """
+    directory = Path(directory)
+    with (directory / "meta.json").open() as f:
+        meta = json.load(f)
+
+    if meta.get("format") != STORAGE_FORMAT:
+        raise ValueError("Unsupported storage format: {}".format(meta.get("format")))
+    _check_pickle(meta, allow_pickle)
+
+    pickled = {"c{}".format(i) for i, c in enumerate(meta["columns"]) if c["kind"] == "object"}
+    arrays = {}
+    for key in meta["arrays"]:
+        if key in pickled:
+            arrays[key] = np.load(directory / (key + ".npy"), allow_pickle=True)
+        else:
+            arrays[key] = np.load(directory / (key + ".npy"), mmap_mode="c" if mmap else None)
+
+    return arrays_to_table(meta, arrays)
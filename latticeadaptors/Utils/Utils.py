@@ -1,3 +1,8 @@
+import io
+
+from .ProfileUtils import stage
+
+
 def is_number(s):
     """Method to check if a value is a number or not."""
     try:
@@ -37,6 +42,51 @@ def save_string(string, file):
         f.write(string)
 
 
+def _is_binary_stream(stream) -> bool:
+    """Method to check if a file-like object expects bytes instead of str."""
+    if isinstance(stream, io.TextIOBase):
+        return False
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return "b" in str(getattr(stream, "mode", ""))
+
+
+def write_chunks(chunks, stream, buffersize: int = 1 << 16, encoding: str = "utf-8") -> None:
+    """
+    Method to write string chunks to a text or binary file-like object
+    (e.g. an open file, a gzip/lzma stream or the stdin of a subprocess).
+    Chunks are collected up to buffersize characters and written at once,
+    so neither the output as a whole nor many tiny writes are needed.
+
+    Arguments:
+    ----------
+    chunks      : iterable of str
+        output pieces in order
+    stream      : file-like
+        object with a write method, opened in text or binary mode
+    buffersize  : int
+        number of characters collected before a write
+    encoding    : str
+        encoding used for binary streams
+
+    """
+    binary = _is_binary_stream(stream)
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffersize:
+            data = "".join(buffer)
+            with stage("write"):
+                stream.write(data.encode(encoding) if binary else data)
+            buffer, size = [], 0
+
+    if buffer:
+        data = "".join(buffer)
+        with stage("write"):
+            stream.write(data.encode(encoding) if binary else data)
+
+
 def highlight_cells(data, _list=[], color="yellow"):
     attr = "background-color: {}".format(color)
     if data.ndim == 1:
@@ -1,38 +1,52 @@
 __version__ = "0.1.0"
 
-from .core import LatticeAdaptor
+from importlib import import_module
 
-# from .parsers.madx_seq_parser import parse_from_madx_sequence_file, parse_from_madx_sequence_string
-# from .parsers.TableParsers import (
-#    parse_table_to_elegant_file,
-#    parse_table_to_elegant_string,
-#    parse_table_to_madx_install_str,
-#    parse_table_to_madx_remove_str,
-#    parse_table_to_madx_sequence_file,
-#    parse_table_to_madx_sequence_string,
-#    parse_table_to_tracy_file,
-#    parse_table_to_tracy_string,
-# )
-# from .Utils.LatticeUtils import (
-#    compare_seq_center_positions,
-#    compare_settings_dicts,
-#    dipole_split_angles_to_dict,
-#    print_twiss_summ,
-#    split_dipoles,
-# )
-# from .Utils.MadxUtils import install_start_end_marker
-# from .Utils.PlotUtils import (
-#    Beamlinegraph_compare_from_seq_files,
-#    Beamlinegraph_from_seq_file,
-#    draw_brace,
-#    twissplot,
-# )
-# from .Utils.Utils import (
-#    delete_first_line,
-#    filter_family,
-#    highlight_cells,
-#    highlight_row,
-#    is_number,
-#    rotate,
-#    save_string,
-# )
+# public names and the module defining them, imported on first access so
+# that importing the package does not load pandas, lark, cpymad or matplotlib
+_EXPORTS = {
+    "LatticeAdaptor": ".core",
+    "parse_from_madx_sequence_file": ".parsers.madx_seq_parser",
+    "parse_from_madx_sequence_string": ".parsers.madx_seq_parser",
+    "parse_table_to_elegant_file": ".parsers.TableParsers",
+    "parse_table_to_elegant_string": ".parsers.TableParsers",
+    "parse_table_to_madx_install_str": ".parsers.TableParsers",
+    "parse_table_to_madx_remove_str": ".parsers.TableParsers",
+    "parse_table_to_madx_sequence_file": ".parsers.TableParsers",
+    "parse_table_to_madx_sequence_string": ".parsers.TableParsers",
+    "parse_table_to_tracy_file": ".parsers.TableParsers",
+    "parse_table_to_tracy_string": ".parsers.TableParsers",
+    "compare_lattices": ".Utils.LatticeUtils",
+    "compare_seq_center_positions": ".Utils.LatticeUtils",
+    "compare_settings_dicts": ".Utils.LatticeUtils",
+    "dipole_split_angles_to_dict": ".Utils.LatticeUtils",
+    "print_twiss_summ": ".Utils.LatticeUtils",
+    "split_dipoles": ".Utils.LatticeUtils",
+    "install_start_end_marker": ".Utils.MadxUtils",
+    "profiling": ".Utils.ProfileUtils",
+    "Beamlinegraph_compare_from_seq_files": ".Utils.PlotUtils",
+    "Beamlinegraph_from_seq_file": ".Utils.PlotUtils",
+    "draw_brace": ".Utils.PlotUtils",
+    "twissplot": ".Utils.PlotUtils",
+    "delete_first_line": ".Utils.Utils",
+    "filter_family": ".Utils.Utils",
+    "highlight_cells": ".Utils.Utils",
+    "highlight_row": ".Utils.Utils",
+    "is_number": ".Utils.Utils",
+    "rotate": ".Utils.Utils",
+    "save_string": ".Utils.Utils",
+}
+
+__all__ = ["__version__", *_EXPORTS]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -1,55 +1,271 @@
-import queue
-from copy import deepcopy
+import numpy as np
+import pandas as pd
 
-from cpymad.madx import Madx
-
-from .parsers.madx_seq_parser import parse_from_madx_sequence_file, parse_from_madx_sequence_string
+from .parsers.madx_seq_parser import (
+    IncrementalSequenceParser,
+    parse_from_madx_sequence_file,
+    parse_from_madx_sequence_string,
+)
 from .parsers.TableParsers import (
+    EXPORT_FORMATS,
     _parse_table_to_madx_definitions,
+    export_table,
     parse_table_to_elegant_file,
+    parse_table_to_elegant_stream,
     parse_table_to_elegant_string,
     parse_table_to_madx_install_str,
     parse_table_to_madx_remove_str,
     parse_table_to_madx_sequence_file,
+    parse_table_to_madx_sequence_stream,
     parse_table_to_madx_sequence_string,
     parse_table_to_tracy_file,
+    parse_table_to_tracy_stream,
     parse_table_to_tracy_string,
 )
-from .Utils.MadxUtils import install_start_end_marker
-from .Utils.PlotUtils import (
-    Beamlinegraph_compare_from_seq_files,
-    Beamlinegraph_from_seq_file,
-    draw_brace,
+from .Utils.CompactUtils import (
+    compact_table,
+    dense_table,
+    is_sparse,
+    set_rows,
+    table_memory_report,
 )
+from .Utils.HistoryUtils import DEFAULT_MAX_DEPTH, DEFAULT_MAX_MEMORY, HistoryJournal
+from .Utils.IndexUtils import PositionIndex, TableIndex
+from .Utils.LatticeUtils import DEFAULT_TOLERANCE, add_drifts_to_table, compare_lattices
+from .Utils.MadxUtils import MadxPool, install_start_end_marker, new_madx, table_to_madx
+from .Utils.ProfileUtils import timed
+from .Utils.StorageUtils import load_table_npy, save_table_npy
 from .Utils.Utils import save_string
 
 
+def _table_rows(self, *args, **kwargs) -> int:
+    """Method to return the number of rows of the lattice table, for the timed methods."""
+    return 0 if self.table is None else len(self.table)
+
+
 class LatticeAdaptor:
     """Class to convert lattices."""
 
     def __init__(self, **kwargs):
+        # store the table in compact form, see CompactUtils.compact_table
+        self._compact = kwargs.get("compact", False)
+
         self.name = kwargs.get("name", None)
         self.len = kwargs.get("len", 0.0)
         self.table = kwargs.get("table", None)
         self.filename = kwargs.get("file", None)
         self.inputstr = kwargs.get("string", None)
 
-        # roll back
-        self.history = queue.LifoQueue()
+        # parser of the last incremental load, see _incremental_parser
+        self._incremental = None
 
-    def load_from_madx_sequence_string(self, string: str) -> None:
-        """Load lattice from sequence as string"""
         # roll back
-        self.history.put((deepcopy(self.name), deepcopy(self.len), deepcopy(self.table)))
+        self.history = HistoryJournal(
+            kwargs.get("history_depth", DEFAULT_MAX_DEPTH),
+            kwargs.get("history_memory", DEFAULT_MAX_MEMORY),
+        )
 
-        self.name, self.len, self.table = parse_from_madx_sequence_string(string)
+    @timed("lattice.load_from_madx_sequence_string", rows=_table_rows)
+    def load_from_madx_sequence_string(self, string: str, incremental: bool = False) -> None:
+        """
+        Load lattice from sequence as string.
 
-    def load_from_madx_sequence_file(self, filename: str) -> None:
-        """Load lattice from sequence in file"""
-        # roll back
-        self.history.put((deepcopy(self.name), deepcopy(self.len), deepcopy(self.table)))
+        With incremental=True only the statements that changed since the
+        previous incremental load are parsed again and patched into the
+        current table in place (see IncrementalSequenceParser).
+        """
+        if incremental:
+            parser = self._incremental_parser()
+            self._load_incremental(parser, *parser.prepare(string))
+        else:
+            result = parse_from_madx_sequence_string(string)
+            with self._record(columns=()):
+                self.name, self.len, self.table = result
+
+    @timed("lattice.load_from_madx_sequence_file", rows=_table_rows)
+    def load_from_madx_sequence_file(self, filename: str, incremental: bool = False) -> None:
+        """Load lattice from sequence in file, see load_from_madx_sequence_string."""
+        if incremental:
+            parser = self._incremental_parser()
+            self._load_incremental(parser, *parser.prepare_file(filename))
+        else:
+            result = parse_from_madx_sequence_file(filename)
+            with self._record(columns=()):
+                self.name, self.len, self.table = result
+
+    @timed("lattice.save_binary", rows=_table_rows)
+    def save_binary(self, directory: str) -> None:
+        """
+        Method to save name, length and table in a binary columnar form,
+        one npy file per column plus the schema in meta.json.
+        """
+        save_table_npy(self.name, self.len, self.table, directory)
+
+    @timed("lattice.load_binary", rows=_table_rows)
+    def load_binary(self, directory: str, mmap: bool = True, allow_pickle: bool = False) -> None:
+        """
+        Load lattice saved with save_binary. With mmap=True the numeric
+        columns are memory mapped (copy on write) instead of read. Object
+        columns are stored pickled and only loaded with allow_pickle=True.
+        """
+        result = load_table_npy(directory, mmap=mmap, allow_pickle=allow_pickle)
+        with self._record(columns=()):
+            self.name, self.len, self.table = result
+
+    @property
+    def table(self):
+        """Sequence table, setting it drops the indexes and the incremental parser."""
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        self._table = compact_table(table) if self._compact else dense_table(table)
+        self.invalidate_indexes()
+        # the incremental parser no longer knows the table, incremental
+        # loads attach theirs again
+        self._incremental = None
+
+    @property
+    def compact(self) -> bool:
+        """
+        Store the table in compact form: categorical name and family and
+        sparse attribute columns for the attributes only a few families
+        use. The table keeps its DataFrame API. Incremental loads patch
+        the dense table kept by the incremental parser and copy the changed
+        values into the compact table, so while incremental loads are used
+        a dense copy of the table is kept as well.
+        """
+        return self._compact
+
+    @compact.setter
+    def compact(self, compact: bool):
+        self._compact = compact
+        self.table = self._table
 
-        self.name, self.len, self.table = parse_from_madx_sequence_file(filename)
+    def memory_report(self) -> dict:
+        """
+        Method to report the memory used by the table, its dense and its
+        compact form (see CompactUtils.table_memory_report) and the history.
+        """
+        report = table_memory_report(self.table) if self.table is not None else {}
+        report["history"] = self.history.nbytes
+        return report
+
+    def invalidate_indexes(self) -> None:
+        """
+        Method to drop the indexes on the table, needed after changing
+        the table directly instead of through the methods of this class.
+        """
+        self._indexes = {}
+
+    def _drop_indexes(self, column: str) -> None:
+        """Method to drop the indexes that depend on a column."""
+        self._indexes = {key: index for key, index in self._indexes.items() if column not in key}
+
+    def _index(self, column: str) -> TableIndex:
+        """Method to return the index of a table column, built on first use."""
+        index = self._indexes.get((column,), None)
+        if index is None:
+            index = self._indexes[(column,)] = TableIndex(self.table[column])
+        return index
+
+    def _position_index(self) -> PositionIndex:
+        """Method to return the index of the element positions, built on first use."""
+        index = self._indexes.get(("pos", "L"), None)
+        if index is None or index.length != (self.len or None):
+            L = self.table["L"].to_numpy() if "L" in self.table else np.zeros(len(self.table))
+            index = PositionIndex(self.table["pos"].to_numpy(), L, self.len)
+            self._indexes[("pos", "L")] = index
+        return index
+
+    def _select(self, selections: list) -> pd.DataFrame:
+        frames = [self.table.iloc[selection] for selection in selections]
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+    def elements_between(self, start: float, stop: float) -> pd.DataFrame:
+        """
+        Method to return the elements overlapping [start, stop], in order
+        along the ring from start (ranges past the end of the sequence
+        continue at its start). The result is a view of the table if the
+        rows are contiguous, changes to it may change the table.
+        """
+        return self._select(self._position_index().overlapping(start, stop))
+
+    def element_at(self, s: float) -> pd.DataFrame:
+        """Method to return the element(s) covering position s, see elements_between."""
+        return self._select([self._position_index().at(s)])
+
+    def nearest_element(self, family: str, s: float) -> pd.DataFrame:
+        """
+        Method to return the element of a family with the centre closest
+        to position s (on the ring), as a one row view of the table.
+        """
+        index = self._position_index()
+        if family not in index.groups:
+            index.add_group(family, self._index("family").get(family))
+        row = index.nearest(s, family)
+        return self.table.iloc[slice(0, 0) if row is None else slice(row, row + 1)]
+
+    def undo(self) -> bool:
+        """Method to undo the last change of the lattice, returns False if there is none."""
+        self._incremental = None
+        self.invalidate_indexes()
+        return self.history.undo(self)
+
+    def redo(self) -> bool:
+        """Method to redo the last undone change of the lattice, returns False if there is none."""
+        self._incremental = None
+        self.invalidate_indexes()
+        return self.history.redo(self)
+
+    def _record(self, columns=None):
+        """
+        Method to record a change of the lattice in the history, see
+        HistoryJournal.record. The incremental parser no longer knows the
+        changed table, it is dropped (incremental loads attach theirs again).
+        """
+        self._incremental = None
+        return self.history.record(self, columns=columns)
+
+    def _load_incremental(self, parser: IncrementalSequenceParser, columns, parse) -> None:
+        """
+        Method to load the result of an incremental parse prepared by the
+        parser. Only the columns the parser patches are recorded, a full
+        parse (columns None) replaces the table. In compact mode the
+        changed values of the patched columns are copied into the compact
+        table, instead of converting the patched table of the parser again.
+        """
+        with self._record(columns=columns or ()):
+            name, length, table = parse()
+            current = self._table
+            if (
+                self._compact
+                and columns is not None
+                and current is not None
+                and len(current) == len(table)
+                and all(column in current.columns for column in columns)
+            ):
+                for column in columns:
+                    series = current[column]
+                    old = (series.sparse.to_dense() if is_sparse(series) else series).to_numpy()
+                    new = table[column].to_numpy()
+                    rows = np.flatnonzero(~((old == new) | (pd.isna(old) & pd.isna(new))))
+                    if len(rows) > 0:
+                        set_rows(current, column, rows, new[rows])
+                self.invalidate_indexes()
+                self.name, self.len = name, length
+            else:
+                self.name, self.len, self.table = name, length, table
+        self._incremental = parser
+
+    def _incremental_parser(self) -> IncrementalSequenceParser:
+        """
+        Method to return the parser of the last incremental load, a new one
+        if the lattice was changed since (see _record and the table setter).
+        """
+        if self._incremental is None:
+            return IncrementalSequenceParser()
+        return self._incremental
 
     def parse_table_to_madx_sequence_string(self):
         """Parse table to madx sequence and return it as a string"""
@@ -59,6 +275,10 @@ class LatticeAdaptor:
         """Parse table to madx sequence and write to file"""
         parse_table_to_madx_sequence_file(self.name, self.len, self.table, filename)
 
+    def parse_table_to_madx_sequence_stream(self, stream):
+        """Parse table to madx sequence and write it in chunks to a text or binary stream"""
+        parse_table_to_madx_sequence_stream(self.name, self.len, self.table, stream)
+
     def parse_table_to_elegant_string(self):
         """Parse table to elegant lattice file and return as string."""
         return parse_table_to_elegant_string(self.name, self.table)
@@ -67,6 +287,10 @@ class LatticeAdaptor:
         """Parse table to elegant lattice and write to file"""
         parse_table_to_elegant_file(self.name, self.table, filename)
 
+    def parse_table_to_elegant_stream(self, stream):
+        """Parse table to elegant lattice and write it in chunks to a text or binary stream"""
+        parse_table_to_elegant_stream(self.name, self.table, stream)
+
     def parse_table_to_tracy_string(self):
         """Parse table to tracy lattice file and return as string."""
         return parse_table_to_tracy_string(self.name, self.table)
@@ -75,6 +299,60 @@ class LatticeAdaptor:
         """Parse table to tracy lattice and write to file"""
         parse_table_to_tracy_file(self.name, self.table, filename)
 
+    def parse_table_to_tracy_stream(self, stream):
+        """Parse table to tracy lattice and write it in chunks to a text or binary stream"""
+        parse_table_to_tracy_stream(self.name, self.table, stream)
+
+    @timed("lattice.export_all", rows=_table_rows)
+    def export_all(
+        self,
+        formats=tuple(EXPORT_FORMATS),
+        directory: str = ".",
+        workers: int = None,
+        processes: bool = False,
+    ) -> dict:
+        """
+        Method to export the lattice to several formats concurrently
+        from one shared normalized table, see TableParsers.export_table.
+
+        Arguments:
+        ----------
+        formats     : iterable of str
+            export formats, any of "madx", "elegant" and "tracy"
+        directory   : str
+            directory to write the files to, named after the lattice
+        workers     : int
+            number of threads (or processes), defaults to one per format
+        processes   : bool
+            use a process pool instead of a thread pool
+
+        Returns:
+        --------
+        dict with the filename and the time in seconds per format
+
+        """
+        return export_table(self.name, self.len, self.table, formats, directory, workers, processes)
+
+    @timed("lattice.to_madx", rows=_table_rows)
+    def to_madx(self, madx=None):
+        """
+        Method to load the lattice into MAD-X without the sequence file
+        round trip, see MadxUtils.table_to_madx. A new MAD-X instance is
+        started if none is given, the instance is returned.
+        """
+        if madx is None:
+            madx = new_madx(stdout=False)
+        table_to_madx(madx, self.name, self.len, self.table)
+        return madx
+
+    def madx_pool(self, workers: int = 1, **kwargs) -> MadxPool:
+        """
+        Method to start a pool of warm MAD-X workers with this lattice as
+        base sequence, see MadxUtils.MadxPool. Variants are submitted as
+        deltas, e.g. pool.submit({"strengths": {"K1": {"QF": 1.3}}}).
+        """
+        return MadxPool.from_lattice(self, workers, **kwargs)
+
     def madx_sequence_add_start_end_marker_string(self):
         """Return madx string to install marker at start and at end of lattice"""
         return install_start_end_marker(self.name, self.len)
@@ -94,45 +372,28 @@ class LatticeAdaptor:
         """
         return "SAVE, SEQUENCE={}, file='{}';".format(self.name, filename)
 
-    def add_drifts(self):
-        """Method to add back drifts to sequence."""
-        self.history.put((deepcopy(self.name), deepcopy(self.len), deepcopy(self.table)))
-
-        df = self.table.copy()
-        df.reset_index(inplace=True, drop=True)
-        name = "D"
-        family = "DRIFT"
-
-        df.loc[df.L.isna(), "L"] = 0
-        newrows = []
-        ndrift = 0
-        for i, row in df.iterrows():
-            # add the row
-            newrows.append(pd.DataFrame(row).T)
-
-            # check if next row
-            if i < len(df) - 1:
-                # check if next row pos is not equal to the current
-                nextrow = df.loc[i + 1]
-                if nextrow["pos"] > row.pos:
-                    ndrift += 1
-                    newrow = {}
-                    newrow["name"] = name + str(ndrift)
-                    newrow["family"] = family
-                    newrow["L"] = np.round(
-                        (nextrow["pos"] - nextrow["L"] / 2.0) - (row["pos"] + row["L"] / 2.0), 6
-                    )
-                    newrow["pos"] = (row["pos"] + row["L"] / 2.0) + (newrow["L"] / 2.0)
-                    newrows.append(pd.Series(newrow).to_frame().T)
-        if nextrow["pos"] < self.len:
-            newrow = {}
-            newrow["name"] = name + str(ndrift)
-            newrow["family"] = family
-            newrow["L"] = np.round(self.len - nextrow["pos"], 6)
-            newrow["pos"] = (row["pos"] + row["L"] / 2.0) + (newrow["L"] / 2.0)
-            newrows.append(pd.Series(newrow).to_frame().T)
-
-        self.table = (pd.concat(newrows)).reset_index(drop=True)
+    @timed("lattice.add_drifts", rows=_table_rows)
+    def add_drifts(self, min_gap: float = None):
+        """
+        Method to add back drifts to sequence, see LatticeUtils.add_drifts_to_table.
+
+        Arguments:
+        ----------
+        min_gap     : float
+            only add drifts for gaps longer than min_gap, None to add a drift
+            wherever the next element is further downstream
+
+        """
+        table = add_drifts_to_table(self.table, self.len, min_gap=min_gap)
+        with self._record(columns=()):
+            self.table = table
+
+    def compare(self, other, tolerance: float = DEFAULT_TOLERANCE) -> dict:
+        """
+        Method to compare the element positions with another lattice
+        (LatticeAdaptor, table or madx seq file), see LatticeUtils.compare_lattices.
+        """
+        return compare_lattices(self, other, tolerance)
 
     def parse_table_to_madx_line_string(self):
         """Method to convert table to madx line def lattice file string."""
@@ -156,28 +417,55 @@ class LatticeAdaptor:
         """Method to convert table to madx line def lattice file string and write to file."""
         save_string(self.parse_table_to_madx_line(), filename)
 
+    def get_strengths(self, family, column: str, as_dict: bool = True):
+        """
+        Method to return the values of a column for the elements of one
+        or more families.
+
+        Arguments:
+        ----------
+        family      : str or list of str
+            element families, e.g. "QUADRUPOLE"
+        column      : str
+            attribute to return, e.g. "K1"
+        as_dict     : bool
+            return a dict name -> value instead of arrays
+
+        Returns:
+        --------
+        dict name -> value (the last row wins for repeated names) or a
+        tuple of NumPy arrays (names, values) with one entry per row in
+        table order
+
+        """
+        families = [family] if isinstance(family, str) else list(family)
+        rows = np.sort(self._index("family").lookup(families)[0])
+
+        names = self.table["name"].to_numpy(dtype=object)[rows]
+        values = self.table[column].to_numpy()[rows]
+        if as_dict:
+            return dict(zip(names.tolist(), values.tolist()))
+        return names, values
+
     def get_quad_strengths(self):
         """Method to return quadrupole strengths as a dict."""
-        return (
-            self.table.loc[self.table.family == "QUADRUPOLE", ["name", "K1"]]
-            .set_index("name", drop=True)
-            .to_dict()["K1"]
-        )
+        return self.get_strengths("QUADRUPOLE", "K1")
 
     def get_sext_strengths(self):
         """Method to return sextupole strengths as a dict"""
-        return (
-            self.table.loc[self.table.family == "SEXTUPOLE", ["name", "K2"]]
-            .set_index("name", drop=True)
-            .to_dict()["K2"]
-        )
+        return self.get_strengths("SEXTUPOLE", "K2")
 
+    @timed("lattice.load_strengths_to_table", rows=lambda self, strdc, col: len(strdc))
     def load_strengths_to_table(self, strdc, col):
         """
         Method to load as strength dict to the table, col is the attribute where
         the strengths will be loaded to.
         """
-        self.history.put((deepcopy(self.name), deepcopy(self.len), deepcopy(self.table)))
-
-        for k, v in strdc.items():
-            self.table.loc[self.table["name"] == k, col] = v
+        rows, which = self._index("name").lookup(list(strdc))
+        values = np.asarray(list(strdc.values()))[which]
+
+        with self._record(columns=[col]):
+            if col not in self.table:
+                self.table[col] = np.nan
+            set_rows(self.table, col, rows, values)
+        self._drop_indexes(col)
@@ -1,9 +1,14 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from json import load
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from ..Utils.Utils import save_string
+from ..Utils.ProfileUtils import stage
+from ..Utils.Utils import write_chunks
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -22,16 +27,173 @@ with (BASE_DIR / "../mapfiles/elegant_attribute_map.json").open() as file:
     TO_ELEGANT_ATTR = load(file)
 
 # TRACY
-def _parse_table_to_madx_definitions(df: pd.DataFrame) -> str:
+with (BASE_DIR / "../mapfiles/tracy_columns.json").open() as file:
+    TRACY_ATTRIBUTES = load(file)
+
+with (BASE_DIR / "../mapfiles/tracy_element_map.json").open() as file:
+    TO_TRACY_ELEMENTS = load(file)
+
+# unit conversions from madx to tracy attributes, applied to whole columns
+TRACY_CONVERSIONS = {
+    "T": lambda values, df: np.degrees(values),
+    "Roll": lambda values, df: np.degrees(values),
+    "T1": lambda values, df: np.degrees(values),
+    "T2": lambda values, df: np.degrees(values),
+    "Gap": lambda values, df: 4.0 * values * _float_column(df, "FINT"),
+    "Frequency": lambda values, df: values * 1e6,
+    "Voltage": lambda values, df: values * 1e6,
+    "phi": lambda values, df: values * 360.0,
+}
+
+# element templates per tracy kind, the attributes are put in between
+TRACY_TEMPLATES = {
+    "marker": ("{}: Marker", ";"),
+    "bpm": ("{}: Beam Position Monitor", ";"),
+    "drift": ("{}: Drift", ";"),
+    "bend": ("{}: Bending", ", N = Nbend, Method = 4;"),
+    "quad": ("{}: Quadrupole", ", N = Nquad, Method = 4;"),
+    "sext": ("{}: Sextupole", ", N = Nsext, Method = 4;"),
+    "oct1": ("{}: Multipole", ", N = Nsext, Method = 4;"),
+    "cavity": ("{}: Cavity", ";"),
+}
+
+# columns of the table that are not element attributes
+NON_ATTRIBUTE_COLUMNS = ["name", "at", "family", "end_pos", "sector"]
+
+# number of table rows formatted at once by the streaming writers
+CHUNKSIZE = 10000
+
+
+def _chunks(df, chunksize: int):
+    """Generator of consecutive slices of at most chunksize rows of a table or array."""
+    rows = df.iloc if isinstance(df, (pd.DataFrame, pd.Series)) else df
+    for start in range(0, len(df), chunksize):
+        yield rows[start : start + chunksize]
+
+
+def _iter_joined(names, separator: str, chunksize: int):
+    """Generator of the names joined by separator, chunksize names at a time."""
+    for i, chunk in enumerate(_chunks(names, chunksize)):
+        text = separator.join(chunk)
+        yield separator + text if i > 0 else text
+
+
+def _parse_table_to_madx_definitions(df: pd.DataFrame, engine: str = "vectorized") -> str:
     """
     Method to parse table to MADX sequence file definitions.
 
     Arguments:
     ----------
-    df  : pd.DataFrame
+    df      : pd.DataFrame
         Table containing the elements and their attributes.
+    engine  : str
+        "vectorized" formats the rows in groups of equal family and
+        attributes a column at a time, "rows" formats row by row.
+        Both give identical output.
+
+    """
+    if engine == "vectorized":
+        return _parse_table_to_madx_definitions_vectorized(df)
+    elif engine == "rows":
+        return _parse_table_to_madx_definitions_rows(df)
+    raise ValueError("Unknown writer engine: {}".format(engine))
+
+
+def _attribute_groups(df: pd.DataFrame, columns: list, string_columns: list = ()) -> dict:
+    """
+    Method to group the rows of the table by family, by the attribute
+    columns that are present (not NA) in the row and by which of the
+    string_columns hold a str in the row.
+
+    Returns:
+    --------
+    dict mapping (family, present columns, str columns) to the row numbers of the group
+
+    """
+    families, uniques = pd.factorize(df["family"])
+    # missing families are coded -1
+    uniques = list(uniques) + [np.nan]
+    flags = np.column_stack(
+        [df[columns].notna().to_numpy().reshape(len(df), len(columns))]
+        + [[isinstance(v, str) for v in df[c].to_numpy(dtype=object)] for c in string_columns]
+    )
+    if flags.shape[1] > 0:
+        patterns, pattern_ids = np.unique(flags, axis=0, return_inverse=True)
+    else:
+        patterns, pattern_ids = np.zeros((1, 0), dtype=bool), np.zeros(len(df), dtype=np.intp)
+
+    keys = families * len(patterns) + pattern_ids.reshape(-1)
+    groups = {}
+    for key, rows in pd.Series(keys).groupby(keys).indices.items():
+        family = uniques[key // len(patterns)]
+        pattern = patterns[key % len(patterns)]
+        present = tuple(c for c, p in zip(columns, pattern) if p)
+        strings = tuple(c for c, p in zip(string_columns, pattern[len(columns) :]) if p)
+        groups[family, present, strings] = rows
+
+    return groups
+
+
+def _parse_table_to_madx_definitions_vectorized(df: pd.DataFrame) -> str:
+    """Method to parse table to MADX sequence file definitions a group of rows at a time."""
+    return "".join(_iter_table_to_madx_definitions(df, len(df) or 1))
+
+
+def _element_definitions(df: pd.DataFrame) -> pd.DataFrame:
+    """Method to reduce a sequence table to the unique element definitions."""
+    df = df.drop(columns=["pos", "at"], errors="ignore")
+    return df.drop_duplicates()
+
+
+def _iter_table_to_madx_definitions(
+    df: pd.DataFrame, chunksize: int = CHUNKSIZE, definitions: pd.DataFrame = None
+):
+    """
+    Generator of the MADX definitions, chunksize rows at a time. The
+    definitions can be passed if already computed with _element_definitions.
+    """
+    if definitions is None:
+        definitions = _element_definitions(df)
+    for chunk in _chunks(definitions, chunksize):
+        yield _format_madx_definitions(chunk)
+
 
+def _format_madx_definitions(df: pd.DataFrame) -> str:
     """
+    Method to format the MADX definitions of all rows of the table,
+    rows of the same family and attribute columns share one template.
+    """
+    columns = [c for c in df.columns if c not in NON_ATTRIBUTE_COLUMNS]
+    names = df["name"].to_numpy(dtype=object)
+    lines = np.empty(len(df), dtype=object)
+
+    for (keyword, present, _), rows in _attribute_groups(df, columns).items():
+        # get allowed attrs - to distinguish madx from elegant columns
+        allowed_attrs = MADX_ATTRIBUTES[keyword].keys()
+        head = "{{:16}}: {}".format("{:12}".format(keyword).replace("{", "{{").replace("}", "}}"))
+
+        if len(allowed_attrs) == 0:
+            lines[rows] = list(map((head + ";\n").format, names[rows]))
+            continue
+
+        parts, values = [], []
+        for c in present:
+            column = df[c].to_numpy(dtype=object)[rows]
+            if c in allowed_attrs and c != "NO_CAVITY_TOTALPATH":
+                parts.append("{}:={{}}".format(c))
+                values.append(column)
+            else:
+                parts.append("{}={{}}".format(c))
+                values.append([str(v).lower() for v in column])
+
+        template = head + ", " + ", ".join(parts) + ";\n"
+        lines[rows] = list(map(template.format, names[rows], *values))
+
+    return "".join(lines.tolist())
+
+
+def _parse_table_to_madx_definitions_rows(df: pd.DataFrame) -> str:
+    """Method to parse table to MADX sequence file definitions row by row."""
     # init output
     text = """"""
 
@@ -52,7 +214,7 @@ def _parse_table_to_madx_definitions(df: pd.DataFrame) -> str:
         line += "{:16}: {:12}, ".format(row["name"], keyword)
 
         # remove non attrs from columns
-        row = row.drop(["name", "at", "family", "end_pos", "sector"], errors="ignore").dropna()
+        row = row.drop(NON_ATTRIBUTE_COLUMNS, errors="ignore").dropna()
 
         # add allowed madx attributes
         if len(allowed_attrs) > 0:
@@ -79,6 +241,44 @@ def _parse_table_to_madx_definitions(df: pd.DataFrame) -> str:
     return text
 
 
+def _table_columns(df, columns) -> list:
+    """
+    Method to return the columns of a table as NumPy arrays. The table
+    can be a pd.DataFrame, a dict of arrays or a structured NumPy array.
+    """
+    if isinstance(df, pd.DataFrame):
+        return [df[c].to_numpy(dtype=object if c == "name" else None) for c in columns]
+    return [np.asarray(df[c]) for c in columns]
+
+
+def format_madx_positions(template: str, df, columns: tuple = ("name", "at")) -> str:
+    """
+    Method to format one line per element from whole columns at once,
+    e.g. the name and position of the elements in a sequence.
+
+    Arguments:
+    ----------
+    template    : str
+        format string of a line, filled with the values of the columns
+    df          : pd.DataFrame, dict or structured np.ndarray
+        table with the columns, e.g. {"name": names, "at": positions}
+    columns     : tuple
+        columns filling the template in order
+
+    """
+    return "".join(map(template.format, *(c.tolist() for c in _table_columns(df, columns))))
+
+
+def _iter_formatted(template: str, df, columns, chunksize: int):
+    """Generator of the output of format_madx_positions, chunksize rows at a time."""
+    values = _table_columns(df, columns)
+    n = len(values[0]) if values else 0
+    for start in range(0, n, chunksize):
+        yield "".join(
+            map(template.format, *(c[start : start + chunksize].tolist() for c in values))
+        )
+
+
 def _parse_table_to_madx_sequence_part(name: str, length: float, df: pd.DataFrame) -> str:
     """
     Method to parse a table to the MADX sequence part.
@@ -93,18 +293,35 @@ def _parse_table_to_madx_sequence_part(name: str, length: float, df: pd.DataFram
         length of the sequence (drifts are determined automatically)
 
     """
+    return "".join(_iter_table_to_madx_sequence_part(name, length, df, len(df) or 1))
+
+
+def _iter_table_to_madx_sequence_part(
+    name: str, length: float, df: pd.DataFrame, chunksize: int = CHUNKSIZE
+):
+    """Generator of the MADX sequence part, chunksize rows at a time."""
     # start the sequence definition
-    text = "{}: SEQUENCE, L={};\n".format(name, length)
+    yield "{}: SEQUENCE, L={};\n".format(name, length)
 
-    # loop over the table rows
-    for _, row in df.iterrows():
-        line = "{:11}, at = {:12.6f};\n".format(row["name"], row["at"])
-        text += line
+    yield from _iter_formatted("{:11}, at = {:12.6f};\n", df, ("name", "at"), chunksize)
 
     # close the sequence definition
-    text += "ENDSEQUENCE;"
+    yield "ENDSEQUENCE;"
 
-    return text
+
+def _iter_table_to_madx_sequence(
+    name: str,
+    length: float,
+    df: pd.DataFrame,
+    chunksize: int = CHUNKSIZE,
+    definitions: pd.DataFrame = None,
+):
+    """Generator of the MADX sequence file, chunksize rows at a time."""
+    # parse the element definitions
+    yield from _iter_table_to_madx_definitions(df, chunksize, definitions)
+
+    # parse the element positions
+    yield from _iter_table_to_madx_sequence_part(name, length, df, chunksize)
 
 
 def parse_table_to_madx_sequence_string(name: str, length: float, df: pd.DataFrame) -> str:
@@ -121,20 +338,109 @@ def parse_table_to_madx_sequence_string(name: str, length: float, df: pd.DataFra
         length of the sequence
 
     """
-    # parse the element definitions
-    text = _parse_table_to_madx_definitions(df)
+    with stage("format.madx", rows=len(df)):
+        return "".join(_iter_table_to_madx_sequence(name, length, df))
 
-    # parse the element positions
-    text += _parse_table_to_madx_sequence_part(name, length, df)
 
-    return text
+def parse_table_to_madx_sequence_stream(
+    name: str, length: float, df: pd.DataFrame, stream, chunksize: int = CHUNKSIZE
+) -> None:
+    """
+    Method to parse table to MADX sequence and write it to a stream
+    in chunks, without building the full output in memory.
+
+    Arguments:
+    ----------
+    name        : str
+        name of the sequence
+    length      : float
+        length of the sequence
+    df          : pd.DataFrame
+        table containing the element data
+    stream      : file-like
+        text or binary stream, e.g. an open file, gzip.open(...) or
+        the stdin of a MAD-X subprocess
+    chunksize   : int
+        number of table rows formatted at once
+
+    """
+    with stage("write.madx", rows=len(df)):
+        write_chunks(_iter_table_to_madx_sequence(name, length, df, chunksize), stream)
 
 
 def parse_table_to_madx_sequence_file(
     name: str, length: float, df: pd.DataFrame, filename: str
 ) -> None:
     """Method to parse table to madx sequence and save in file."""
-    save_string(parse_table_to_madx_sequence_string(name, length, df), filename)
+    with open(filename, "w") as f:
+        parse_table_to_madx_sequence_stream(name, length, df, f)
+
+
+def _madx_input_values(column: np.ndarray) -> list:
+    """Method to format a column of values as exact MAD-X input (shortest round trip repr)."""
+    if column.dtype.kind == "f":
+        return list(map(repr, column.tolist()))
+    return [
+        repr(v) if isinstance(v, float) else str(v).lower() if isinstance(v, bool) else str(v)
+        for v in column.tolist()
+    ]
+
+
+def iter_table_to_madx_input(
+    name: str,
+    length: float,
+    df: pd.DataFrame,
+    chunksize: int = CHUNKSIZE,
+    definitions: pd.DataFrame = None,
+):
+    """
+    Generator of compact MAD-X input defining the elements and the
+    sequence of a table, to be fed to a running MAD-X (see
+    LatticeAdaptor.to_madx). The definitions are yielded per family
+    in batches of at most chunksize elements, followed by the sequence.
+    Numbers are written as the shortest string that parses back to the
+    same float and assigned with = (not :=), so MAD-X stores the values
+    themselves instead of deferred expressions; the positions are not
+    rounded as in the sequence file.
+
+    Arguments:
+    ----------
+    name        : str
+        name of the sequence
+    length      : float
+        length of the sequence
+    df          : pd.DataFrame
+        table containing the element data
+    chunksize   : int
+        maximum number of statements per batch
+    definitions : pd.DataFrame
+        unique element definitions if already computed with _element_definitions
+
+    """
+    if definitions is None:
+        definitions = _element_definitions(df)
+    columns = [c for c in definitions.columns if c not in NON_ATTRIBUTE_COLUMNS]
+    names = definitions["name"].to_numpy(dtype=object)
+
+    families = {}
+    for (keyword, present, _), rows in _attribute_groups(definitions, columns).items():
+        families.setdefault(keyword, []).append((present, rows))
+
+    for keyword, groups in families.items():
+        allowed_attrs = MADX_ATTRIBUTES[keyword].keys()
+        lines = []
+        for present, rows in groups:
+            if len(allowed_attrs) == 0:
+                present = ()
+            template = "{}: " + keyword + "".join(", {}={{}}".format(c) for c in present) + ";\n"
+            values = [_madx_input_values(definitions[c].to_numpy()[rows]) for c in present]
+            lines.extend(map(template.format, names[rows], *values))
+        for chunk in _chunks(lines, chunksize):
+            yield "".join(chunk)
+
+    yield "{}: SEQUENCE, L={!r};\n".format(name, float(length))
+    yield from _iter_formatted("{}, at={!r};\n", df, ("name", "at"), chunksize)
+    yield "ENDSEQUENCE;\n"
 
 
 def parse_table_to_madx_install_str(name: str, df: pd.DataFrame) -> str:
@@ -148,7 +454,7 @@ def parse_table_to_madx_install_str(name: str, df: pd.DataFrame) -> str:
     ----------
     name    : str
         name of the sequence to be edited
-    df      : pd.DataFrame
+    df      : pd.DataFrame, dict or structured np.ndarray
         table with elements to install (requires name, at as columns)
 
     Returns:
@@ -160,9 +466,7 @@ def parse_table_to_madx_install_str(name: str, df: pd.DataFrame) -> str:
     # start sequence edit
     text = "USE, SEQUENCE={};\n".format(name)
     text += "SEQEDIT, SEQUENCE = {};  \nFLATTEN;\n".format(name)
-    for _, row in df.iterrows():
-        line = "INSTALL, ELEMENT = {:16}, AT = {:12.6f};\n".format(row["name"], row["at"])
-        text += line
+    text += format_madx_positions("INSTALL, ELEMENT = {:16}, AT = {:12.6f};\n", df)
 
     # end sequence edit
     text += "FLATTEN;\nENDEDIT;"
@@ -181,8 +485,8 @@ def parse_table_to_madx_remove_str(name: str, df: pd.DataFrame) -> str:
     ----------
     name    : str
         name of the sequence to be edited
-    df      : pd.DataFrame
-        table with elements to remove (requires name, at as columns)
+    df      : pd.DataFrame, dict or structured np.ndarray
+        table with elements to remove (requires name as column)
 
     Returns:
     --------
@@ -191,9 +495,7 @@ def parse_table_to_madx_remove_str(name: str, df: pd.DataFrame) -> str:
     # start sequence edit
     text = "USE, SEQUENCE={};\n".format(name)
     text += "SEQEDIT, SEQUENCE = {};  \nFLATTEN;\n".format(name)
-    for _, row in df.iterrows():
-        line = "REMOVE, ELEMENT = {:16};\n".format(row["name"])
-        text += line
+    text += format_madx_positions("REMOVE, ELEMENT = {:16};\n", df, ("name",))
 
     # end sequence edit
     text += "FLATTEN;\nENDEDIT;"
@@ -201,20 +503,10 @@ def parse_table_to_madx_remove_str(name: str, df: pd.DataFrame) -> str:
     return text
 
 
-def parse_table_to_elegant_string(name: str, df: pd.DataFrame) -> str:
-    """
-    Method to transform the MADX seq table to an Elegant lte file
-    """
+def _parse_table_to_elegant_definitions(df: pd.DataFrame) -> str:
+    """Method to parse the rows of a table to Elegant element definitions."""
     # init output
     text = """"""
-    lattice_template = "{}: LINE=({})".format
-    # element_template = "{}: {}, {}".format
-
-    df = df.drop(columns=["pos", "at"], errors="ignore")
-    lattice_elements = ", ".join(list(df["name"].values))
-    lattice = lattice_template(name, lattice_elements)
-
-    df = df.drop_duplicates()
 
     # loop over the rows of the frame
     for _, row in df.iterrows():
@@ -264,173 +556,353 @@ def parse_table_to_elegant_string(name: str, df: pd.DataFrame) -> str:
         text += line
         # print(text)
 
-    text += "\n\n"
-    text += lattice
-
     return text
 
 
+@lru_cache(maxsize=None)
+def _elegant_formatter(family: str, present: tuple, strings: tuple):
+    """
+    Method to compile the element definition of a family with the given
+    attribute columns present (and holding strings) to a format function
+    and the columns filling it, as the row by row writer formats them.
+    Compiled formatters are cached, so repeated exports only format.
+    """
+    keyword = TO_ELEGANT_ELEMENTS[family]
+    allowed_attrs = ELEGANT_ATTRIBUTES[keyword]
+
+    # name and element type
+    head = "{{:16}}: {}, ".format("{:12}".format(keyword).replace("{", "{{").replace("}", "}}"))
+
+    nrow = [TO_ELEGANT_ATTR[c] for c in present if c in allowed_attrs]
+    if len(allowed_attrs) == 0 or len(nrow) == 0:
+        return (head[:-2] + "\n").format, ()
+
+    parts, columns = [], []
+    for c in nrow:
+        if TO_ELEGANT_ATTR[c] in allowed_attrs:
+            if c not in present:
+                # the row by row writer fails on this lookup as well
+                raise KeyError(c)
+            label = c.replace("{", "{{").replace("}", "}}")
+            parts.append(label + ("={:16}" if c in strings else "={:16.12f}"))
+            columns.append(c)
+        else:
+            parts.append("")
+
+    return (head + ", ".join(parts) + "\n").format, tuple(columns)
+
+
+def _format_elegant_definitions(df: pd.DataFrame) -> str:
+    """
+    Method to format the Elegant definitions of all rows of the table,
+    rows of the same family and attribute columns share one compiled formatter.
+    """
+    if len(df) == 0:
+        return ""
+
+    columns = [c for c in df.columns if c not in NON_ATTRIBUTE_COLUMNS]
+    string_columns = [c for c in columns if not pd.api.types.is_numeric_dtype(df[c].dtype)]
+    names = df["name"].to_numpy(dtype=object)
+    lines = np.empty(len(df), dtype=object)
+
+    for (family, present, strings), rows in _attribute_groups(df, columns, string_columns).items():
+        formatter, used = _elegant_formatter(family, present, strings)
+        values = [df[c].to_numpy(dtype=object)[rows] for c in used]
+        lines[rows] = list(map(formatter, names[rows], *values))
+
+    return "".join(lines.tolist())
+
+
+def _iter_table_to_elegant(
+    name: str,
+    df: pd.DataFrame,
+    chunksize: int = CHUNKSIZE,
+    engine: str = "vectorized",
+    definitions: pd.DataFrame = None,
+):
+    """Generator of the Elegant lte file, chunksize rows at a time."""
+    if engine == "vectorized":
+        format_definitions = _format_elegant_definitions
+    elif engine == "rows":
+        format_definitions = _parse_table_to_elegant_definitions
+    else:
+        raise ValueError("Unknown writer engine: {}".format(engine))
+
+    if definitions is None:
+        definitions = _element_definitions(df)
+    for chunk in _chunks(definitions, chunksize):
+        yield format_definitions(chunk)
+
+    yield "\n\n"
+    yield "{}: LINE=(".format(name)
+    yield from _iter_joined(df["name"].to_numpy(dtype=object), ", ", chunksize)
+    yield ")"
+
+
+def parse_table_to_elegant_string(name: str, df: pd.DataFrame, engine: str = "vectorized") -> str:
+    """
+    Method to transform the MADX seq table to an Elegant lte file
+
+    Arguments:
+    ----------
+    name    : str
+        name of the lattice line
+    df      : pd.DataFrame
+        table containing the element data
+    engine  : str
+        "vectorized" formats the rows in groups of equal family and attributes
+        with cached compiled formatters, "rows" formats row by row.
+        Both give identical output.
+
+    """
+    with stage("format.elegant", rows=len(df)):
+        return "".join(_iter_table_to_elegant(name, df, engine=engine))
+
+
+def parse_table_to_elegant_stream(
+    name: str, df: pd.DataFrame, stream, chunksize: int = CHUNKSIZE
+) -> None:
+    """
+    Method to transform the MADX seq table to an Elegant lte file and
+    write it to a text or binary stream in chunks.
+    """
+    with stage("write.elegant", rows=len(df)):
+        write_chunks(_iter_table_to_elegant(name, df, chunksize), stream)
+
+
 def parse_table_to_elegant_file(name: str, df: pd.DataFrame, filename: str) -> None:
-    save_string(parse_table_to_elegant_string(name, df), filename)
+    with open(filename, "w") as f:
+        parse_table_to_elegant_stream(name, df, f)
 
 
 def parse_table_to_tracy_string(latname: str, df: pd.DataFrame) -> str:
     """
     Method to transform the MADX seq table to tracy lattice string.
     """
+    with stage("format.tracy", rows=len(df)):
+        return "".join(_iter_table_to_tracy(latname, df))
 
-    # init output
-    text = """"""
-    template_marker = "{}: Marker;".format
-    template_bpm = "{}: Beam Position Monitor;".format
-    template_drift = "{}: Drift, {};".format
-    template_bend = "{}: Bending, {}, N = Nbend, Method = 4;".format
-    template_quad = "{}: Quadrupole, {}, N = Nquad, Method = 4;".format
-    template_sext = "{}: Sextupole, {}, N = Nsext, Method = 4;".format
-    template_oct = "{}: Multipole, L = {}, HOM = (4,{}/6.0,0.0), N = Nsext, Method = 4;".format
-    template_cav = "{}: Cavity, {};".format
-
-    lattice_template = "{}: "
+
+def _iter_tracy_lattice(latname: str, names, chunksize: int = CHUNKSIZE):
+    """
+    Generator of the tracy lattice line, ten names on the first line
+    and eleven on the following lines, about chunksize names at a time.
+    """
     n_elem = 10
-    lattice_elements = list(df["name"].values)
-    n = len(lattice_elements)
+    n = len(names)
+
+    yield "{}: ".format(latname)
     if n >= n_elem:
-        lattice_template += "\n "
-    for k in range(2, n + 2):
-        if (k - 1) % (n_elem + 1) == 0:
-            lattice_template += "\n "
-        lattice_template += lattice_elements[k - 2]
-        if k < n + 1:
-            lattice_template += ", "
-        else:
-            lattice_template += ";"
-    # element_template = "{}: {}, {}".format
+        yield "\n "
+
+    # first name of every line of the output
+    starts = [0] + list(range(n_elem, n, n_elem + 1))
+    ends = starts[1:] + [n]
+    step = max(chunksize // (n_elem + 1), 1)
+    for i in range(0, len(starts), step):
+        text = ", \n ".join(
+            ", ".join(names[start:end])
+            for start, end in zip(starts[i : i + step], ends[i : i + step])
+        )
+        yield ", \n " + text if i > 0 else text
+
+    if n > 0:
+        yield ";"
+
+
+def _iter_table_to_tracy(
+    latname: str, df: pd.DataFrame, chunksize: int = CHUNKSIZE, definitions: pd.DataFrame = None
+):
+    """Generator of the tracy lattice file, chunksize rows at a time."""
+    if definitions is None:
+        definitions = _element_definitions(df)
+    for chunk in _chunks(definitions, chunksize):
+        yield _format_tracy_definitions(chunk)
+
+    yield "\n\n"
+    yield from _iter_tracy_lattice(latname, df["name"].to_numpy(dtype=object), chunksize)
+
+    yield "\n\n"
+    yield "ring: {};\n\n".format(latname)
+    yield "cell: ring, symmetry = 1;"
+    yield "\n\nend;"
+
+
+def parse_table_to_tracy_stream(
+    latname: str, df: pd.DataFrame, stream, chunksize: int = CHUNKSIZE
+) -> None:
+    """
+    Method to transform the MADX seq table to tracy lattice and
+    write it to a text or binary stream in chunks.
+    """
+    with stage("write.tracy", rows=len(df)):
+        write_chunks(_iter_table_to_tracy(latname, df, chunksize), stream)
 
-    df = df.drop(columns=["pos", "at"], errors="ignore")
-    lattice = lattice_template.format(latname)
 
-    df = df.drop_duplicates()
-    # loop over the rows of the frame
-    for _, row in df.iterrows():
-        # get the element family to check against allowed attrs
-        keyword = TO_TRACY_ELEMENTS[row["family"]]
-        name = row["name"]
+def _float_column(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Method to return a column as float array, all NaN if the table does not have it."""
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[column].to_numpy(dtype=float, na_value=np.nan)
 
-        # get allowed attrs - to distinguish madx from elegant columns
-        allowed_attrs = TRACY_ATTRIBUTES[keyword]
-        # print(allowed_attrs)
 
-        # line = ""
-        # name and element type
-        # line += "{:16}: {:12}, ".format(row["name"], keyword)
+@lru_cache(maxsize=None)
+def _tracy_formatter(kind: str, attributes: tuple):
+    """Method to compile the format function of a tracy element kind with the given attributes."""
+    head, tail = TRACY_TEMPLATES[kind]
+    formats = [TRACY_ATTRIBUTES[kind][attribute]["format"] for attribute in attributes]
+    return "".join([head] + [", " + f for f in formats] + [tail, "\n"]).format
 
-        # remove non attrs from columns
-        row = row.drop(["name", "at", "family", "end_pos", "sector"], errors="ignore").dropna()
-        # print(row.index)
-        # update the indices
-
-        try:
-            row.index = [TO_TRACY_ATTR[c] for c in row.index if TO_TRACY_ATTR[c] != ""]
-            # row.index = [TO_TRACY_ATTR[c] for c in row.index if c in allowed_attrs]
-            nrow = row.index
-        except:
-            nrow = [TO_TRACY_ATTR[c] for c in row.index if TO_TRACY_ATTR[c] != ""]
-            # nrow = [TO_TRACY_ATTR[c] for c in row.index if c in allowed_attrs]
-
-        if keyword == "bpm":
-            line = template_bpm(name)
-        elif keyword == "marker":
-            line = template_marker(name)
-        elif keyword == "drift":
-            line = template_drift(name, "L = {}".format(row["L"]))
-        elif keyword == "bend":
-            new_row = {"L": row["L"]}
-            new_row["T"] = np.degrees(row["T"])
-
-            if "Roll" in nrow:
-                new_row["Roll"] = np.degrees(row.get("Roll", None))
-
-            if "Gap" in nrow:
-                new_row["Gap"] = 4.0 * row.Gap * row.loc_fint
-
-            if "T1" in nrow:
-                new_row["T1"] = np.degrees(row.T1)
-            if "T2" in nrow:
-                new_row["T2"] = np.degrees(row.T2)
-            if "K" in nrow:
-                new_row["K"] = row.K
-
-            line = template_bend(
-                name,
-                ", ".join(
-                    [
-                        "{} = {:17.15f}".format(k, v)
-                        if k not in ["L", "K"]
-                        else "{} = {:8.6f}".format(k, v)
-                        for k, v in new_row.items()
-                    ]
-                ),
-            )
-            # line += ", N = Nbend, Method = 4;"
 
-        elif keyword == "quad":
-            line = template_quad(
-                name,
-                ", ".join(
-                    ["{} = {:8.6f}".format(k, v) for k, v in row.items() if k in allowed_attrs]
-                ),
+def _format_tracy_definitions(df: pd.DataFrame) -> str:
+    """
+    Method to format the tracy definitions of all rows of the table. The
+    attributes are converted to tracy units a column at a time and rows
+    of the same kind and attributes share one compiled formatter.
+    """
+    if len(df) == 0:
+        return ""
+
+    kinds = df["family"].map(TO_TRACY_ELEMENTS)
+    if kinds.isna().any():
+        raise KeyError(df["family"][kinds.isna()].iloc[0])
+    kinds = kinds.to_numpy(dtype=object)
+
+    names = df["name"].to_numpy(dtype=object)
+    lines = np.empty(len(df), dtype=object)
+    converted = {}
+
+    for kind in pd.unique(kinds):
+        rows = np.flatnonzero(kinds == kind)
+        attributes = TRACY_ATTRIBUTES[kind]
+
+        # attribute values of the rows in tracy units
+        values = {}
+        for attribute, spec in attributes.items():
+            key = attribute, spec["column"]
+            if key not in converted:
+                column = _float_column(df, spec["column"])
+                convert = TRACY_CONVERSIONS.get(attribute)
+                converted[key] = convert(column, df) if convert else column
+            values[attribute] = converted[key][rows]
+            if spec["required"]:
+                values[attribute] = np.nan_to_num(values[attribute], nan=0.0)
+
+        # group the rows by the attributes that are present
+        present = np.column_stack(
+            [~np.isnan(v) for v in values.values()] + [np.ones(len(rows), dtype=bool)]
+        )
+        patterns, inverse = np.unique(present, axis=0, return_inverse=True)
+        for i, pattern in enumerate(patterns):
+            group = np.flatnonzero(inverse.reshape(-1) == i)
+            used = tuple(a for a, p in zip(attributes, pattern) if p)
+            formatter = _tracy_formatter(kind, used)
+            lines[rows[group]] = list(
+                map(formatter, names[rows[group]], *(values[a][group].tolist() for a in used))
             )
-            # line += ", N = Nquad, Method = 4;"
 
-        elif keyword == "sext":
-            line = template_sext(
-                name,
-                ", ".join(
-                    [
-                        "{} = {:8.6f}".format(k, v) if k != "K" else "{} = {}/2.0".format(k, v)
-                        for k, v in row.items()
-                        if k in allowed_attrs
-                    ]
-                ),
-            )
-            # line += ", N = Nsext, Method = 4;"
-        elif keyword == " oct1":
-            line = template_oct(name, row["L"], row["K"])
-
-        elif keyword == "cavity":
-            new_row = {"L": row["L"]}
-            new_row["Frequency"] = row.get("Frequency", 0.0)
-            new_row["Voltage"] = row.get("Voltage", 0.0)
-            new_row["phi"] = row.get("phi", 0)
-
-            line = template_cav(
-                name,
-                ", ".join(
-                    [
-                        "{} = {:17.15f}".format(k, float(v))
-                        if k not in ["L"]
-                        else "{} = {:8.6f}".format(k, float(v))
-                        for k, v in new_row.items()
-                    ]
-                ),
-            )
+    return "".join(lines.tolist())
 
-        line += "\n"
 
-        # add line to text
-        text += line
-        # print(text)
-    text += "\n\n"
-    text += lattice
+def parse_table_to_tracy_file(latname: str, df: pd.DataFrame, filename: str) -> None:
+    """Method to transform the MADX seq table to tracy lattice and write to file."""
+    with open(filename, "w") as f:
+        parse_table_to_tracy_stream(latname, df, f)
+
+
+# export formats and the extension of their files
+EXPORT_FORMATS = {"madx": ".seq", "elegant": ".lte", "tracy": ".lat"}
+
+
+def _export_file(
+    fmt: str,
+    name: str,
+    length: float,
+    df: pd.DataFrame,
+    definitions: pd.DataFrame,
+    filename: str,
+    chunksize: int = CHUNKSIZE,
+) -> float:
+    """Method to write one export format to file, returns the time it took."""
+    t0 = time.perf_counter()
+    if fmt == "madx":
+        chunks = _iter_table_to_madx_sequence(name, length, df, chunksize, definitions)
+    elif fmt == "elegant":
+        chunks = _iter_table_to_elegant(name, df, chunksize, definitions=definitions)
+    elif fmt == "tracy":
+        chunks = _iter_table_to_tracy(name, df, chunksize, definitions)
+    else:
+        raise ValueError("Unknown export format: {}".format(fmt))
+
+    with stage("export." + fmt, rows=len(df)), open(filename, "w") as f:
+        write_chunks(chunks, f)
+
+    return time.perf_counter() - t0
+
+
+def export_table(
+    name: str,
+    length: float,
+    df: pd.DataFrame,
+    formats=tuple(EXPORT_FORMATS),
+    directory: str = ".",
+    workers: int = None,
+    processes: bool = False,
+) -> dict:
+    """
+    Method to export a table to several lattice formats at once.
 
-    text += "\n\n"
-    text += "ring: {};\n\n".format(latname)
-    text += "cell: ring, symmetry = 1;"
-    text += "\n\nend;"
+    The table is reduced to its element definitions once, this shared
+    table is used by all formats, which are written concurrently.
 
-    return text
+    Arguments:
+    ----------
+    name        : str
+        name of the sequence
+    length      : float
+        length of the sequence
+    df          : pd.DataFrame
+        table containing the element data
+    formats     : iterable of str
+        export formats, any of "madx", "elegant" and "tracy"
+    directory   : str
+        directory to write <name>.seq, <name>.lte and <name>.lat to
+    workers     : int
+        number of threads (or processes), defaults to one per format
+    processes   : bool
+        use a process pool instead of a thread pool
 
+    Returns:
+    --------
+    dict mapping every format to {"filename": ..., "time": ...} with the
+    time in seconds, "normalize" and "total" give the time to build the
+    shared table and the total wall time.
 
-def parse_table_to_tracy_file(latname: str, df: pd.DataFrame, filename: str) -> None:
-    """Method to transform the MADX seq table to tracy lattice and write to file."""
-    save_string(parse_table_to_tracy_string(latname, df), filename)
+    """
+    t0 = time.perf_counter()
+    formats = list(formats)
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError("Unknown export format: {}".format(fmt))
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with stage("export.normalize", rows=len(df)):
+        definitions = _element_definitions(df)
+    report = {"normalize": {"time": time.perf_counter() - t0}}
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers or max(len(formats), 1)) as pool:
+        futures = {}
+        for fmt in formats:
+            filename = str(directory / (name + EXPORT_FORMATS[fmt]))
+            futures[fmt] = filename, pool.submit(
+                _export_file, fmt, name, length, df, definitions, filename
+            )
+        for fmt, (filename, future) in futures.items():
+            report[fmt] = {"filename": filename, "time": future.result()}
+
+    report["total"] = {"time": time.perf_counter() - t0}
+
+    return report
@@ -1,25 +1,84 @@
+import hashlib
+import os
+import re
+import threading
 from abc import ABC
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from json import load
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from lark import Lark, Transformer, v_args
 from lark.exceptions import LarkError
 
+from ..Utils.CacheUtils import get_parse_cache, get_parser_cache_dir, set_parse_cache
+from ..Utils.ProfileUtils import stage
+from ..Utils.StorageUtils import arrays_to_table, table_to_arrays
+
+# bump when the table built from the parse tree changes
+TABLE_VERSION = 2
+
 BASE_DIR = Path(__file__).resolve().parent
 with (BASE_DIR / "../lark/madx_seq.lark").open() as file:
-    MADX_PARSER = Lark(file, parser="lalr", maybe_placeholders=True)
-    file.seek(0)
+    GRAMMAR = file.read()
+
+# parse cache entries are only valid for the same grammar and table layout
+GRAMMAR_VERSION = "{}-{}".format(TABLE_VERSION, hashlib.sha256(GRAMMAR.encode()).hexdigest()[:16])
+
+_PARSER_OPTIONS = {"parser": "lalr", "maybe_placeholders": True}
+
+
+def _build_parser(kind: str = "tree", **options) -> Lark:
+    """
+    Method to build a LALR parser for the madx sequence grammar. Its
+    serialized LALR tables are cached in the parser cache directory (see
+    Utils.CacheUtils.get_parser_cache_dir), so later processes load them
+    instead of analysing the grammar again, also with the parse cache
+    disabled. Every kind of parser (e.g. with an inline transformer) gets
+    its own cache file, as lark stores the transformer with the tables.
+    """
+    options = {**_PARSER_OPTIONS, **options}
+    directory = get_parser_cache_dir()
+    cache_file = directory / "madx_seq_lark_{}_{}.cache".format(kind, GRAMMAR_VERSION)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        return Lark(GRAMMAR, cache=str(cache_file), **options)
+    except OSError:
+        return Lark(GRAMMAR, **options)
+
+
+@lru_cache(maxsize=None)
+def get_madx_parser() -> Lark:
+    """Method to return the LALR parser for the madx sequence grammar, built on first use."""
+    return _build_parser()
+
+
+@lru_cache(maxsize=None)
+def _get_inline_parser() -> Lark:
+    """Method to return the LALR parser running the _BufferTransformer callbacks inline."""
+    return _build_parser("inline", transformer=_BufferTransformer())
+
+
+def __getattr__(name):
+    # the parser used to be built at import time as MADX_PARSER
+    if name == "MADX_PARSER":
+        return get_madx_parser()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+_SEQUENCE_HEADER = re.compile(r"^\s*[\w\.]+\s*:\s*SEQUENCE\s*(,|$)", re.IGNORECASE)
 
 
 @v_args(inline=True)
 class AbstractSequenceFileTransformer(ABC, Transformer):
     def transform(self, tree):
-        self.elements = []
+        self.buffer = _TableBuffer()
         self.seq = None
-        self.name = None
-        self.length = 0.0
         super().transform(tree)
-        return self.seq, self.elements, self.name, self.length
+        return self.buffer
 
     int = int
     float = float
@@ -30,10 +89,7 @@ class AbstractSequenceFileTransformer(ABC, Transformer):
     string = lambda self, item: item[1:-1]
 
     def element(self, name, type_, *attributes):
-        # self.elements[name.upper()] = {**{'family': type_.upper()}, **dict(attributes)}
-        self.elements.append(
-            {**{"name": name.upper(), "family": type_.upper()}, **dict(attributes)}
-        )
+        self.buffer.add_element(name.upper(), type_.upper(), attributes)
         return name
 
     def attribute(self, name, value):
@@ -43,8 +99,10 @@ class AbstractSequenceFileTransformer(ABC, Transformer):
         return name.upper(), value
 
     def sequence(self, name, *attr):
-        self.name = name
-        self.length = attr[0][1]
+        # the positions are reduced before the sequence header is complete
+        self.buffer.add_sequence(
+            name, attr[0][1], [n for n, _ in self.seq], array("d", [p for _, p in self.seq])
+        )
         return name, attr
 
     def seq_elements(self, *attr):
@@ -59,41 +117,850 @@ class MADXTransformer(AbstractSequenceFileTransformer):
     pass
 
 
-def parse_from_madx_sequence_string(string: str) -> (str, float, pd.DataFrame):
-    """Method to parse madx seq string to table format"""
-    # use lark to parse the string
-    tree = MADX_PARSER.parse(string)
-    positions, elements, name, length = MADXTransformer().transform(tree)
+def _column_dtypes(columns: dict) -> dict:
+    """Method to derive the attribute dtypes from the madx column defaults."""
+    dtypes = {}
+    for attributes in columns.values():
+        for key, default in attributes.items():
+            if isinstance(default, bool):
+                dtype = "boolean"
+            elif isinstance(default, (int, float)):
+                dtype = "float64"
+            else:
+                dtype = "object"
+            if dtypes.setdefault(key, dtype) != dtype:
+                dtypes[key] = "object"
+    return dtypes
 
-    # read the positions of the elements ('at' in the seq file)
-    if positions is not None:
-        dfpos = pd.DataFrame.from_records(positions, columns=["name", "pos"])
-    else:
+
+with (BASE_DIR / "../mapfiles/madx_columns.json").open() as file:
+    COLUMN_DTYPES = _column_dtypes(load(file))
+
+
+def _typed_column(key: str, values):
+    """Method to convert a table column to its dtype."""
+    if key in ("name", "family"):
+        return pd.Categorical(values)
+
+    if COLUMN_DTYPES.get(key) == "boolean":
+        try:
+            return pd.array(values, dtype="boolean")
+        except (TypeError, ValueError):
+            pass
+
+    return values
+
+
+def _warn_bare_lattice() -> None:
+    print("Warning: bare lattice only positions returned")
+
+
+def _build_table(name: str, length: float, dfpos: pd.DataFrame, dfel: pd.DataFrame):
+    """
+    Method to combine the element definitions and the positions
+    into the final typed sequence table.
+
+    The definitions are looked up by name with a hash index, where
+    the last definition of a name wins, positions of undefined names
+    are dropped. Name and family are categorical and the attributes
+    get the dtypes of the madx columns.
+
+    Arguments:
+    ----------
+    name    : str
+        name of the sequence
+    length  : float
+        length of the sequence
+    dfpos   : pd.DataFrame
+        table with the element positions ('at' in the seq file), None if no sequence
+    dfel    : pd.DataFrame
+        table with the element definitions, None if no definitions
+
+    """
+    if dfpos is None:
         dfpos = pd.DataFrame()
 
     # if not bare sequence file
-    if elements:
-        dfel = pd.DataFrame(elements)
+    if dfel is not None:
+        # if positions are available join the tables
+        if len(dfpos) > 0:
+            lookup = dict(zip(dfel["name"].to_numpy(), range(len(dfel))))
+            names = dfpos["name"].to_numpy()
+            rows = np.fromiter((lookup.get(n, -1) for n in names), dtype=np.intp, count=len(names))
+            pos = dfpos["pos"].to_numpy()
 
-        # if positions are available merge the tables
-        if positions:
-            df = dfpos.merge(dfel, on="name").sort_values(by="pos")
-            df.loc[df.L.isna(), "L"] = 0
-            df["at"] = df["pos"]
-            return name, length, df
+            found = rows >= 0
+            if not found.all():
+                names, rows, pos = names[found], rows[found], pos[found]
+
+            # positions in a seq file are usually sorted already
+            if (np.diff(pos) < 0).any():
+                order = np.argsort(pos, kind="stable")
+                names, rows, pos = names[order], rows[order], pos[order]
+
+            columns = {"name": names, "pos": pos}
+            for key in dfel.columns[1:]:
+                columns[key] = dfel[key].to_numpy()[rows]
+
+            columns["L"] = np.nan_to_num(columns.get("L", np.zeros(len(pos))), nan=0.0)
+            columns["at"] = pos.copy()
         else:
-            return name, length, dfel
+            columns = {key: dfel[key].to_numpy() for key in dfel.columns}
+
+        df = pd.DataFrame({key: _typed_column(key, values) for key, values in columns.items()})
+        return name, length, df
 
     # if seq file is bare print warning and return only
     # pos table as table
-    print("Warning: bare lattice only positions returned")
+    _warn_bare_lattice()
+
+    if len(dfpos.columns) > 0:
+        dfpos["name"] = pd.Categorical(dfpos["name"])
 
     return name, length, dfpos
 
 
-def parse_from_madx_sequence_file(filename: str) -> (str, float, pd.DataFrame):
-    """Method to parse madx seq from file to table format."""
+class _TableBuffer:
+    """
+    Columnar accumulator for element definitions and positions.
+
+    Float attributes are collected in typed arrays, columns holding
+    other values (e.g. booleans) fall back to lists.
+    """
+
+    def __init__(self):
+        self.name = None
+        self.length = 0.0
+        self.names = []
+        self.families = []
+        self.attributes = {}
+        self.pos_names = None
+        self.pos_values = None
+
+    def add_element(self, name: str, family: str, attributes) -> None:
+        row = len(self.names)
+        self.names.append(name)
+        self.families.append(family)
+        for key, value in attributes:
+            column = self.attributes.get(key)
+            if column is None:
+                column = self.attributes[key] = array("d")
+            if len(column) > row:
+                # repeated attribute, last one wins
+                column.pop()
+            self._pad(column, row)
+            if isinstance(value, float) and isinstance(column, array):
+                column.append(value)
+            else:
+                if isinstance(column, array):
+                    column = self.attributes[key] = column.tolist()
+                column.append(value)
+
+    def add_sequence(
+        self, name: str, length: float, pos_names: list = None, pos_values: array = None
+    ) -> None:
+        # a new sequence replaces the previous one
+        self.name = name
+        self.length = length
+        self.pos_names = pos_names if pos_names is not None else []
+        self.pos_values = pos_values if pos_values is not None else array("d")
+
+    def add_position(self, name: str, pos: float) -> None:
+        self.pos_names.append(name)
+        self.pos_values.append(pos)
+
+    def extend(self, other) -> None:
+        """Method to append the elements and take over the sequence of another buffer."""
+        n = len(self.names)
+        m = len(other.names)
+        self.names.extend(other.names)
+        self.families.extend(other.families)
+        for key, column in other.attributes.items():
+            self._pad(column, m)
+            mine = self.attributes.get(key)
+            if mine is None:
+                mine = self.attributes[key] = array("d")
+            self._pad(mine, n)
+            if isinstance(mine, array) and not isinstance(column, array):
+                mine = self.attributes[key] = mine.tolist()
+            mine.extend(column)
+
+        if other.pos_names is not None:
+            self.add_sequence(other.name, other.length, other.pos_names, other.pos_values)
+
+    @staticmethod
+    def _pad(column, n: int) -> None:
+        if len(column) < n:
+            column.extend([np.nan] * (n - len(column)))
+
+    def tables(self) -> (pd.DataFrame, pd.DataFrame):
+        """Method to return the positions and element tables, None if absent."""
+        dfpos = None
+        if self.pos_names is not None:
+            if self.pos_names:
+                dfpos = pd.DataFrame(
+                    {"name": self.pos_names, "pos": np.frombuffer(self.pos_values)}
+                )
+            else:
+                dfpos = pd.DataFrame.from_records([], columns=["name", "pos"])
+
+        dfel = None
+        if self.names:
+            n = len(self.names)
+            columns = {"name": self.names, "family": self.families}
+            for key, column in self.attributes.items():
+                self._pad(column, n)
+                columns[key] = np.frombuffer(column) if isinstance(column, array) else column
+            dfel = pd.DataFrame(columns)
+
+        return dfpos, dfel
+
+
+# regular expressions for the canonical output of madx SAVE, SEQUENCE=...;
+# anything they do not match is handed to the lark grammar
+_NUMBER = r"(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?"
+_VALUE = r"(?:(-?)\s*({})|(true))".format(_NUMBER)
+_ATTRIBUTES = r"((?:,\s*[\w\.]+\s*:?=\s*(?:-?\s*{}|true)\s*)*)".format(_NUMBER)
+_FAST_ATTRIBUTE = re.compile(r",\s*([\w\.]+)\s*:?=\s*" + _VALUE)
+_FAST_ELEMENT = re.compile(r"\s*([\w\.]+)\s*:\s*([\w\.]+)\s*" + _ATTRIBUTES + r",?\s*")
+_FAST_SEQUENCE = re.compile(r"\s*([\w\.]+)\s*:\s*SEQUENCE\s*" + _ATTRIBUTES, re.IGNORECASE)
+_FAST_POSITION = re.compile(r"\s*([\w\.]+)\s*,\s*at =\s*(-?)\s*({})\s*".format(_NUMBER))
+_FAST_ENDSEQUENCE = re.compile(r"\s*ENDSEQUENCE\s*", re.IGNORECASE)
+
+
+def _fast_attributes(text: str) -> list:
+    return [
+        (key.upper(), True if true else (-float(value) if neg else float(value)))
+        for key, neg, value, true in _FAST_ATTRIBUTE.findall(text)
+    ]
+
+
+def _parse_fast(string: str) -> _TableBuffer:
+    """
+    Method to parse the canonical madx SAVE output with regular
+    expressions straight into a _TableBuffer.
+
+    On the first statement that is not recognised the rest of the
+    string (from the start of the current sequence if inside one)
+    is parsed with the lark grammar.
+    """
+    buffer = _TableBuffer()
+    statements = string.split(";")
+
+    # the text after the last semicolon is not a complete statement
+    tail = statements.pop()
+
+    offset = 0
+    header = None
+    for statement in statements:
+        if header is None:
+            match = _FAST_ELEMENT.fullmatch(statement)
+            if match is not None:
+                name, family, attributes = match.groups()
+                family = family.upper()
+                if family == "SEQUENCE":
+                    attributes = _fast_attributes(attributes)
+                    if not attributes or _FAST_SEQUENCE.fullmatch(statement) is None:
+                        break
+                    header = offset
+                    buffer.add_sequence(name, attributes[0][1])
+                elif not family.startswith("SEQUENCE"):
+                    buffer.add_element(name.upper(), family, _fast_attributes(attributes))
+                else:
+                    break
+            else:
+                break
+        else:
+            match = _FAST_POSITION.fullmatch(statement)
+            if match is not None:
+                name, neg, value = match.groups()
+                name = name.upper()
+                if name.startswith("ENDSEQUENCE"):
+                    break
+                buffer.add_position(name, -float(value) if neg else float(value))
+            elif _FAST_ENDSEQUENCE.fullmatch(statement) is not None:
+                header = None
+            else:
+                break
+
+        offset += len(statement) + 1
+    else:
+        if header is None and not tail.strip():
+            return buffer
+
+    # fall back to the grammar for the remainder, a sequence
+    # that was only partially read is parsed again completely
+    start = offset if header is None else header
+    buffer.extend(_parse_inline(string[start:]))
+
+    return buffer
+
+
+def _parse_lark(string: str) -> _TableBuffer:
+    """Method to parse a string with the lark grammar and the transformer."""
+    with stage("parse.lark"):
+        tree = get_madx_parser().parse(string)
+    with stage("parse.transform"):
+        return MADXTransformer().transform(tree)
+
+
+# per thread state of the _BufferTransformer, the inline parser is shared
+_INLINE_STATE = threading.local()
+
+
+@v_args(inline=True)
+class _BufferTransformer(Transformer):
+    """
+    Transformer attached to the LALR parser, its callbacks run during
+    parsing and append straight into a _TableBuffer, so no parse tree
+    is built.
+    """
+
+    word = str
+    neg = lambda self, item: -item
+    number = float
+
+    def element(self, name, type_, *attributes):
+        _INLINE_STATE.buffer.add_element(name.upper(), type_.upper(), attributes)
+
+    def attribute(self, name, value):
+        return name.upper(), value
+
+    def seq_element(self, name, value):
+        _INLINE_STATE.pos_names.append(name.upper())
+        _INLINE_STATE.pos_values.append(value)
+
+    def seq_elements(self, *attr):
+        pass
+
+    def sequence(self, name, *attr):
+        # the positions are reduced before the sequence header is complete
+        _INLINE_STATE.buffer.add_sequence(
+            name, attr[0][1], _INLINE_STATE.pos_names, _INLINE_STATE.pos_values
+        )
+        _INLINE_STATE.pos_names = []
+        _INLINE_STATE.pos_values = array("d")
+
+    def true(self, *attr):
+        return True
+
+    def start(self, *statements):
+        pass
+
+
+def _parse_inline(string: str) -> _TableBuffer:
+    """Method to parse a string with the lark grammar into a _TableBuffer without a tree."""
+    _INLINE_STATE.buffer = buffer = _TableBuffer()
+    _INLINE_STATE.pos_names = []
+    _INLINE_STATE.pos_values = array("d")
+    _get_inline_parser().parse(string)
+    return buffer
+
+
+def _parse_from_madx_sequence_string(string: str, engine: str = "fast"):
+    """Method to parse madx seq string to table format, bypassing the cache."""
+    if engine not in ("fast", "inline", "tree"):
+        raise ValueError("Unknown parser engine: {}".format(engine))
+
+    with stage("parse." + engine) as timing:
+        if engine == "fast":
+            buffer = _parse_fast(string)
+        elif engine == "inline":
+            buffer = _parse_inline(string)
+        else:
+            buffer = _parse_lark(string)
+        # statements parsed, element definitions and positions
+        timing.rows = len(buffer.names) + len(buffer.pos_names or ())
+
+    with stage("parse.build_table") as timing:
+        result = _build_table(buffer.name, buffer.length, *buffer.tables())
+        timing.rows = len(result[2])
+    return result
+
+
+def _cached_parse(content, parse, cache: bool):
+    """
+    Method to look up the parse result of content in the parse cache
+    and to call parse() and store its result on a miss.
+    """
+    parse_cache = get_parse_cache() if cache else None
+    if parse_cache is None:
+        return parse()
+
+    with stage("parse.cache_get"):
+        key = parse_cache.key(content, GRAMMAR_VERSION)
+        result = parse_cache.get(key)
+    if result is None:
+        result = parse()
+        with stage("parse.cache_put", rows=len(result[2])):
+            parse_cache.put(key, result)
+    elif "family" not in result[2].columns:
+        # bare lattice, warn as the parse would have
+        _warn_bare_lattice()
+
+    return result
+
+
+def parse_from_madx_sequence_string(
+    string: str, cache: bool = True, engine: str = "fast"
+) -> (str, float, pd.DataFrame):
+    """
+    Method to parse madx seq string to table format.
+
+    Arguments:
+    ----------
+    string  : str
+        madx sequence
+    cache   : bool
+        use the parse cache (see Utils.CacheUtils)
+    engine  : str
+        "fast" reads the canonical madx SAVE output with regular expressions
+        and hands everything else to the grammar, "inline" uses the grammar
+        with the table built during parsing instead of from a parse tree,
+        "tree" builds the parse tree first. All give identical results.
+
+    """
+    return _cached_parse(string, lambda: _parse_from_madx_sequence_string(string, engine), cache)
+
+
+def _iter_statements(stream, blocksize: int = 1 << 16):
+    """
+    Generator that reads a text stream in blocks and yields
+    the statements, i.e. the text between two semicolons.
+    A non-empty unterminated tail is yielded as well, so the
+    grammar can raise on it.
+    """
+    tail = ""
+    while True:
+        block = stream.read(blocksize)
+        if not block:
+            break
+        statements = (tail + block).split(";")
+        tail = statements.pop()
+        yield from statements
+
+    if tail.strip():
+        yield tail
+
+
+def _parse_statements(statements: list) -> _TableBuffer:
+    """Method to parse a list of statements with the sequence grammar."""
+    return _parse_inline("".join(s + ";" for s in statements))
+
+
+def iter_madx_sequence_stream(stream, chunksize: int = 10000):
+    """
+    Generator to parse a madx seq from a text stream in chunks.
+
+    The stream is read incrementally and every chunk of at most
+    chunksize statements is parsed on its own, so peak memory of
+    the parsing is set by the chunk size and not by the file size.
+
+    Arguments:
+    ----------
+    stream      : file-like
+        text stream containing the madx sequence
+    chunksize   : int
+        maximum number of statements parsed at once
+
+    Yields:
+    -------
+    (kind, data) tuples, where kind is one of
+
+    "elements"  : data is a table with a block of element definitions
+    "sequence"  : data is (name, length) of a sequence header
+    "positions" : data is a table with a block of element positions
+
+    """
+    header = None
+    statements = []
+
+    def flush():
+        with stage("parse.chunk", rows=len(statements)):
+            if header is None:
+                return "elements", _parse_statements(statements).tables()[1]
+
+            # wrap the sequence part in its header so the grammar accepts it
+            return (
+                "positions",
+                _parse_statements([header] + statements + ["ENDSEQUENCE"]).tables()[0],
+            )
+
+    for statement in _iter_statements(stream):
+        if header is None and _SEQUENCE_HEADER.match(statement):
+            if statements:
+                yield flush()
+                statements = []
+            header = statement
+            buffer = _parse_statements([header, "ENDSEQUENCE"])
+            yield "sequence", (buffer.name, buffer.length)
+        elif header is not None and statement.strip().upper() == "ENDSEQUENCE":
+            if statements:
+                yield flush()
+                statements = []
+            header = None
+        else:
+            statements.append(statement)
+            if len(statements) >= chunksize:
+                yield flush()
+                statements = []
+
+    if header is not None:
+        # unterminated sequence, let the grammar raise
+        _parse_statements([header] + statements)
+    if statements:
+        yield flush()
+
+
+def iter_madx_sequence_file(filename: str, chunksize: int = 10000):
+    """Generator to parse a madx seq file in chunks, see iter_madx_sequence_stream."""
     with open(filename, "r") as f:
-        string = f.read()
+        yield from iter_madx_sequence_stream(f, chunksize=chunksize)
+
+
+def parse_from_madx_sequence_chunks(chunks) -> (str, float, pd.DataFrame):
+    """
+    Method to assemble the chunks generated by iter_madx_sequence_stream
+    into the same (name, length, table) result as parse_from_madx_sequence_string.
+    """
+    name, length = None, 0.0
+    elements, positions = [], None
+
+    for kind, data in chunks:
+        if kind == "elements":
+            elements.append(data)
+        elif kind == "sequence":
+            # a new sequence replaces the previous one
+            name, length = data
+            positions = []
+        else:
+            positions.append(data)
+
+    dfpos = None
+    if positions is not None:
+        if positions:
+            dfpos = pd.concat(positions, ignore_index=True)
+        else:
+            dfpos = pd.DataFrame.from_records([], columns=["name", "pos"])
+
+    dfel = None
+    if elements:
+        dfel = pd.concat(elements, ignore_index=True)
+
+    with stage("parse.build_table") as timing:
+        result = _build_table(name, length, dfpos, dfel)
+        timing.rows = len(result[2])
+    return result
+
+
+def _hash_file(filename: str, blocksize: int = 1 << 20) -> bytes:
+    """Method to compute the content digest of a file reading it in blocks."""
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.digest()
+
+
+def parse_from_madx_sequence_file(
+    filename: str, chunksize: int = None, cache: bool = True
+) -> (str, float, pd.DataFrame):
+    """
+    Method to parse madx seq from file to table format.
+
+    Arguments:
+    ----------
+    filename    : str
+        path to the seq file
+    chunksize   : int
+        if given the file is parsed in streaming mode, chunksize
+        statements at a time (see iter_madx_sequence_stream)
+    cache       : bool
+        use the parse cache (see Utils.CacheUtils)
+
+    """
+    if chunksize is not None:
+        return _cached_parse(
+            _hash_file(filename),
+            lambda: parse_from_madx_sequence_chunks(iter_madx_sequence_file(filename, chunksize)),
+            cache,
+        )
+
+    with stage("parse.read"):
+        with open(filename, "r") as f:
+            string = f.read()
+
+    return parse_from_madx_sequence_string(string, cache=cache)
+
+
+class IncrementalSequenceParser:
+    """
+    Parser that re-parses only the statements of a madx seq that changed
+    since the previous parse and patches the previous table in place.
+
+    The statements and their hashes of the last parse are kept. Changed
+    values of element definitions and positions are patched into the rows
+    they belong to, unchanged rows are not touched. Any other change
+    (statements added or removed, renamed elements, changed families or
+    attribute sets, sequence headers, reordered positions) falls back to
+    a full parse.
+
+    Arguments:
+    ----------
+    cache   : bool
+        use the parse cache for full parses (see Utils.CacheUtils)
+
+    """
+
+    def __init__(self, cache: bool = True):
+        self.cache = cache
+        self.name = None
+        self.length = 0.0
+        self.table = None
+        self.statements = None
+        self.hashes = None
+        # number of statements patched by the last parse, None if it was a full parse
+        self.patched = None
+
+    def parse(self, string: str) -> (str, float, pd.DataFrame):
+        """Method to parse madx seq string to table format, incrementally if possible."""
+        return self.prepare(string)[1]()
+
+    def parse_file(self, filename: str) -> (str, float, pd.DataFrame):
+        """Method to parse madx seq from file to table format, incrementally if possible."""
+        return self.prepare_file(filename)[1]()
+
+    def prepare(self, string: str):
+        """
+        Method to check which part of the table a parse of string changes,
+        without changing anything yet.
+
+        Returns:
+        --------
+        columns : list of str
+            columns of the current table the parse patches in place, None
+            if it does a full parse and returns a new table
+        parse   : callable
+            runs the parse, returns (name, length, table) like parse
+
+        """
+        statements = string.split(";")
+        tail = statements.pop()
+        hashes = np.fromiter((hash(s) for s in statements), dtype=np.int64, count=len(statements))
+
+        with stage("parse.incremental") as timing:
+            changes = None if tail.strip() else self._changes(statements, hashes)
+            if changes is not None:
+                timing.rows = len(changes)
+
+        def parse():
+            if changes is None:
+                self.patched = None
+                self.name, self.length, self.table = parse_from_madx_sequence_string(
+                    string, cache=self.cache
+                )
+            else:
+                # all changes are validated before the table is modified
+                for _, apply in changes:
+                    apply()
+                self.patched = int((hashes != self.hashes).sum())
+
+            self.statements = statements
+            self.hashes = hashes
+
+            return self.name, self.length, self.table
+
+        if changes is None:
+            return None, parse
+        return sorted({column for columns, _ in changes for column in columns}), parse
+
+    def prepare_file(self, filename: str):
+        """Method to prepare the parse of a madx seq file, see prepare."""
+        with open(filename, "r") as f:
+            string = f.read()
+
+        return self.prepare(string)
+
+    def _changes(self, statements: list, hashes: np.ndarray) -> list:
+        """
+        Method to return the changes patching the changed statements into
+        the table as (columns, apply) pairs, None if a full parse is needed.
+        """
+        if self.table is None or self.hashes is None or len(hashes) != len(self.hashes):
+            return None
+        if "pos" not in self.table.columns or "family" not in self.table.columns:
+            return None
+
+        # positions as they will be after the patch, to check the order
+        positions = self.table["pos"].to_numpy().copy()
+
+        changes = []
+        for i in np.flatnonzero(hashes != self.hashes):
+            change = self._change(statements, i, positions)
+            if change is None:
+                return None
+            changes.append(change)
+
+        return changes
+
+    def _change(self, statements: list, i: int, positions: np.ndarray):
+        """
+        Method to return the columns patched by statement i and a callable
+        patching it into the table, None if not possible.
+        """
+        old, new = self.statements[i], statements[i]
+
+        match_old = _FAST_ELEMENT.fullmatch(old)
+        match_new = _FAST_ELEMENT.fullmatch(new)
+        if match_old is not None and match_new is not None:
+            return self._change_element(statements, i, match_old, match_new)
+
+        match_old = _FAST_POSITION.fullmatch(old)
+        match_new = _FAST_POSITION.fullmatch(new)
+        if match_old is not None and match_new is not None:
+            return self._change_position(match_old, match_new, positions)
+
+        return None
+
+    def _change_element(self, statements: list, i: int, match_old, match_new):
+        name, family, attributes = match_new.groups()
+        name, family = name.upper(), family.upper()
+        if (name, family) != (match_old.group(1).upper(), match_old.group(2).upper()):
+            return None
+        if family.startswith("SEQUENCE"):
+            return None
+
+        attributes = dict(_fast_attributes(attributes))
+        old_attributes = dict(_fast_attributes(match_old.group(3)))
+        if set(attributes) != set(old_attributes):
+            return None
+        # only the values that changed are patched
+        attributes = {
+            key: value for key, value in attributes.items() if value != old_attributes[key]
+        }
+
+        # a later definition of the same element wins
+        redefined = re.compile(r"\s*{}\s*:".format(re.escape(name)), re.IGNORECASE)
+        if any(redefined.match(s) for s in statements[i + 1 :]):
+            return (), lambda: None
+
+        table = self.table
+        rows = np.flatnonzero(table["name"].to_numpy() == name)
+        for key, value in attributes.items():
+            if key not in table.columns:
+                return None
+            # a value of another type changes the dtype of the column
+            boolean = isinstance(table[key].dtype, pd.BooleanDtype)
+            if isinstance(value, bool) != boolean and table[key].dtype != object:
+                return None
+
+        def apply():
+            for key, value in attributes.items():
+                table.iloc[rows, table.columns.get_loc(key)] = value
+
+        return list(attributes), apply
+
+    def _change_position(self, match_old, match_new, positions: np.ndarray):
+        name, neg, value = match_new.groups()
+        name = name.upper()
+        if name != match_old.group(1).upper() or name.startswith("ENDSEQUENCE"):
+            return None
+
+        _, neg_old, value_old = match_old.groups()
+        pos = -float(value) if neg else float(value)
+        pos_old = -float(value_old) if neg_old else float(value_old)
+
+        table = self.table
+        rows = np.flatnonzero((table["name"].to_numpy() == name) & (positions == pos_old))
+        if len(rows) == 0:
+            # positions of undefined elements are not in the table
+            return (), lambda: None
+        if len(rows) > 1:
+            return None
+
+        # the row must keep its place in the sorted table
+        row = rows[0]
+        if (row > 0 and positions[row - 1] >= pos) or (
+            row < len(positions) - 1 and positions[row + 1] <= pos
+        ):
+            return None
+        positions[row] = pos
+
+        columns = [column for column in ("pos", "at") if column in table.columns]
+
+        def apply():
+            for column in columns:
+                table.iloc[row, table.columns.get_loc(column)] = pos
+
+        return columns, apply
+
+
+def _parse_file_to_arrays(filename: str, chunksize: int, cache: bool):
+    """
+    Worker of parse_many, returns the parsed table in columnar form
+    so it is sent back to the parent as a few NumPy buffers.
+    """
+    return table_to_arrays(*parse_from_madx_sequence_file(filename, chunksize, cache))
+
+
+def parse_many(
+    filenames,
+    workers: int = None,
+    ordered: bool = True,
+    chunksize: int = None,
+    cache: bool = True,
+):
+    """
+    Method to parse many madx seq files in parallel in a process pool.
+
+    Failing files do not abort the batch, their error is reported
+    in the result instead.
+
+    Arguments:
+    ----------
+    filenames   : iterable of str
+        paths to the seq files
+    workers     : int
+        number of worker processes, defaults to the number of cpus
+    ordered     : bool
+        if True return a list in input order, else return an iterator
+        yielding the results as they complete
+    chunksize   : int
+        passed on to parse_from_madx_sequence_file
+    cache       : bool
+        passed on to parse_from_madx_sequence_file
+
+    Returns:
+    --------
+    (filename, result, error) tuples, where result is (name, length, table)
+    and error is None on success, or result is None and error the exception.
+
+    """
+    filenames = list(filenames)
+    workers = workers or os.cpu_count() or 1
+    results = _parse_many(filenames, min(workers, max(len(filenames), 1)), chunksize, cache)
+
+    if ordered:
+        out = [None] * len(filenames)
+        for i, item in results:
+            out[i] = item
+        return out
+
+    return (item for _, item in results)
+
 
-    return parse_from_madx_sequence_string(string)
+def _parse_many(filenames: list, workers: int, chunksize: int, cache: bool):
+    """Generator yielding (input index, (filename, result, error)) in completion order."""
+    # the parse cache set in this process is not inherited by spawned workers
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_parse_cache, initargs=(get_parse_cache(),)
+    ) as pool:
+        futures = {
+            pool.submit(_parse_file_to_arrays, filename, chunksize, cache): i
+            for i, filename in enumerate(filenames)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            error = future.exception()
+            result = None if error is not None else arrays_to_table(*future.result())
+            yield i, (filenames[i], result, error)
@@ -0,0 +1,34 @@
+import pytest
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.CacheUtils import (
+    CACHE_DIR_ENV,
+    ParseCache,
+    get_parse_cache,
+    set_parse_cache,
+)
+
+from .test_madx_seq_parser import seq_str
+
+
+@pytest.fixture(autouse=True, scope="session")
+def parser_cache_dir(tmp_path_factory):
+    """Cache the parser tables in a temporary directory instead of the home directory."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv(CACHE_DIR_ENV, str(tmp_path_factory.mktemp("parser_cache")))
+        yield
+
+
+@pytest.fixture(autouse=True)
+def parse_cache(tmp_path):
+    """Use a fresh parse cache in a temporary directory for every test."""
+    previous = get_parse_cache()
+    cache = ParseCache(tmp_path / "parse_cache")
+    set_parse_cache(cache)
+    yield cache
+    set_parse_cache(previous)
+
+
+@pytest.fixture
+def parsed():
+    """Name, length and table of the test sequence, parsed without the cache."""
+    return parse_from_madx_sequence_string(seq_str, cache=False)
@@ -0,0 +1,86 @@
+import pandas as pd
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.CompactUtils import compact_table, dense_table, table_memory_report
+from pandas.testing import assert_frame_equal
+
+from .test_madx_seq_parser import seq_str
+
+
+def test_compact_table(parsed):
+    _, _, df = parsed
+    compact = compact_table(df)
+
+    assert compact["K1"].dtype == pd.SparseDtype(float)
+    assert compact["ANGLE"].dtype == pd.SparseDtype(float)
+    assert compact["L"].dtype == float
+    assert compact["pos"].dtype == float
+    assert compact["K1"].array.sp_values.tolist() == [1.2, -1.2, 1.2]
+
+    assert compact_table(compact) is compact
+    assert dense_table(df) is df
+    assert_frame_equal(dense_table(compact), df)
+
+
+def test_table_memory_report(parsed):
+    _, _, df = parsed
+    report = table_memory_report(compact_table(df))
+
+    assert report["compact"] < report["dense"]
+    assert report["table"] == report["compact"]
+    assert report["columns"]["ANGLE"]["compact"] < report["columns"]["ANGLE"]["dense"]
+    assert report["columns"]["pos"]["compact"] == report["columns"]["pos"]["dense"]
+
+
+def test_lattice_adaptor_compact(parsed, tmp_path):
+    name, length, df = parsed
+    dense = LatticeAdaptor(name=name, len=length, table=df)
+    lattice = LatticeAdaptor(compact=True)
+    lattice.load_from_madx_sequence_string(seq_str)
+
+    assert lattice.table["K1"].dtype == pd.SparseDtype(float)
+    assert lattice.parse_table_to_madx_sequence_string() == (
+        dense.parse_table_to_madx_sequence_string()
+    )
+    assert lattice.parse_table_to_elegant_string() == dense.parse_table_to_elegant_string()
+    assert lattice.get_quad_strengths() == dense.get_quad_strengths()
+
+    lattice.load_strengths_to_table({"QF": 1.3}, "K1")
+    assert lattice.get_quad_strengths() == {"QF": 1.3, "QD": -1.2}
+    assert lattice.table["K1"].dtype == pd.SparseDtype(float)
+    lattice.undo()
+    assert lattice.get_quad_strengths() == {"QF": 1.2, "QD": -1.2}
+
+    lattice.save_binary(str(tmp_path))
+    lattice.load_binary(str(tmp_path))
+    assert_frame_equal(lattice.table, compact_table(df))
+
+    lattice.compact = False
+    assert_frame_equal(lattice.table, df)
+    assert lattice.memory_report()["table"] == lattice.memory_report()["dense"]
+
+
+def test_lattice_adaptor_compact_incremental_load(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+    lattice = LatticeAdaptor(compact=True)
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    table = lattice.table
+
+    filename.write_text(seq_str.replace("K1:=-1.2", "K1:=-1.1"))
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+
+    # the statement is patched, not the whole file parsed again, and the
+    # changed column is copied into the compact table and journaled alone
+    assert lattice._incremental.patched == 1
+    assert lattice.table is table
+    entry = lattice.history._undo[-1]
+    assert entry.tables is None and list(entry.cells) == ["K1"]
+    assert lattice.table["K1"].dtype == pd.SparseDtype(float)
+    assert lattice.get_quad_strengths() == {"QF": 1.2, "QD": -1.1}
+    assert_frame_equal(
+        dense_table(lattice.table), parse_from_madx_sequence_string(filename.read_text())[2]
+    )
+
+    lattice.undo()
+    assert lattice.get_quad_strengths() == {"QF": 1.2, "QD": -1.2}
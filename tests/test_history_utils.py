@@ -0,0 +1,126 @@
+import pandas as pd
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.HistoryUtils import HistoryJournal
+from pandas.testing import assert_frame_equal
+
+from .test_madx_seq_parser import seq_str
+
+
+def test_undo_redo_strengths():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    loaded = lattice.table.copy()
+
+    lattice.load_strengths_to_table({"QF": 1.3}, "K1")
+    changed = lattice.table.copy()
+
+    # only the changed cells are kept
+    entry = lattice.history._undo[-1]
+    assert entry.tables is None
+    assert list(entry.cells) == ["K1"]
+    assert entry.cells["K1"][0].tolist() == [0, 4]
+
+    assert lattice.undo()
+    assert_frame_equal(lattice.table, loaded)
+    assert lattice.redo()
+    assert_frame_equal(lattice.table, changed)
+    assert not lattice.redo()
+
+    assert lattice.undo() and lattice.undo()
+    assert (lattice.name, lattice.len, lattice.table) == (None, 0.0, None)
+    assert not lattice.undo()
+
+
+def test_undo_new_column():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    loaded = lattice.table.copy()
+
+    lattice.load_strengths_to_table({"QF": 0.1}, "K2")
+    assert "K2" in lattice.table
+
+    lattice.undo()
+    assert_frame_equal(lattice.table, loaded)
+
+
+def test_undo_incremental_load(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    loaded = lattice.table.copy()
+
+    filename.write_text(seq_str.replace("K1:=-1.2", "K1:=-1.1"))
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    lattice.undo()
+    assert_frame_equal(lattice.table, loaded)
+
+    # the incremental parser starts over after an undo
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    assert lattice.table.loc[lattice.table["name"] == "QD", "K1"].to_list() == [-1.1]
+
+
+def test_new_step_clears_redo():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    lattice.load_strengths_to_table({"QF": 1.3}, "K1")
+    lattice.undo()
+
+    lattice.load_strengths_to_table({"QD": -1.3}, "K1")
+    assert lattice.history.memory_usage()["redo"] == 0
+    assert not lattice.redo()
+
+
+def test_depth_and_memory_limits():
+    name, length, df = parse_from_madx_sequence_string(seq_str, cache=False)
+    lattice = LatticeAdaptor(history_depth=3)
+    lattice.load_from_madx_sequence_string(seq_str)
+    for i in range(5):
+        lattice.load_strengths_to_table({"QF": 1.0 + i}, "K1")
+
+    assert len(lattice.history) == 3
+    while lattice.undo():
+        pass
+    assert lattice.table.loc[0, "K1"] == 2.0
+
+    journal = HistoryJournal(max_depth=None, max_memory=0)
+    lattice = LatticeAdaptor(name=name, len=length, table=df)
+    with journal.record(lattice, columns=()):
+        lattice.table = pd.DataFrame()
+    assert len(journal) == 0
+    assert journal.memory_usage()["nbytes"] == 0
+
+
+def test_incremental_load_records_patched_cells(tmp_path, monkeypatch):
+    seq = "".join("Q{0}: QUADRUPOLE, L=0.5, K1={0};\n".format(i) for i in range(20000))
+    seq += "RING: SEQUENCE, L=20000;\n"
+    seq += "".join("Q{0}, at = {0};\n".format(i) for i in range(20000)) + "ENDSEQUENCE;\n"
+    filename = tmp_path / "ring.seq"
+    filename.write_text(seq)
+
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    before = lattice.history.nbytes
+
+    # columns the journal copies before the change
+    recorded = []
+    record = lattice.history.record
+    monkeypatch.setattr(
+        lattice.history,
+        "record",
+        lambda owner, columns=None: recorded.append(columns) or record(owner, columns),
+    )
+
+    filename.write_text(
+        seq.replace("Q7: QUADRUPOLE, L=0.5, K1=7;", "Q7: QUADRUPOLE, L=0.5, K1=-7;")
+    )
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+
+    # only the patched cell of K1 is kept, not a copy of the table
+    assert lattice._incremental.patched == 1
+    assert recorded == [["K1"]]
+    assert lattice.history.nbytes - before < 100
+    lattice.undo()
+    assert lattice.table.loc[7, "K1"] == 7.0
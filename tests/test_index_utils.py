@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.Utils.IndexUtils import PositionIndex, TableIndex
+
+from .test_madx_seq_parser import seq_str
+
+
+@pytest.mark.parametrize("dtype", ["category", object])
+def test_table_index_lookup(dtype):
+    column = pd.Series(["QF", "QD", None, "QF", "B1", "QF"], dtype=dtype)
+    index = TableIndex(column)
+
+    assert index.get("QF").tolist() == [0, 3, 5]
+    assert index.get("XX").tolist() == []
+
+    rows, which = index.lookup(["B1", "XX", "QF", "QD"])
+    assert rows.tolist() == [4, 0, 3, 5, 1]
+    assert which.tolist() == [0, 2, 2, 2, 3]
+
+
+def test_table_index_empty():
+    index = TableIndex(pd.Series([], dtype="category"))
+    rows, which = index.lookup(["QF"])
+    assert len(index) == 0
+    assert rows.tolist() == which.tolist() == []
+
+
+def test_get_strengths():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+
+    assert lattice.get_quad_strengths() == {"QF": 1.2, "QD": -1.2}
+    names, values = lattice.get_strengths("QUADRUPOLE", "K1", as_dict=False)
+    assert names.tolist() == ["QF", "QD", "QF"]
+    np.testing.assert_array_equal(values, [1.2, -1.2, 1.2])
+
+    names, _ = lattice.get_strengths(["RFCAVITY", "SBEND"], "L", as_dict=False)
+    assert names.tolist() == ["B1", "C1"]
+
+
+def test_load_strengths_to_table():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+
+    lattice.load_strengths_to_table({"QF": 1.3, "UNKNOWN": 1.0, "QD": -1.3}, "K1")
+    assert lattice.get_quad_strengths() == {"QF": 1.3, "QD": -1.3}
+
+    lattice.load_strengths_to_table({"QF": 0.5}, "K2")
+    assert lattice.table["K2"].isna().sum() == len(lattice.table) - 2
+    strengths = lattice.get_strengths("QUADRUPOLE", "K2")
+    assert strengths["QF"] == 0.5
+    assert np.isnan(strengths["QD"])
+
+
+def test_indexes_invalidated():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    assert lattice.get_quad_strengths() == {"QF": 1.2, "QD": -1.2}
+
+    lattice.load_from_madx_sequence_string(seq_str.replace("QD, at", "QF, at"))
+    assert lattice.get_strengths("QUADRUPOLE", "K1", as_dict=False)[0].tolist() == ["QF"] * 3
+
+    lattice.add_drifts()
+    lattice.load_strengths_to_table({"QF": 1.0}, "K1")
+    assert lattice.table.loc[lattice.table["name"] == "QF", "K1"].to_list() == [1.0] * 3
+
+    lattice.undo()
+    lattice.undo()
+    assert lattice.get_strengths("QUADRUPOLE", "K1", as_dict=False)[0].tolist() == ["QF"] * 3
+
+
+def _rows(index, selections) -> list:
+    """Rows of the selections returned by PositionIndex, in order."""
+    return [row for selection in selections for row in np.arange(len(index))[selection]]
+
+
+def test_position_index_overlapping():
+    # long element 0 overlaps the short ones after it
+    index = PositionIndex([5.0, 1.0, 2.0, 6.0, 9.0], [10.0, 1.0, 0.0, 1.0, 1.0], length=10.0)
+
+    assert index.overlapping(0.2, 2.2) == [slice(0, 3)]
+    assert index.overlapping(1.8, 2.2)[0].tolist() == [0, 2]
+    assert _rows(index, index.overlapping(2.1, 2.2)) == [0]
+    assert index.at(9.2).tolist() == [0, 4]
+    # the long element does not hide the elements after it from the search
+    assert len(index.layers) == 2
+
+    index = PositionIndex([1.0, 2.0, 6.0, 9.0], [1.0, 0.0, 1.0, 1.0], length=10.0)
+    assert index.overlapping(2.1, 2.2) == [slice(0, 0)]
+    assert index.overlapping(8.0, 11.0) == [slice(3, 4), slice(0, 1)]
+    assert index.overlapping(-2.0, 1.0) == [slice(3, 4), slice(0, 1)]
+    assert index.overlapping(0.0, 12.0) == [slice(0, 4)]
+
+
+def test_position_index_wrapped_extents():
+    # element 0 crosses the start of the ring, element 3 its end
+    index = PositionIndex([0.0, 2.0, 6.0, 9.9], [1.0, 1.0, 1.0, 0.6], length=10.0)
+
+    assert _rows(index, [index.at(9.8)]) == [0, 3]
+    assert _rows(index, [index.at(0.1)]) == [0, 3]
+    assert _rows(index, [index.at(-0.1)]) == [0, 3]
+    assert _rows(index, index.overlapping(9.0, 10.2)) == [0, 3]
+    assert _rows(index, index.overlapping(0.3, 1.6)) == [0, 1]
+    assert _rows(index, index.overlapping(3.0, 5.0)) == []
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_position_index_random_extents(seed):
+    rng = np.random.default_rng(seed)
+    length = 100.0
+    pos = rng.uniform(0.0, length, 300)
+    # mostly short elements, some long ones overlapping many others
+    L = np.where(rng.uniform(size=300) < 0.05, rng.uniform(5.0, 40.0, 300), rng.uniform(0, 1, 300))
+    index = PositionIndex(pos, L, length)
+
+    start, end = pos - L / 2, pos + L / 2
+    for s1, span in zip(rng.uniform(-10.0, 110.0, 50), rng.uniform(0.0, 30.0, 50)):
+        s2 = s1 + span
+        a = s1 % length
+        parts = [(a, a + span)] if a + span <= length else [(a, length), (0.0, a + span - length)]
+        expected = {
+            row
+            for a, b in parts
+            for shift in (-length, 0.0, length)
+            for row in np.flatnonzero((start + shift <= b) & (end + shift >= a))
+        }
+        rows = _rows(index, index.overlapping(s1, s2))
+        assert len(rows) == len(set(rows))
+        assert set(rows) == expected
+
+
+def test_position_index_unsorted():
+    index = PositionIndex([6.0, 1.0, 2.0], [1.0, 1.0, 0.0])
+    assert index.overlapping(0.0, 2.0)[0].tolist() == [1, 2]
+    assert index.overlapping(1.9, 6.0)[0].tolist() == [2, 0]
+
+
+def test_lattice_position_queries():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+
+    between = lattice.elements_between(0.6, 5.0)
+    assert between["name"].to_list() == ["M1", "B1", "QD"]
+    assert np.shares_memory(between["pos"].to_numpy(), lattice.table["pos"].to_numpy())
+
+    assert lattice.elements_between(9.0, 10.6)["name"].to_list() == ["C1", "QF"]
+    assert lattice.element_at(3.2)["name"].to_list() == ["B1"]
+    assert lattice.element_at(13.2)["name"].to_list() == ["B1"]
+    assert lattice.element_at(4.0).empty
+
+    assert lattice.nearest_element("QUADRUPOLE", 6.5).index.to_list() == [4]
+    assert lattice.nearest_element("QUADRUPOLE", 9.8).index.to_list() == [0]
+    assert lattice.nearest_element("SEXTUPOLE", 1.0).empty
+
+    # the position index follows changes of the table
+    lattice.add_drifts()
+    assert lattice.element_at(4.0)["name"].to_list() == ["D3"]
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.Utils.LatticeUtils import add_drifts_to_table, compare_lattices
+
+from .test_madx_seq_parser import seq_str
+
+
+def test_add_drifts_to_table():
+    _, length, df = parse_from_madx_sequence_string(seq_str, cache=False)
+    out = add_drifts_to_table(df, length)
+
+    assert out["name"].to_list() == [
+        "QF", "D1", "M1", "D2", "B1", "D3", "QD", "D4", "QF", "D5", "C1", "D6"
+    ]  # fmt: skip
+    drifts = out[out["family"] == "DRIFT"]
+    np.testing.assert_allclose(drifts["L"], [0.5, 1.5, 1.5, 1.25, 1.6, 0.85])
+    np.testing.assert_allclose(drifts["pos"], [0.75, 1.75, 4.25, 6.125, 8.05, 9.575])
+
+    # the drifts fill the sequence without gaps
+    end = (out["pos"] + out["L"] / 2).to_numpy()
+    start = (out["pos"] - out["L"] / 2).to_numpy()
+    np.testing.assert_allclose(start[1:], end[:-1])
+    assert end[-1] == pytest.approx(length)
+
+    assert out["name"].dtype == "category"
+    assert out.index.equals(pd.RangeIndex(len(out)))
+    assert out.loc[out["family"] == "DRIFT", "K1"].isna().all()
+    assert out.loc[out["name"] == "QD", "K1"].to_list() == [-1.2]
+
+
+def test_add_drifts_min_gap():
+    # M0 directly at the end of QF
+    string = "M0: MARKER;\n" + seq_str.replace("M1, at = 1.0;", "M0, at = 0.5;\nM1, at = 1.0;")
+    _, length, df = parse_from_madx_sequence_string(string, cache=False)
+
+    # by default zero length gaps get a drift as well
+    out = add_drifts_to_table(df, length)
+    assert out["name"].to_list()[:4] == ["QF", "D1", "M0", "D2"]
+    assert out.loc[1, "L"] == 0.0
+
+    out = add_drifts_to_table(df, length, min_gap=0.0)
+    assert out["name"].to_list()[:4] == ["QF", "M0", "D1", "M1"]
+
+    out = add_drifts_to_table(df, length, min_gap=1.0)
+    assert out.loc[out["family"] == "DRIFT", "L"].to_list() == [1.5, 1.5, 1.25, 1.6]
+
+
+def test_lattice_adaptor_add_drifts():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    table = lattice.table
+
+    lattice.add_drifts()
+    assert len(lattice.table) == 12
+
+    lattice.undo()
+    assert lattice.table is table
+
+
+def table_rows(df, *columns):
+    return list(zip(*(df[column].to_list() for column in columns)))
+
+
+def test_compare_lattices():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    changed = (
+        seq_str.replace("QF, at = 0.25;", "QF, at = 0.250000000001;\nM1, at = 0.5;")
+        .replace("QD, at = 5.25;", "QD, at = 5.3;")
+        .replace("C1, at = 9.0;\n", "")
+    )
+    _, _, df = parse_from_madx_sequence_string(changed, cache=False)
+
+    result = lattice.compare(df)
+    assert result["matched"]["name"].to_list() == ["QF", "M1", "B1", "QF"]
+    assert result["matched"]["ds"].abs().max() < 1e-9
+    assert table_rows(result["moved"], "name", "pos1", "pos2") == [("QD", 5.25, 5.3)]
+    assert result["moved"]["ds"].to_list() == pytest.approx([0.05])
+    assert table_rows(result["removed"], "name", "pos") == [("C1", 9.0)]
+    assert table_rows(result["added"], "name", "pos") == [("M1", 0.5)]
+    assert result["added"]["family"].dtype == "category"
+
+    # the shift of QF is only a mismatch below its size
+    assert "QF" in compare_lattices(lattice, df, tolerance=1e-13)["moved"]["name"].to_list()
+
+
+def test_compare_lattice_files(tmp_path):
+    path1, path2 = tmp_path / "a.seq", tmp_path / "b.seq"
+    path1.write_text(seq_str)
+    path2.write_text(seq_str.replace("B1, at = 3.0;", "B1, at = 3.5;"))
+
+    result = compare_lattices(str(path1), path2, cache=False)
+    assert len(result["matched"]) == 5
+    assert result["moved"]["name"].to_list() == ["B1"]
+    assert result["added"].empty and result["removed"].empty
@@ -1,3 +1,7 @@
+import json
+import subprocess
+import sys
+
 import pandas as pd
 import pytest
 from latticeadaptors import (
@@ -15,7 +19,9 @@ seq_str_test = [
     """,
         None,
         0.0,
-        pd.DataFrame([{"family": "MARKER", "name": "TESTMARKER"}]),
+        pd.DataFrame([{"family": "MARKER", "name": "TESTMARKER"}]).astype(
+            {"name": "category", "family": "category"}
+        ),
     ),
     (
         """
@@ -25,7 +31,7 @@ seq_str_test = [
     """,
         "FODO",
         8.0,
-        pd.DataFrame([{"name": "QF", "pos": 2.0}]),
+        pd.DataFrame([{"name": "QF", "pos": 2.0}]).astype({"name": "category"}),
     ),
 ]
 
@@ -39,6 +45,29 @@ table_to_seq = [
 ]
 
 
+# import budget of the package, measured in a fresh interpreter
+IMPORT_TIME_BUDGET = 0.25
+IMPORT_MODULE_BUDGET = 100
+IMPORT_CHECK = """
+import json, sys, time
+before = set(sys.modules)
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"time": elapsed, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+def import_stats(module):
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout)
+
+
 def test_version():
     assert __version__ == "0.1.0"
 
@@ -55,5 +84,17 @@ def test_parse_from_madx_seqeunce_string(string, expected_name, expected_len, ex
 
 @pytest.mark.parametrize("name, df, length, string", table_to_seq)
 def test_parse_to_madx_seqeunce_string(name, df, length, string):
-    newstring = parse_table_to_madx_sequence_string(name, df, length)
+    newstring = parse_table_to_madx_sequence_string(name, length, df)
     assert string == newstring
+
+
+def test_import_budget():
+    stats = import_stats("latticeadaptors")
+    assert stats["time"] < IMPORT_TIME_BUDGET
+    assert len(stats["modules"]) < IMPORT_MODULE_BUDGET
+
+
+@pytest.mark.parametrize("module", ["latticeadaptors", "latticeadaptors.core"])
+def test_import_skips_optional_backends(module):
+    loaded = {name.split(".")[0] for name in import_stats(module)["modules"]}
+    assert not loaded & {"cpymad", "matplotlib", "mpl_toolkits", "termcolor", "pymongo"}
@@ -0,0 +1,380 @@
+import io
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+import pandas as pd
+import pytest
+from lark.exceptions import LarkError
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.parsers import madx_seq_parser
+from latticeadaptors.parsers.madx_seq_parser import (
+    IncrementalSequenceParser,
+    iter_madx_sequence_stream,
+    parse_from_madx_sequence_chunks,
+    parse_from_madx_sequence_file,
+    parse_from_madx_sequence_string,
+    parse_many,
+)
+from latticeadaptors.Utils import CacheUtils
+from latticeadaptors.Utils.StorageUtils import save_table_npz
+from pandas.testing import assert_frame_equal
+
+seq_str = """
+QF: QUADRUPOLE, L:=0.5, K1:=1.2;
+QD: QUADRUPOLE, L=0.5, K1:=-1.2;
+B1: SBEND, L:=1.0, ANGLE:=0.1, E1:=0.05, E2:=0.05;
+M1: MARKER;
+C1: RFCAVITY, L:=0.3, VOLT:=1.5, NO_CAVITY_TOTALPATH=true;
+FODO: SEQUENCE, L=10.0;
+QF, at = 0.25;
+M1, at = 1.0;
+B1, at = 3.0;
+QD, at = 5.25;
+QF, at = 7.0;
+C1, at = 9.0;
+ENDSEQUENCE;
+"""
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 4, 10000])
+def test_streaming_parse_equals_string_parse(chunksize):
+    name, length, df = parse_from_madx_sequence_string(seq_str)
+    sname, slength, sdf = parse_from_madx_sequence_chunks(
+        iter_madx_sequence_stream(io.StringIO(seq_str), chunksize=chunksize)
+    )
+
+    assert sname == name
+    assert slength == length
+    assert_frame_equal(sdf, df)
+
+
+def test_streaming_parse_chunks():
+    kinds = [kind for kind, _ in iter_madx_sequence_stream(io.StringIO(seq_str), chunksize=2)]
+    assert kinds == ["elements"] * 3 + ["sequence"] + ["positions"] * 3
+
+
+def test_streaming_parse_file(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    name, length, df = parse_from_madx_sequence_file(str(filename), chunksize=3)
+    assert name == "FODO"
+    assert length == 10.0
+    assert df["name"].to_list() == ["QF", "M1", "B1", "QD", "QF", "C1"]
+
+
+def test_parse_cache_hit_returns_identical_table(parse_cache, tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    first = parse_from_madx_sequence_file(str(filename))
+    second = parse_from_madx_sequence_file(str(filename))
+
+    assert (parse_cache.hits, parse_cache.misses) == (1, 1)
+    assert second[:2] == first[:2]
+    assert_frame_equal(second[2], first[2])
+    assert second[2] is not first[2]
+
+
+def test_parse_cache_content_addressed(parse_cache, tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+    parse_from_madx_sequence_file(str(filename))
+
+    filename.write_text(seq_str.replace("K1:=1.2", "K1:=1.3"))
+    _, _, df = parse_from_madx_sequence_file(str(filename))
+
+    assert parse_cache.misses == 2
+    assert df.loc[df["name"] == "QF", "K1"].to_list() == [1.3, 1.3]
+
+    parse_from_madx_sequence_string(seq_str)
+    assert parse_cache.hits == 1
+
+
+def test_parse_cache_lru_eviction(parse_cache):
+    parse_from_madx_sequence_string(seq_str)
+    parse_cache.max_size = parse_cache.stats()["size"]
+
+    parse_from_madx_sequence_string(seq_str.replace("L=10.0", "L=11.0"))
+    stats = parse_cache.stats()
+    assert stats["entries"] == 1
+    assert stats["size"] <= parse_cache.max_size
+
+    # the remaining entry is the most recent one
+    parse_from_madx_sequence_string(seq_str.replace("L=10.0", "L=11.0"))
+    assert parse_cache.hits == 1
+
+
+def test_parse_cache_does_not_pickle(parse_cache):
+    name, length, df = parse_from_madx_sequence_string(seq_str, cache=False)
+    df = df.assign(note=[1, "a", None, 2.5, "b", True])
+    key = parse_cache.key("pickled", "test")
+
+    parse_cache.put(key, (name, length, df))
+    assert parse_cache.stats()["entries"] == 0
+
+    # an entry with pickled columns written by someone else is dropped, not loaded
+    with parse_cache._path(key).open("wb") as f:
+        save_table_npz(name, length, df, f)
+    assert parse_cache.get(key) is None
+    assert parse_cache.stats()["entries"] == 0
+
+
+def test_parse_cache_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv(CacheUtils.CACHE_ENV, raising=False)
+    assert CacheUtils._default_cache() is None
+
+    monkeypatch.setenv(CacheUtils.CACHE_ENV, "1")
+    monkeypatch.setenv(CacheUtils.CACHE_DIR_ENV, str(tmp_path))
+    assert CacheUtils._default_cache().directory == tmp_path
+
+
+def test_parse_cache_hit_warns_bare_lattice(parse_cache, capsys):
+    string = "FODO: SEQUENCE, L=8;\nQF  , at = 2.000;\nENDSEQUENCE;"
+    first = parse_from_madx_sequence_string(string)
+    second = parse_from_madx_sequence_string(string)
+
+    assert parse_cache.hits == 1
+    assert_frame_equal(second[2], first[2])
+    assert capsys.readouterr().out.count("Warning: bare lattice") == 2
+
+
+# layout of madx SAVE, SEQUENCE=...; output
+save_str = """qf: quadrupole,l:= 0.5,k1:= 1.2;
+m1: marker;
+b1: sbend,l:= 1,angle:= 0.1,e1:= 0.05;
+qd: quadrupole,l:= 0.5,k1:= -0.0012;
+c1: rfcavity,l:= 0.3,volt:= 1.5,freq:= 500,no_cavity_totalpath=true;
+fodo: sequence, l = 10;
+qf, at = 0.25;
+m1, at = 1;
+b1, at = 3;
+qd, at = 5.25;
+qf, at = 7;
+c1, at = 9;
+endsequence;
+"""
+
+
+@pytest.mark.parametrize(
+    "string",
+    [
+        save_str,
+        seq_str,
+        # not recognised by the fast path, handed to the grammar
+        save_str.replace("qd, at = 5.25;", "qd, at = - -5.25;"),
+        save_str.replace("m1: marker;", "m1: marker, l = - - 0;"),
+        "testmarker : MARKER;",
+        "FODO: SEQUENCE, L=8;\nQF  , at = 2.000;\nENDSEQUENCE;",
+    ],
+)
+@pytest.mark.parametrize("engine", ["fast", "inline"])
+def test_engines_equal_tree_engine(string, engine):
+    name, length, df = parse_from_madx_sequence_string(string, cache=False, engine="tree")
+    ename, elength, edf = parse_from_madx_sequence_string(string, cache=False, engine=engine)
+
+    assert ename == name
+    assert elength == length
+    assert_frame_equal(edf, df)
+
+
+@pytest.mark.parametrize("engine", ["fast", "inline"])
+def test_engines_raise_on_invalid_input(engine):
+    with pytest.raises(LarkError):
+        parse_from_madx_sequence_string("qf: quadrupole, l = 1", cache=False, engine=engine)
+
+
+@pytest.mark.parametrize("engines", [("inline", "tree"), ("tree", "inline")])
+def test_engines_share_lark_cache_directory(tmp_path, engines):
+    # the lark tables are cached on disk, a parser built in a new process
+    # from the cache of the other engine must not pick up its transformer
+    env = dict(os.environ, LATTICEADAPTORS_CACHE_DIR=str(tmp_path))
+    code = (
+        "from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string\n"
+        "print(parse_from_madx_sequence_string({!r}, cache=False, engine={!r})[2].shape)\n"
+    )
+    outputs = [
+        subprocess.run(
+            [sys.executable, "-c", code.format(seq_str, engine)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for engine in engines
+    ]
+
+    assert outputs[0] == outputs[1]
+
+
+def test_parser_tables_cached_without_parse_cache(tmp_path):
+    env = dict(os.environ, LATTICEADAPTORS_CACHE_DIR=str(tmp_path))
+    env.pop("LATTICEADAPTORS_CACHE", None)
+    code = (
+        "from latticeadaptors.Utils.CacheUtils import set_parse_cache\n"
+        "from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string\n"
+        "set_parse_cache(None)\n"
+        "parse_from_madx_sequence_string({!r}, engine='tree')\n".format(seq_str)
+    )
+
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    (cache_file,) = tmp_path.glob("madx_seq_lark_tree_*.cache")
+    mtime = cache_file.stat().st_mtime_ns
+
+    # a later process loads the tables instead of writing them again
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    assert cache_file.stat().st_mtime_ns == mtime
+    assert [path.name for path in tmp_path.iterdir()] == [cache_file.name]
+
+
+def test_parse_many(tmp_path):
+    filenames = []
+    for i in range(4):
+        filename = tmp_path / "fodo{}.seq".format(i)
+        filename.write_text(seq_str.replace("L=10.0", "L={}".format(10.0 + i)))
+        filenames.append(str(filename))
+    filenames.insert(2, str(tmp_path / "missing.seq"))
+
+    results = parse_many(filenames, workers=2)
+
+    assert [filename for filename, _, _ in results] == filenames
+    assert isinstance(results[2][2], FileNotFoundError)
+    assert results[2][1] is None
+
+    _, _, df = parse_from_madx_sequence_string(seq_str)
+    for i, (_, (name, length, table), error) in enumerate(results[:2] + results[3:]):
+        assert error is None
+        assert name == "FODO"
+        assert length == 10.0 + i
+        assert_frame_equal(table, df)
+
+
+def test_parse_many_spawned_workers_use_parse_cache(parse_cache, tmp_path, monkeypatch):
+    spawn = partial(ProcessPoolExecutor, mp_context=get_context("spawn"))
+    monkeypatch.setattr(madx_seq_parser, "ProcessPoolExecutor", spawn)
+    filenames = []
+    for i in range(2):
+        filename = tmp_path / "fodo{}.seq".format(i)
+        filename.write_text(seq_str.replace("L=10.0", "L={}".format(10.0 + i)))
+        filenames.append(str(filename))
+
+    parse_many(filenames, workers=2)
+
+    assert parse_cache.stats()["entries"] == 2
+
+
+def test_parse_many_completion_order(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    results = list(parse_many([str(filename)] * 3, workers=3, ordered=False))
+
+    assert len(results) == 3
+    assert all(error is None for _, _, error in results)
+
+
+def test_table_join_and_dtypes():
+    string = """
+    QF: QUADRUPOLE, L=1.0;
+    M1: MARKER;
+    QF: QUADRUPOLE, L=2.0;
+    C1: RFCAVITY, L=0.3, NO_CAVITY_TOTALPATH=true;
+    FODO: SEQUENCE, L=10.0;
+    M1, at = 3.0;
+    QF, at = 1.0;
+    UNDEFINED, at = 2.0;
+    C1, at = 9.0;
+    ENDSEQUENCE;
+    """
+    _, _, df = parse_from_madx_sequence_string(string, cache=False)
+
+    # sorted by position, undefined names dropped, last definition wins
+    assert df["name"].to_list() == ["QF", "M1", "C1"]
+    assert df["L"].to_list() == [2.0, 0.0, 0.3]
+    assert df["at"].to_list() == [1.0, 3.0, 9.0]
+    assert df.index.equals(pd.RangeIndex(3))
+
+    assert df["name"].dtype == "category"
+    assert df["family"].dtype == "category"
+    assert df["NO_CAVITY_TOTALPATH"].dtype == "boolean"
+    assert df["NO_CAVITY_TOTALPATH"].isna().to_list() == [True, True, False]
+
+
+@pytest.mark.parametrize(
+    "old, new, patched",
+    [
+        ("K1:=1.2", "K1:=1.25", 1),
+        ("qd, at = 5.25;", "qd, at = 5.5;", 1),
+        ("VOLT:=1.5", "VOLT:=2", 1),
+        # structural changes are parsed again completely
+        ("qd, at = 5.25;", "qd, at = 7.5;", None),
+        ("K1:=1.2", "K1:=1.2, K2:=0.1", None),
+        ("L=10.0", "L=12.0", None),
+        ("M1: MARKER;", "M1: MARKER;\nM2: MARKER;", None),
+    ],
+)
+def test_incremental_parse_equals_full_parse(old, new, patched):
+    string = seq_str.replace("QD, at", "qd, at")
+    parser = IncrementalSequenceParser(cache=False)
+    _, _, table = parser.parse(string)
+    before = table.copy()
+
+    edited = string.replace(old, new)
+    name, length, df = parser.parse(edited)
+
+    assert parser.patched == patched
+    assert (df is table) == (patched is not None)
+    assert_frame_equal(df, parse_from_madx_sequence_string(edited, cache=False)[2])
+    assert name == "FODO"
+
+    if patched:
+        changed = (df != before) & ~(df.isna() & before.isna())
+        assert changed.any(axis=1).sum() <= 2
+
+
+def test_incremental_parse_redefined_element():
+    string = seq_str.replace("M1: MARKER;", "M1: MARKER;\nQF: QUADRUPOLE, L:=0.5, K1:=1.0;")
+    parser = IncrementalSequenceParser(cache=False)
+    parser.parse(string)
+
+    # the first definition is overridden by the second one
+    _, _, df = parser.parse(string.replace("K1:=1.2", "K1:=1.3"))
+    assert parser.patched == 1
+    assert df.loc[df["name"] == "QF", "K1"].to_list() == [1.0, 1.0]
+
+    _, _, df = parser.parse(string.replace("K1:=1.0", "K1:=1.1"))
+    assert df.loc[df["name"] == "QF", "K1"].to_list() == [1.1, 1.1]
+
+
+def test_lattice_adaptor_incremental_load(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    table = lattice.table
+
+    filename.write_text(seq_str.replace("K1:=-1.2", "K1:=-1.1"))
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+
+    assert lattice.table is table
+    assert lattice.table.loc[lattice.table["name"] == "QD", "K1"].to_list() == [-1.1]
+    assert len(lattice.history) == 2
+
+
+def test_lattice_adaptor_incremental_load_after_change(tmp_path):
+    filename = tmp_path / "fodo.seq"
+    filename.write_text(seq_str)
+
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    lattice.load_strengths_to_table({"QF": 5.0}, "K1")
+
+    # the change made in between is not in the seq file, the load starts over
+    filename.write_text(seq_str.replace("K1:=-1.2", "K1:=-1.1"))
+    lattice.load_from_madx_sequence_file(str(filename), incremental=True)
+    assert_frame_equal(lattice.table, parse_from_madx_sequence_file(str(filename))[2])
@@ -0,0 +1,100 @@
+import pytest
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.Utils.MadxUtils import MadxWorker
+
+seq_str = """
+QF: QUADRUPOLE, L:=0.5, K1:=0.5;
+QD: QUADRUPOLE, L:=0.5, K1:=-0.5;
+M1: MARKER;
+FODO: SEQUENCE, L=10.0;
+QF, at = 0.25;
+QD, at = 5.25;
+ENDSEQUENCE;
+"""
+
+
+@pytest.fixture(scope="module")
+def pool():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    with lattice.madx_pool(workers=2) as pool:
+        yield pool
+
+
+def q1(table):
+    return table.attrs["summary"]["q1"]
+
+
+def test_pool_variants_start_from_base(pool):
+    base = pool.submit({}).result()
+    assert list(base.columns)[:3] == ["name", "s", "betx"]
+
+    changed, restored = pool.map([{"strengths": {"K1": {"QF": 0.6}}}, {}])
+    assert q1(changed) > q1(base)
+    assert q1(restored) == q1(base)
+
+
+def test_worker_resets_strengths():
+    worker = MadxWorker(seq_str.replace("M1: MARKER;", ""), "FODO")
+    try:
+        base = q1(worker.run({}))
+        assert q1(worker.run({"strengths": {"K1": {"QF": 0.6}}})) > base
+        # QF is back at its base value when the next variant does not set it
+        assert q1(worker.run({"strengths": {"K1": {"QD": -0.5}}})) == base
+        assert worker.runs == 3
+    finally:
+        worker.stop()
+
+
+def test_worker_input_variant(pool):
+    install = (
+        "M1: MARKER;\n"
+        "SEQEDIT, SEQUENCE=FODO; FLATTEN; INSTALL, ELEMENT=M1, AT=2.0; FLATTEN; ENDEDIT;"
+    )
+    worker = pool.workers[0]
+    with worker.lock:
+        installed = worker.run(install)
+        restored = worker.run({})
+
+    assert "m1:1" in installed["name"].to_list()
+    assert "m1:1" not in restored["name"].to_list()
+
+
+def test_pool_restarts_crashed_worker(pool):
+    for worker in pool.workers:
+        worker.madx.quit()
+    assert not any(health["alive"] for health in pool.health())
+
+    # a dead worker is restarted before it runs a variant
+    tables = pool.map([{"strengths": {"K1": {"QF": 0.6}}}, {}])
+    assert q1(tables[0]) > q1(tables[1])
+
+    health = pool.check()
+    assert all(worker["alive"] for worker in health)
+    assert [worker["restarts"] for worker in health] == [1, 1]
+
+
+def test_to_madx_matches_text_route():
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq_str)
+    lattice.load_strengths_to_table({"QF": 0.4 + 0.2}, "K1")
+
+    madx = lattice.to_madx()
+    try:
+        assert madx.elements["qf"].k1 == 0.4 + 0.2
+        assert madx.elements["qd"].k1 == -0.5
+        # MAD-X returns the entry positions of the elements
+        entry = madx.sequence["fodo"].element_positions()[1:-1]
+        assert list(entry) == (lattice.table["at"] - lattice.table["L"] / 2).to_list()
+
+        madx.input("BEAM;")
+        madx.use(sequence="FODO")
+        direct = madx.twiss(sequence="FODO").summary.q1
+    finally:
+        madx.quit()
+
+    worker = MadxWorker(lattice.parse_table_to_madx_sequence_string(), "FODO")
+    try:
+        assert direct == pytest.approx(q1(worker.run({})), rel=1e-9)
+    finally:
+        worker.stop()
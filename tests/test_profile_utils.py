@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.Utils import ProfileUtils
+from latticeadaptors.Utils.ProfileUtils import get_profile, profiling, stage, timed
+
+from .test_madx_seq_parser import seq_str
+
+
+def test_stages_of_conversion(tmp_path):
+    lattice = LatticeAdaptor()
+    with profiling() as profile:
+        lattice.load_from_madx_sequence_string(seq_str)
+        lattice.parse_table_to_elegant_string()
+        lattice.export_all(directory=str(tmp_path))
+
+    stages = profile.to_dict()["stages"]
+    rows = len(lattice.table)
+    assert stages["lattice.load_from_madx_sequence_string"]["rows"] == rows
+    assert stages["parse.build_table"]["rows"] == rows
+    assert stages["format.elegant"]["rows"] == rows
+    assert {"export.madx", "export.elegant", "export.tracy", "write"} <= set(stages)
+    assert stages["lattice.export_all"]["time"] >= stages["export.normalize"]["time"]
+    assert all(stats["peak_memory"] is None for stats in stages.values())
+
+    assert json.loads(profile.to_json(str(tmp_path / "stages.json"))) == profile.to_dict()
+    assert json.loads((tmp_path / "stages.json").read_text()) == profile.to_dict()
+    assert "parse.build_table" in profile.report()
+
+
+def test_disabled():
+    assert get_profile() is None
+    with stage("unused") as timing:
+        timing.rows = 10
+    assert timing.rows is None
+
+    with profiling() as profile:
+        with profiling() as inner:
+            with stage("inner"):
+                pass
+        assert get_profile() is profile
+    assert get_profile() is None
+    assert "inner" in inner.stages and "inner" not in profile.stages
+
+
+@pytest.mark.parametrize("reset_peak", [True, False])
+def test_memory_and_timed(monkeypatch, reset_peak):
+    if not reset_peak:
+        # Python 3.8
+        monkeypatch.setattr(ProfileUtils, "_reset_peak", None)
+
+    @timed("allocate", rows=lambda n: n)
+    def allocate(n):
+        with stage("buffer"):
+            data = bytearray(n)
+        return len(data)
+
+    with profiling(memory=True) as profile:
+        for n in (1 << 20, 1 << 22):
+            allocate(n)
+        # the peak of the larger stage before is not counted
+        with stage("small"):
+            data = bytearray(1 << 20)
+
+    stages = profile.to_dict()["stages"]
+    assert stages["allocate"]["calls"] == 2
+    assert stages["allocate"]["rows"] == (1 << 20) + (1 << 22)
+    assert stages["buffer"]["peak_memory"] >= 1 << 22
+    assert stages["allocate"]["peak_memory"] >= stages["buffer"]["peak_memory"]
+    assert 1 << 20 <= stages["small"]["peak_memory"] < 1 << 22
+
+
+def test_profile_from_env(tmp_path):
+    filename = tmp_path / "stages.json"
+    env = dict(
+        os.environ,
+        **{ProfileUtils.PROFILE_ENV: "1", ProfileUtils.PROFILE_FILE_ENV: str(filename)},
+    )
+    code = (
+        "from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string\n"
+        "parse_from_madx_sequence_string('Q: QUADRUPOLE, L=1;', cache=False)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+    stages = json.loads(filename.read_text())["stages"]
+    assert stages["parse.build_table"]["calls"] == 1
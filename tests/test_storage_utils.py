@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+from latticeadaptors.core import LatticeAdaptor
+from latticeadaptors.Utils.StorageUtils import load_table_npy, save_table_npy
+from pandas.testing import assert_frame_equal
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_npy_round_trip(parsed, tmp_path, mmap):
+    save_table_npy(*parsed, tmp_path)
+    name, length, df = load_table_npy(tmp_path, mmap=mmap)
+
+    assert (name, length) == parsed[:2]
+    assert_frame_equal(df, parsed[2])
+
+
+def test_npy_memory_mapped(parsed, tmp_path):
+    save_table_npy(*parsed, tmp_path)
+    _, _, df = load_table_npy(tmp_path)
+
+    mapped = np.load(tmp_path / "c{}.npy".format(list(df.columns).index("L")), mmap_mode="r")
+    values = df["L"].to_numpy()
+    while values.base is not None and not isinstance(values, np.memmap):
+        values = values.base
+    assert isinstance(values, np.memmap)
+
+    # copy on write, the saved table is not changed
+    df.loc[0, "L"] = -1.0
+    assert mapped[0] == parsed[2].loc[0, "L"]
+    assert_frame_equal(load_table_npy(tmp_path)[2], parsed[2])
+
+
+def test_npy_save_replaces_earlier_save(parsed, tmp_path):
+    save_table_npy(*parsed, tmp_path)
+    name, length, df = parsed
+    save_table_npy(name, length, df[["name", "at"]], tmp_path)
+
+    assert sorted(path.stem for path in tmp_path.glob("*.npy")) == sorted(
+        json.loads((tmp_path / "meta.json").read_text())["arrays"]
+    )
+    assert_frame_equal(load_table_npy(tmp_path)[2], df[["name", "at"]])
+
+
+def test_npy_unsupported_format(parsed, tmp_path):
+    save_table_npy(*parsed, tmp_path)
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    meta["format"] = -1
+    (tmp_path / "meta.json").write_text(json.dumps(meta))
+
+    with pytest.raises(ValueError):
+        load_table_npy(tmp_path)
+
+
+def test_npy_object_column_needs_allow_pickle(parsed, tmp_path):
+    name, length, df = parsed
+    df = df.assign(note=[1, "a", None, 2.5, "b", True])
+    save_table_npy(name, length, df, tmp_path)
+
+    with pytest.raises(ValueError):
+        load_table_npy(tmp_path)
+    with pytest.raises(ValueError):
+        LatticeAdaptor().load_binary(str(tmp_path))
+
+    assert_frame_equal(load_table_npy(tmp_path, allow_pickle=True)[2], df)
+    lattice = LatticeAdaptor()
+    lattice.load_binary(str(tmp_path), allow_pickle=True)
+    assert_frame_equal(lattice.table, df)
+
+
+def test_lattice_adaptor_binary_round_trip(parsed, tmp_path):
+    lattice = LatticeAdaptor(name=parsed[0], len=parsed[1], table=parsed[2])
+    lattice.save_binary(str(tmp_path))
+
+    loaded = LatticeAdaptor()
+    loaded.load_binary(str(tmp_path))
+
+    assert (loaded.name, loaded.len) == parsed[:2]
+    assert_frame_equal(loaded.table, parsed[2])
+    assert len(loaded.history) == 1
+
+
+def test_lattice_adaptor_save_to_loaded_directory(tmp_path):
+    # large enough that the arrays do not fit in the first write buffer
+    seq = "".join("Q{0}: QUADRUPOLE, L=0.5, K1={0};\n".format(i) for i in range(20000))
+    seq += "RING: SEQUENCE, L=20000;\n"
+    seq += "".join("Q{0}, at = {0};\n".format(i) for i in range(20000)) + "ENDSEQUENCE;\n"
+    lattice = LatticeAdaptor()
+    lattice.load_from_madx_sequence_string(seq)
+    lattice.save_binary(str(tmp_path))
+
+    # the loaded table memory maps the files the second save replaces
+    lattice.load_binary(str(tmp_path))
+    lattice.load_strengths_to_table({"Q1": -1.0}, "K1")
+    expected = lattice.table.copy()
+    lattice.save_binary(str(tmp_path))
+
+    assert not list(tmp_path.glob("*.tmp"))
+    assert_frame_equal(load_table_npy(tmp_path)[2], expected)
+    assert_frame_equal(lattice.table, expected)
@@ -0,0 +1,219 @@
+import gzip
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from latticeadaptors.parsers.madx_seq_parser import parse_from_madx_sequence_string
+from latticeadaptors.parsers.TableParsers import (
+    _elegant_formatter,
+    _iter_tracy_lattice,
+    _parse_table_to_madx_definitions,
+    _parse_table_to_madx_sequence_part,
+    export_table,
+    format_madx_positions,
+    parse_table_to_elegant_stream,
+    parse_table_to_elegant_string,
+    parse_table_to_madx_install_str,
+    parse_table_to_madx_remove_str,
+    parse_table_to_madx_sequence_file,
+    parse_table_to_madx_sequence_stream,
+    parse_table_to_madx_sequence_string,
+    parse_table_to_tracy_stream,
+    parse_table_to_tracy_string,
+)
+from latticeadaptors.Utils.Utils import write_chunks
+
+from .test_madx_seq_parser import seq_str
+
+
+@pytest.fixture
+def table():
+    _, _, df = parse_from_madx_sequence_string(seq_str, cache=False)
+    return df
+
+
+def test_madx_definitions(table):
+    text = _parse_table_to_madx_definitions(table)
+    assert text.splitlines() == [
+        "QF              : QUADRUPOLE  , L:=0.5, K1:=1.2;",
+        "M1              : MARKER      ;",
+        "B1              : SBEND       , L:=1.0, ANGLE:=0.1, E1:=0.05, E2:=0.05;",
+        "QD              : QUADRUPOLE  , L:=0.5, K1:=-1.2;",
+        "C1              : RFCAVITY    , L:=0.3, VOLT:=1.5, NO_CAVITY_TOTALPATH=true;",
+    ]
+
+
+def test_madx_definitions_engines_identical(table):
+    rng = np.random.default_rng(0)
+    df = pd.concat([table] * 20, ignore_index=True)
+    df["name"] = ["E{}".format(i) for i in range(len(df))]
+    df.loc[rng.random(len(df)) < 0.3, "K1"] = np.nan
+    df["THICK"] = pd.array(rng.choice([True, False, None], len(df)), dtype="boolean")
+    df["APERTYPE"] = rng.choice(["circle", None], len(df))
+
+    expected = _parse_table_to_madx_definitions(df, engine="rows")
+    assert _parse_table_to_madx_definitions(df, engine="vectorized") == expected
+    assert _parse_table_to_madx_definitions(df.iloc[:0]) == ""
+
+
+def test_madx_definitions_unknown_engine(table):
+    with pytest.raises(ValueError):
+        _parse_table_to_madx_definitions(table, engine="other")
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 10000])
+def test_madx_sequence_stream(table, chunksize):
+    expected = parse_table_to_madx_sequence_string("FODO", 10.0, table)
+
+    text = io.StringIO()
+    parse_table_to_madx_sequence_stream("FODO", 10.0, table, text, chunksize=chunksize)
+    assert text.getvalue() == expected
+
+    data = io.BytesIO()
+    with gzip.GzipFile(fileobj=data, mode="wb") as f:
+        parse_table_to_madx_sequence_stream("FODO", 10.0, table, f, chunksize=chunksize)
+    assert gzip.decompress(data.getvalue()).decode() == expected
+
+
+def test_madx_sequence_file_roundtrip(table, tmp_path):
+    filename = tmp_path / "fodo.seq"
+    parse_table_to_madx_sequence_file("FODO", 10.0, table, str(filename))
+
+    name, length, df = parse_from_madx_sequence_string(filename.read_text(), cache=False)
+    assert (name, length) == ("FODO", 10.0)
+    assert df["name"].to_list() == table["name"].to_list()
+
+
+def test_elegant_stream(table):
+    markers = table[table["family"] == "MARKER"]
+    stream = io.StringIO()
+    parse_table_to_elegant_stream("FODO", markers, stream, chunksize=1)
+    assert stream.getvalue() == parse_table_to_elegant_string("FODO", markers)
+    assert stream.getvalue().endswith("\n\nFODO: LINE=(M1)")
+
+
+def test_write_chunks_buffers_writes():
+    class Stream(io.StringIO):
+        writes = 0
+
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    stream = Stream()
+    write_chunks(("x" * 10 for _ in range(100)), stream, buffersize=250)
+    assert stream.getvalue() == "x" * 1000
+    assert stream.writes == 4
+
+
+def test_madx_install_and_remove_str(table):
+    install = parse_table_to_madx_install_str("FODO", table.iloc[:2])
+    assert install == (
+        "USE, SEQUENCE=FODO;\nSEQEDIT, SEQUENCE = FODO;  \nFLATTEN;\n"
+        "INSTALL, ELEMENT = QF              , AT =     0.250000;\n"
+        "INSTALL, ELEMENT = M1              , AT =     1.000000;\n"
+        "FLATTEN;\nENDEDIT;"
+    )
+
+    remove = parse_table_to_madx_remove_str("FODO", table.iloc[:1])
+    assert remove == (
+        "USE, SEQUENCE=FODO;\nSEQEDIT, SEQUENCE = FODO;  \nFLATTEN;\n"
+        "REMOVE, ELEMENT = QF              ;\nFLATTEN;\nENDEDIT;"
+    )
+
+
+def test_madx_positions_from_arrays(table):
+    names = table["name"].to_numpy(dtype=str)
+    at = table["at"].to_numpy()
+    records = np.rec.fromarrays([names, at], names=["name", "at"])
+
+    expected = parse_table_to_madx_install_str("FODO", table)
+    assert parse_table_to_madx_install_str("FODO", {"name": names, "at": at}) == expected
+    assert parse_table_to_madx_install_str("FODO", records) == expected
+    assert parse_table_to_madx_remove_str("FODO", {"name": list(names)}) == (
+        parse_table_to_madx_remove_str("FODO", table)
+    )
+    assert format_madx_positions("{:11}, at = {:12.6f};\n", records) == (
+        _parse_table_to_madx_sequence_part("FODO", 10.0, table)[
+            len("FODO: SEQUENCE, L=10.0;\n") : -len("ENDSEQUENCE;")
+        ]
+    )
+
+
+def test_tracy_string(table):
+    text = parse_table_to_tracy_string("FODO", table)
+    definitions, rest = text.split("\n\n\n")
+
+    assert definitions.splitlines() == [
+        "QF: Quadrupole, L = 0.500000, K = 1.200000, N = Nquad, Method = 4;",
+        "M1: Marker;",
+        "B1: Bending, L = 1.000000, T = 5.729577951308233, T1 = 2.864788975654116, "
+        "T2 = 2.864788975654116, N = Nbend, Method = 4;",
+        "QD: Quadrupole, L = 0.500000, K = -1.200000, N = Nquad, Method = 4;",
+        "C1: Cavity, L = 0.300000, Frequency = 0.000000000000000, "
+        "Voltage = 1500000.000000000000000, phi = 0.000000000000000;",
+    ]
+    assert rest.split("\n\n") == [
+        "FODO: QF, M1, B1, QD, QF, C1;",
+        "ring: FODO;",
+        "cell: ring, symmetry = 1;",
+        "end;",
+    ]
+
+
+def test_tracy_lattice_line():
+    names = np.array(["E{}".format(i) for i in range(23)], dtype=object)
+    lattice = "".join(_iter_tracy_lattice("RING", names, chunksize=5))
+
+    assert lattice.split("\n") == [
+        "RING: ",
+        " E0, E1, E2, E3, E4, E5, E6, E7, E8, E9, ",
+        " E10, E11, E12, E13, E14, E15, E16, E17, E18, E19, E20, ",
+        " E21, E22;",
+    ]
+
+
+def test_tracy_stream(table):
+    stream = io.BytesIO()
+    parse_table_to_tracy_stream("FODO", table, stream, chunksize=2)
+    assert stream.getvalue().decode() == parse_table_to_tracy_string("FODO", table)
+
+
+def test_elegant_engines_identical(table):
+    rng = np.random.default_rng(0)
+    df = pd.concat([table] * 20, ignore_index=True)
+    df["name"] = ["E{}".format(i) for i in range(len(df))]
+    df.loc[rng.random(len(df)) < 0.3, "L"] = np.nan
+    df["TILT"] = rng.choice([0.1, np.nan], len(df))
+    df["CALIB"] = rng.choice(["low", 1.0, None], len(df))
+
+    expected = parse_table_to_elegant_string("FODO", df, engine="rows")
+    assert parse_table_to_elegant_string("FODO", df) == expected
+    assert "QUADRUPOLE" not in expected
+
+
+def test_elegant_formatters_cached(table):
+    parse_table_to_elegant_string("FODO", table)
+    hits = _elegant_formatter.cache_info().hits
+    parse_table_to_elegant_string("FODO", table)
+    assert _elegant_formatter.cache_info().hits == hits + table["family"].nunique()
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_export_table(table, tmp_path, processes):
+    report = export_table("FODO", 10.0, table, directory=str(tmp_path), processes=processes)
+
+    assert set(report) == {"normalize", "madx", "elegant", "tracy", "total"}
+    assert (tmp_path / "FODO.seq").read_text() == parse_table_to_madx_sequence_string(
+        "FODO", 10.0, table
+    )
+    assert (tmp_path / "FODO.lte").read_text() == parse_table_to_elegant_string("FODO", table)
+    assert (tmp_path / "FODO.lat").read_text() == parse_table_to_tracy_string("FODO", table)
+    assert report["madx"]["filename"] == str(tmp_path / "FODO.seq")
+    assert all(value["time"] >= 0 for value in report.values())
+
+
+def test_export_table_unknown_format(table, tmp_path):
+    with pytest.raises(ValueError):
+        export_table("FODO", 10.0, table, formats=["madx", "other"], directory=str(tmp_path))